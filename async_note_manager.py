@@ -0,0 +1,134 @@
+"""Runs note_manager calls on a worker thread, off the UI thread
+
+Every function here takes the same arguments as its note_manager namesake,
+plus optional callback and errback keywords, and returns a Future. Calls
+run one at a time in the order they were made, so a read always sees the
+writes requested before it.
+
+Callbacks are passed the result, errbacks the exception. Both are run
+through the dispatcher, which the app points at its UI thread:
+
+    async_note_manager.set_dispatcher(
+        lambda func: Clock.schedule_once(lambda dt: func()))
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+
+import note_manager
+
+_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='note_worker')
+# Runs callbacks, on the worker thread until set_dispatcher() is called
+_dispatch = None
+
+
+def set_dispatcher(dispatch):
+    """Sets how callbacks are delivered.
+
+    Args:
+        dispatch: Called with a no argument function, to run it on the
+            thread the callbacks should run on."""
+
+    global _dispatch
+    _dispatch = dispatch
+
+
+def _log_error(error):
+    """Default errback"""
+
+    logging.getLogger(__name__).error("note_manager call failed",
+                                      exc_info=error)
+
+
+def _deliver(future, callback, errback):
+    """Passes a finished call's result or exception on"""
+
+    error = future.exception()
+
+    if error is not None:
+        (errback or _log_error)(error)
+
+    elif callback is not None:
+        callback(future.result())
+
+
+def then(future, callback=None, errback=None):
+    """Delivers a Future's result to callback (or its exception to
+    errback) through the dispatcher, once it finishes.
+
+    Args:
+        future: A Future returned by any function here.
+        callback: Called with the result.
+        errback: Called with the exception, by default it is logged."""
+
+    def done(finished):
+        if _dispatch is None:
+            _deliver(finished, callback, errback)
+        else:
+            _dispatch(lambda: _deliver(finished, callback, errback))
+
+    future.add_done_callback(done)
+
+
+def submit(func, *args, callback=None, errback=None, **kwargs):
+    """Runs func(*args, **kwargs) on the worker thread.
+
+    Args:
+        func: Usually a note_manager function, or a function calling
+            several of them that should run back to back.
+        callback: Called with the result once func returns.
+        errback: Called with the exception if func raises, by default
+            it is logged.
+
+    Returns:
+        A concurrent.futures.Future of the result."""
+
+    future = _worker.submit(func, *args, **kwargs)
+    then(future, callback, errback)
+
+    return future
+
+
+def shutdown():
+    """Waits for every queued call to finish, call before closing the
+    database connections on exit."""
+
+    _worker.shutdown(wait=True)
+
+
+def _async(func):
+    """Wraps a note_manager function to run through submit()"""
+
+    @functools.wraps(func)
+    def wrapper(*args, callback=None, errback=None, **kwargs):
+        return submit(func, *args, callback=callback, errback=errback,
+                      **kwargs)
+
+    return wrapper
+
+
+new_obj = _async(note_manager.new_obj)
+new_objs = _async(note_manager.new_objs)
+update_obj = _async(note_manager.update_obj)
+update_objs = _async(note_manager.update_objs)
+get_row = _async(note_manager.get_row)
+get_children = _async(note_manager.get_children)
+load = _async(note_manager.load)
+get_metadata = _async(note_manager.get_metadata)
+get_children_metadata = _async(note_manager.get_children_metadata)
+get_children_page = _async(note_manager.get_children_page)
+load_metadata = _async(note_manager.load_metadata)
+get_body = _async(note_manager.get_body)
+chunk_body = _async(note_manager.chunk_body)
+get_chunks = _async(note_manager.get_chunks)
+update_chunks = _async(note_manager.update_chunks)
+get_subtree = _async(note_manager.get_subtree)
+get_path = _async(note_manager.get_path)
+get_subtree_stats = _async(note_manager.get_subtree_stats)
+get_revisions = _async(note_manager.get_revisions)
+get_revision = _async(note_manager.get_revision)
+prune_revisions = _async(note_manager.prune_revisions)
+search = _async(note_manager.search)
+delete = _async(note_manager.delete)
+remove_orphans = _async(note_manager.remove_orphans)
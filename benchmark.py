@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""Benchmarks for note_manager, run against a throwaway database.
+
+Usage:
+
+    python3 Note/benchmark.py BENCHMARK [-n OPS] [--db PATH]
+
+Run with --help for the list of benchmarks. --db :memory: runs them on
+in-memory databases, leaving the disk out of the timings.
+
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import connection_manager
+
+
+def timed(func, ops):
+    """Runs func ops times.
+
+    Returns:
+        The achieved operations per second."""
+
+    start = time.perf_counter()
+
+    for i in range(ops):
+        func(i)
+
+    return ops / (time.perf_counter() - start)
+
+
+def report(name, results):
+    """Prints one line per result, plus the speedup over the first one"""
+
+    print(name)
+    baseline = results[0][1]
+
+    for label, ops_per_sec in results:
+        print(f"    {label:<28}{ops_per_sec:>12,.0f} ops/sec"
+              f"{ops_per_sec / baseline:>8.1f}x")
+
+
+def bench_connections(ops):
+    """Compares opening a connection per call against the shared pool."""
+
+    import note_manager
+
+    path = connection_manager.DB_PATH
+    note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+    note_id = note_manager.load()[-1][0]
+
+    def connect_per_call_read(i):
+        # What every note_manager function used to do
+        conn = sqlite3.connect(path, uri=path.startswith("file:"))
+        conn.execute(f"SELECT * FROM note_objs WHERE id = {note_id}")
+        conn.close()
+
+    def connect_per_call_write(i):
+        conn = sqlite3.connect(path, uri=path.startswith("file:"))
+        with conn:
+            conn.execute(f"UPDATE note_bodies SET data = 'body {i}' "
+                         f"WHERE id = {note_id}")
+        conn.close()
+
+    report("get_row", [
+        ("connect per call", timed(connect_per_call_read, ops)),
+        ("shared connection", timed(
+            lambda i: note_manager.get_row(note_id), ops))])
+
+    report("update_obj", [
+        ("connect per call", timed(connect_per_call_write, ops)),
+        ("shared connection", timed(
+            lambda i: note_manager.update_obj(note_id, data=f"body {i}"),
+            ops))])
+
+
+def bench_queries(ops):
+    """Compares f-string SQL against parameterized and executemany writes."""
+
+    import note_manager
+
+    conn = connection_manager.get_connection()
+    parent_id = note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+
+    def fstring_insert(i):
+        # What new_obj used to do, minus the per call connection
+        with conn:
+            c = conn.execute(f"INSERT INTO note_objs("
+                             f"name, last_modified, parent_id) VALUES ("
+                             f"'note {i}', {i}, '{parent_id}');")
+            conn.execute(f"INSERT INTO note_bodies(id, data) VALUES ("
+                         f"{c.lastrowid}, 'body {i}')")
+
+    def fstring_update(i):
+        with conn:
+            conn.execute(f"UPDATE note_bodies SET data = 'edit {i}' "
+                         f"WHERE id = '{ids[i]}'")
+            conn.execute(f"UPDATE note_objs SET last_modified = {i} "
+                         f"WHERE id = '{ids[i]}'")
+
+    def bulk(func, rows):
+        start = time.perf_counter()
+        func(rows)
+        return ops / (time.perf_counter() - start)
+
+    def note_ids():
+        return [row[0] for row in note_manager.get_children(parent_id)][-ops:]
+
+    inserts = [("f-string", timed(fstring_insert, ops)),
+               ("parameterized", timed(lambda i: note_manager.new_obj(
+                   f"note {i}", f"body {i}", parent_id), ops)),
+               ("executemany", bulk(note_manager.new_objs, (
+                   (f"note {i}", f"body {i}", parent_id)
+                   for i in range(ops))))]
+    report(f"insert {ops:,} notes", inserts)
+
+    ids = note_ids()
+    updates = [("f-string", timed(fstring_update, ops)),
+               ("parameterized", timed(lambda i: note_manager.update_obj(
+                   ids[i], data=f"edit {i}"), ops)),
+               ("executemany", bulk(
+                   lambda rows: note_manager.update_objs(("data",), rows),
+                   ((ids[i], f"edit {i}") for i in range(ops))))]
+    report(f"update {ops:,} notes", updates)
+
+
+def bench_bodies(ops):
+    """Lists a notebook of ops 100 KB notes with and without bodies."""
+
+    import note_manager
+
+    parent_id = note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+    note_manager.new_objs((f"note {i}", "x" * 100 * 1024, parent_id)
+                          for i in range(ops))
+
+    print(f"list a notebook of {ops:,} notes, 100 KB each")
+
+    for label, listing in (("get_children", note_manager.get_children),
+                           ("get_children_metadata",
+                            note_manager.get_children_metadata)):
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        listing(parent_id)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print(f"    {label:<28}{elapsed * 1000:>10,.1f} ms"
+              f"{peak / 2 ** 20:>10,.1f} MB peak")
+
+
+def bench_delete(ops):
+    """Deletes a notebook with ops descendants, 100 notes per sub notebook."""
+
+    import note_manager
+
+    notebook_id = note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+    subs = max(ops // 100, 1)
+    note_manager.new_objs(((f"sub {i}", "Notebook", notebook_id)
+                           for i in range(subs)), notebook=True)
+    note_manager.new_objs((f"note {i}", f"body {i}", sub[0])
+                          for sub in note_manager.get_children_metadata(
+                              notebook_id)
+                          for i in range(ops // subs - 1))
+
+    start = time.perf_counter()
+    note_manager.delete(notebook_id)
+    elapsed = time.perf_counter() - start
+
+    print(f"delete a notebook with {ops:,} descendants")
+    print(f"    {'delete':<28}{elapsed * 1000:>10,.1f} ms")
+
+
+def bench_search(ops):
+    """Times full text searches over ops notes of random words."""
+
+    import random
+
+    import note_manager
+
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    parent_id = note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+    note_manager.new_objs((f"note {i}", " ".join(rng.choices(words, k=200)),
+                           parent_id) for i in range(ops))
+
+    print(f"search {ops:,} notes")
+
+    for query in ("word42", "word42 word4242", "word4242*"):
+
+        start = time.perf_counter()
+        results = note_manager.search(query)
+        elapsed = time.perf_counter() - start
+
+        print(f"    {query!r:<28}{elapsed * 1000:>10,.1f} ms"
+              f"{len(results):>6} results")
+
+
+def bench_async(ops):
+    """Times how long the calling (UI) thread is blocked per update while
+    another connection holds the write lock, sync against async."""
+
+    import threading
+
+    import async_note_manager
+    import note_manager
+
+    note_id = note_manager.new_obj("Bench", "Notebook", 0, notebook=True)
+    hold = 0.05  # Seconds the other writer keeps the lock each time
+
+    def locked(func):
+        """Runs func while another connection holds the write lock"""
+
+        conn = sqlite3.connect(connection_manager.DB_PATH,
+                               check_same_thread=False)
+        conn.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(hold, conn.rollback)
+        release.start()
+
+        start = time.perf_counter()
+        func()
+        blocked = time.perf_counter() - start
+
+        release.join()
+        conn.close()
+
+        return blocked
+
+    rounds = max(1, min(ops, 20))
+    results = [
+        ("update_obj", [locked(lambda: note_manager.update_obj(
+            note_id, name="sync")) for _ in range(rounds)]),
+        ("async update_obj", [locked(lambda: async_note_manager.update_obj(
+            note_id, name="async")) for _ in range(rounds)])]
+    async_note_manager.shutdown()
+
+    print(f"blocked per update, writer holding the lock {hold * 1000:.0f} ms")
+
+    for label, times in results:
+        print(f"    {label:<28}{max(times) * 1000:>10,.2f} ms max"
+              f"{sum(times) / len(times) * 1000:>10,.2f} ms mean")
+
+
+def bench_compression(ops):
+    """Times get_row on databases of ops // 10 and ops 16 KB notes, with
+    bodies stored plain, zlib and lzma compressed."""
+
+    import random
+
+    import compression
+    import note_manager
+    import query_manager
+
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    directory = os.path.dirname(connection_manager.DB_PATH)
+    memory = connection_manager.DB_PATH.startswith("file:")
+
+    print("get_row latency, 16 KB notes")
+
+    for count in (ops // 10, ops):
+
+        for codec in (None, "zlib", "lzma"):
+
+            path = (connection_manager.memory_path(f"{codec}-{count}")
+                    if memory else
+                    os.path.join(directory, f"{codec}-{count}.db"))
+            connection_manager.configure(path=path)
+            compression.configure(codec=codec)
+            note_manager.init_db()
+
+            note_manager.new_objs((f"note {i}", " ".join(
+                rng.choices(words, k=2000))[:16384], 0) for i in range(count))
+            connection_manager.get_connection().execute(
+                "PRAGMA wal_checkpoint(TRUNCATE)")
+            body_bytes = query_manager.execute(
+                query_manager.SELECT_BODIES_SIZE).fetchone()[0]
+            # The file's size once checkpointed, a database in memory too
+            page_size, pages, _ = query_manager.execute(
+                query_manager.SELECT_PAGE_STATS).fetchone()
+
+            ids = [rng.randint(2, count + 1) for _ in range(1000)]
+            start = time.perf_counter()
+
+            for obj_id in ids:
+                note_manager.get_row(obj_id)
+
+            latency = (time.perf_counter() - start) / len(ids)
+
+            print(f"    {count:>7,} notes {str(codec):<6}"
+                  f"{latency * 1e6:>10,.0f} us"
+                  f"{body_bytes / 2 ** 20:>10,.1f} MB bodies"
+                  f"{page_size * pages / 2 ** 20:>10,.1f} MB file")
+
+    compression.configure(codec="zlib")
+
+
+BENCHMARKS = {"async": bench_async,
+              "bodies": bench_bodies,
+              "compression": bench_compression,
+              "connections": bench_connections,
+              "delete": bench_delete,
+              "queries": bench_queries,
+              "search": bench_search}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("-n", "--ops", type=int, default=2000,
+                        help="operations per measurement")
+    parser.add_argument("--db",
+                        help="the database, defaults to a throwaway file, "
+                             ":memory: for one in memory")
+    args = parser.parse_args()
+
+    if args.benchmark == "async" and args.db == connection_manager.MEMORY:
+        # Shared cache databases fail on a lock rather than waiting for it
+        parser.error("the async benchmark times waiting on a file's lock, "
+                     "it needs a database file")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        connection_manager.configure(
+            path=args.db or os.path.join(tmp_dir, "notes.db"))
+
+        import note_manager
+
+        note_manager.init_db()
+
+        try:
+            BENCHMARKS[args.benchmark](args.ops)
+        finally:
+            connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Benchmark suite, times note_manager and screen population on synthetic
+databases and writes the results as JSON, to compare releases.
+
+Usage:
+
+    python3 Note/benchmark_suite.py [--sizes N ...] [--backends NAME ...]
+                                    [--output FILE] [--no-widgets]
+
+Each size is a fresh store of that many notes, for each storage backend,
+generated from a fixed seed: notebooks nested up to 5 deep, bodies mostly
+under 2 KB with a tail up to 64 KB. The screens are built headless
+(offscreen window, mock GL), so widget timings leave out rendering. If
+they can't be built on the installed Kivy, the screens are skipped and
+widgets_skipped in the results says why.
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+SEED = 0
+NOTES_PER_NOTEBOOK = 50
+MAX_DEPTH = 5
+# (probability, smallest, largest) body sizes in bytes
+BODY_SIZES = ((0.89, 100, 2048),
+              (0.10, 2048, 16384),
+              (0.01, 16384, 65536))
+
+
+def body(rng, words):
+    """Returns a body of random words, its size drawn from BODY_SIZES"""
+
+    pick = rng.random()
+
+    for probability, smallest, largest in BODY_SIZES:
+
+        if pick < probability:
+            break
+
+        pick -= probability
+
+    size = rng.randint(smallest, largest)
+
+    return " ".join(rng.choices(words, k=size // 6 + 1))[:size]
+
+
+def generate(count, rng):
+    """Fills the configured database with count notes.
+
+    Returns:
+        The ids of the notebooks created, top level ones first."""
+
+    import note_manager
+
+    words = [f"word{i}" for i in range(5000)]
+    notebooks = []
+    depths = {0: 0}
+
+    for i in range(max(1, count // NOTES_PER_NOTEBOOK)):
+
+        # A tenth of the notebooks (at least the first) are top level
+        parent_id = 0
+
+        if notebooks and rng.random() > 0.1:
+            parent_id = rng.choice(notebooks)
+
+            if depths[parent_id] >= MAX_DEPTH:
+                parent_id = 0
+
+        notebook_id = note_manager.new_obj(f"notebook {i}", "Notebook",
+                                           parent_id, notebook=True)
+        depths[notebook_id] = depths[parent_id] + 1
+        notebooks.append(notebook_id)
+
+    note_manager.new_objs((f"note {i}", body(rng, words),
+                           rng.choice(notebooks)) for i in range(count))
+
+    return notebooks
+
+
+def measure(func, args):
+    """Calls func once per argument.
+
+    Returns:
+        Timing stats in milliseconds."""
+
+    times = []
+
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {"ops": len(times),
+            "mean_ms": statistics.mean(times),
+            "median_ms": statistics.median(times),
+            "max_ms": max(times)}
+
+
+def location(backend, directory, name):
+    """Returns where a backend keeps a store called name"""
+
+    if backend == "sqlite":
+        return os.path.join(directory, f"{name}.db")
+
+    if backend == "files":
+        return os.path.join(directory, name)
+
+    return f"{os.path.basename(directory)}-{name}"  # In memory
+
+
+def store_bytes(path):
+    """Returns the size of a database file or a directory of note files"""
+
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+
+    return os.path.getsize(path)
+
+
+def bench_note_manager(backend, directory, count, rng):
+    """Times every note_manager operation on a store of count notes"""
+
+    import note_manager
+
+    results = {}
+
+    note_manager.configure(backend, location(backend, directory, "new"))
+    results["init_db (new)"] = measure(lambda _: note_manager.init_db(), [0])
+    note_manager.close()  # configure() would leave it open
+
+    path = location(backend, directory, str(count))
+    note_manager.configure(backend, path)
+    note_manager.init_db()
+
+    start = time.perf_counter()
+    notebooks = generate(count, rng)
+    results["generate_s"] = time.perf_counter() - start
+
+    # An in-memory database is gone once closed, so it can't be reopened
+    if backend != "memory":
+        results["db_bytes"] = store_bytes(path)
+
+    def reopen(_):
+        note_manager.close()
+        note_manager.init_db()
+
+    note_ids = [row[0] for row in note_manager.load_metadata()
+                if not row[5]]
+
+    if backend != "memory":
+        results["init_db"] = measure(reopen, range(10))
+
+    results["new_obj"] = measure(
+        lambda parent_id: note_manager.new_obj("new", "new body", parent_id),
+        rng.choices(notebooks, k=200))
+    results["update_obj"] = measure(
+        lambda note_id: note_manager.update_obj(
+            note_id, data=note_manager.get_body(note_id) + " edit"),
+        rng.sample(note_ids, min(200, len(note_ids))))
+    results["get_row"] = measure(note_manager.get_row,
+                                 rng.choices(note_ids, k=1000))
+    results["get_children"] = measure(note_manager.get_children,
+                                      rng.choices(notebooks, k=200))
+    results["get_children_metadata"] = measure(
+        note_manager.get_children_metadata, rng.choices(notebooks, k=200))
+    results["load"] = measure(lambda _: note_manager.load(), range(3))
+    results["load_metadata"] = measure(lambda _: note_manager.load_metadata(),
+                                       range(3))
+    results["delete"] = measure(note_manager.delete,
+                                rng.sample(note_ids, min(200, len(note_ids))))
+
+    # Small stores may have no notebook besides the first
+    if len(notebooks) > 1:
+        results["delete (notebook)"] = measure(
+            note_manager.delete,
+            rng.sample(notebooks[1:], min(5, len(notebooks) - 1)))
+
+    return results
+
+
+def bench_widgets(main):
+    """Times populating the menu from the cache and the fullest notebook
+    from its first page, including the frame that lays their rows out"""
+
+    import note_manager
+
+    from kivy.clock import Clock
+
+    # Screens are built when first asked for. Let the menu's own first
+    # load, queued as it's shown, land now instead of replacing the cache
+    # during a measurement
+    menu = main.sm.get_screen("menu")
+    notebook_screen = main.sm.get_screen("notebook")
+    main.async_note_manager.submit(lambda: None).result()
+    Clock.tick()
+
+    results = {}
+    rows = note_manager.load_metadata()
+
+    def fill_cache(_):
+        main.app_variables.notes.load(rows)
+        main.app_variables.notes_loaded = True
+
+    results["cache load"] = measure(fill_cache, range(3))
+
+    def menu_load(_):
+        menu.load()
+        Clock.tick()
+
+    fullest = max((row for row in rows if row[5]),
+                  key=lambda row: len(main.app_variables.notes.children(
+                      row[0])))
+
+    def update_widgets(notebook_id):
+        main.app_variables.active_notebook = notebook_id
+        notebook_screen.update_widgets()
+        # The first page is read on the worker, shown by the next frame
+        main.async_note_manager.submit(lambda: None).result()
+        Clock.tick()
+
+    results["MenuScreen.load"] = measure(menu_load, range(20))
+    # Alternate with the root so every call swaps the whole list
+    results["NotebookScreen.update_widgets"] = measure(
+        update_widgets, [fullest[0], 1] * 10)
+    results["notebook rows"] = len(main.app_variables.notes.children(
+        fullest[0]))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="notes per synthetic database")
+    parser.add_argument("--backends", nargs="+", default=["sqlite"],
+                        choices=("sqlite", "memory", "files"),
+                        help="storage backends to compare")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--no-widgets", action="store_true",
+                        help="skip the screens, which need Kivy")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version,
+              "platform": platform.platform(),
+              "seed": SEED,
+              "backends": {}}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        # Not the user's settings.ini
+        os.environ["NOTE_SETTINGS"] = os.path.join(tmp_dir, "settings.ini")
+
+        import note_manager
+
+        app = None
+
+        if not args.no_widgets:
+            os.environ.setdefault("KIVY_NO_ARGS", "1")
+            os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+            os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+            # Uncapped, so Clock.tick() doesn't sleep until the next frame
+            os.environ.setdefault("KCFG_GRAPHICS_MAXFPS", "0")
+
+            import main as app
+
+            report["version"] = app.__version__
+
+        try:
+            for backend, count in itertools.product(args.backends,
+                                                    args.sizes):
+
+                print(f"{backend}, {count:,} notes", file=sys.stderr)
+                directory = os.path.join(tmp_dir, f"{backend}-{count}")
+                os.mkdir(directory)
+                rng = random.Random(SEED)
+
+                results = bench_note_manager(backend, directory, count, rng)
+
+                if app is not None and "widgets_skipped" not in report:
+
+                    try:
+                        results.update(bench_widgets(app))
+
+                    except TypeError as error:
+                        # Kivy 2 rejects widget keywords 1.x accepted,
+                        # such as id=, so the screens can't be built
+                        import kivy
+
+                        reason = str(error).split(". ")[0]
+                        report["widgets_skipped"] = reason
+                        print(f"    screens skipped, they can't be built on "
+                              f"Kivy {kivy.__version__}: {reason}",
+                              file=sys.stderr)
+
+                report["backends"].setdefault(backend, {})[count] = results
+                # An in-memory store keeps its notes until closed
+                note_manager.close()
+
+                for name, stats in results.items():
+
+                    if isinstance(stats, dict):
+                        print(f"    {name:<32}{stats['mean_ms']:>10,.2f} ms "
+                              f"mean{stats['median_ms']:>10,.2f} ms median",
+                              file=sys.stderr)
+
+        finally:
+            if app is not None:
+                app.async_note_manager.shutdown()
+
+            note_manager.close_all()
+
+    with open(output, "w") as results_file:
+        json.dump(report, results_file, indent=2)
+
+    print(f"results written to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Large note bodies stored in chunks
+
+Bodies at least THRESHOLD bytes long are split into chunks of about SIZE
+bytes, stored in note_chunks with "chunks" in note_bodies.codec. The
+editor shows one chunk at a time and saving writes back only the chunks
+that were edited, so editing a note costs the size of the edit, not the
+size of the note.
+
+Chunks end at a line break where there is one, so a chunk is whole lines
+unless a single line is longer than SIZE. An edited chunk is stored as it
+is, however much it grew or shrank, the body is only split again when all
+of it is written at once.
+"""
+
+CODEC = "chunks"  # note_bodies.codec of a chunked body
+
+THRESHOLD = 128 * 1024  # Bytes, smaller bodies are one TextInput's worth
+SIZE = 16 * 1024  # Bytes per chunk, about a few screens of text
+
+
+def configure(threshold=None, size=None):
+    """Sets when bodies are chunked and into how big chunks, bodies
+    already stored keep their chunks until rewritten.
+
+    Args:
+        threshold: The smallest body size in bytes to chunk.
+        size: The size of chunks in bytes."""
+
+    global THRESHOLD, SIZE
+
+    if threshold is not None:
+        THRESHOLD = threshold
+
+    if size is not None:
+        SIZE = size
+
+
+def needed(data, size=None):
+    """Returns True if a body is big enough to be chunked, size is its
+    size in bytes if known"""
+
+    if not isinstance(data, str):  # Bodies from the oldest databases
+        return False
+
+    if size is None:
+        # A character is at most 4 bytes, only encode when it could matter
+        if len(data) * 4 < THRESHOLD:
+            return False
+
+        size = len(data.encode())
+
+    return size >= THRESHOLD
+
+
+def split(data):
+    """Splits a body into chunks of about SIZE bytes, joined back by
+    "".join()"""
+
+    # Characters rather than bytes, SIZE is a target not a limit
+    parts = []
+    start = 0
+
+    while start < len(data):
+        end = start + SIZE
+
+        if end < len(data):
+            newline = data.rfind("\n", start, end)
+
+            if newline != -1:
+                end = newline + 1
+
+        parts.append(data[start:end])
+        start = end
+
+    return parts
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Recompresses the note bodies already in a database.
+
+Usage:
+
+    python3 Note/compact.py [--db PATH] [--vacuum] [--codec CODEC]
+                            [--cold-codec CODEC] [--cold-days DAYS]
+                            [--threshold BYTES]
+
+Notes edited in the last --cold-days use --codec, older ones --cold-codec,
+bodies under --threshold bytes stay plain. With --vacuum the database file
+is rebuilt afterwards so it actually shrinks.
+
+"""
+
+import argparse
+import os
+import sys
+
+import compression
+import connection_manager
+
+
+def codec_name(name):
+    """argparse type for codec names, none for plain text"""
+
+    if name == "none":
+        return None
+
+    if name not in compression.CODECS:
+        raise argparse.ArgumentTypeError(f"unknown codec {name}")
+
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db",
+                        help="the database, defaults to $NOTE_DB or notes.db")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="rebuild the file to return the freed space")
+    parser.add_argument("--codec", type=codec_name, default=compression.CODEC,
+                        help="codec for recent notes (zlib, lzma or none)")
+    parser.add_argument("--cold-codec", type=codec_name,
+                        default=compression.COLD_CODEC,
+                        help="codec for cold notes (zlib, lzma or none)")
+    parser.add_argument("--cold-days", type=float,
+                        default=compression.COLD_AGE / (24 * 60 * 60),
+                        help="days unedited before a note is cold")
+    parser.add_argument("--threshold", type=int,
+                        default=compression.THRESHOLD,
+                        help="smallest body in bytes to compress")
+    args = parser.parse_args()
+
+    connection_manager.configure(path=args.db)
+    compression.configure(threshold=args.threshold, codec=args.codec,
+                          cold_codec=args.cold_codec,
+                          cold_age=args.cold_days * 24 * 60 * 60)
+
+    import note_manager
+
+    note_manager.init_db()
+    path = connection_manager.DB_PATH
+
+    try:
+        file_before = os.path.getsize(path)
+        rewritten, before, after = note_manager.compact(
+            lambda count: print(f"\rchecked {count:,} bodies", end="",
+                                file=sys.stderr))
+        print(file=sys.stderr)
+
+        print(f"rewrote {rewritten:,} bodies, "
+              f"{before / 2 ** 20:,.1f} MB -> {after / 2 ** 20:,.1f} MB "
+              f"({before - after:,} bytes saved)")
+
+        if args.vacuum:
+            conn = connection_manager.get_connection()
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            print(f"file {file_before / 2 ** 20:,.1f} MB -> "
+                  f"{os.path.getsize(path) / 2 ** 20:,.1f} MB")
+
+    finally:
+        connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Transparent compression of note bodies
+
+Bodies at least THRESHOLD bytes long are stored compressed, with the
+codec's name in note_bodies.codec (NULL for plain text). Recent notes use
+CODEC, which is fast to read and write, and note_manager.compact() moves
+notes untouched for COLD_AGE seconds to the smaller, slower COLD_CODEC.
+"""
+
+import lzma
+import zlib
+
+# name -> (compress, decompress), names are stored in the database so
+# existing ones must not change
+CODECS = {"zlib": (zlib.compress, zlib.decompress),
+          "lzma": (lzma.compress, lzma.decompress)}
+
+THRESHOLD = 4096  # Bytes, smaller bodies don't shrink enough to bother
+CODEC = "zlib"  # None stores every body as plain text
+COLD_CODEC = "lzma"
+COLD_AGE = 90 * 24 * 60 * 60
+
+
+def configure(threshold=None, codec=False, cold_codec=False, cold_age=None):
+    """Sets how new and compacted bodies are stored, bodies already in the
+    database keep their codec until compacted.
+
+    Args:
+        threshold: The smallest body size in bytes to compress.
+        codec: The codec for new bodies, None to stop compressing.
+        cold_codec: The codec compact() uses for cold notes.
+        cold_age: Seconds since a note was modified before it's cold."""
+
+    global THRESHOLD, CODEC, COLD_CODEC, COLD_AGE
+
+    for name in (codec, cold_codec):
+
+        if name not in (False, None) and name not in CODECS:
+            raise ValueError(f"{name} is not a known codec.")
+
+    if threshold is not None:
+        THRESHOLD = threshold
+
+    if codec is not False:
+        CODEC = codec
+
+    if cold_codec is not False:
+        COLD_CODEC = cold_codec
+
+    if cold_age is not None:
+        COLD_AGE = cold_age
+
+
+def compress(data, codec=False):
+    """Compresses a body if it's big enough and shrinks.
+
+    Args:
+        data: The body, only text is compressed.
+        codec: The codec to use, defaults to CODEC.
+
+    Returns:
+        (stored data, codec name or None if stored as it is)."""
+
+    if codec is False:
+        codec = CODEC
+
+    if codec is None or not isinstance(data, str):
+        return data, None
+
+    raw = data.encode()
+
+    if len(raw) < THRESHOLD:
+        return data, None
+
+    packed = CODECS[codec][0](raw)
+
+    if len(packed) >= len(raw):
+        return data, None
+
+    return packed, codec
+
+
+def decompress(data, codec):
+    """Returns the body stored as data with the given codec"""
+
+    if codec is None:
+        return data
+
+    return CODECS[codec][1](data).decode()
@@ -0,0 +1,169 @@
+"""Keeps long-lived sqlite connections that note_manager shares
+"""
+
+import os
+import sqlite3
+import threading
+
+import instrumentation
+
+# sqlite's own :memory: is a new empty database for every connection, so
+# one per thread. Configured as the path it means one in-memory database
+# shared by every connection in the process instead, like MEMORY_URI
+MEMORY = ":memory:"
+# A named, shared cache in-memory database. It lasts until its last
+# connection is closed
+MEMORY_URI = "file:{name}?mode=memory&cache=shared"
+# The name MEMORY goes by, not the memory backend's default, so a profile
+# of each keeps its own notes
+MEMORY_NAME = "sqlite-memory"
+
+
+def memory_path(name="notes"):
+    """Returns the path of the shared in-memory database called name"""
+
+    return MEMORY_URI.format(name=name)
+
+
+def _location(path):
+    return memory_path(MEMORY_NAME) if path == MEMORY else path
+
+
+# The NOTE_DB environment variable, else notes.db in the working dir
+DB_PATH = _location(os.environ.get("NOTE_DB") or "notes.db")
+
+# Applied to every connection as it is opened, tune through configure()
+PRAGMAS = {"synchronous": "NORMAL",
+           "cache_size": -8000,  # Negative values are KiB, so ~8MB
+           "mmap_size": 64 * 1024 * 1024}
+
+# One connection per (thread, path), sqlite connections aren't thread safe
+_local = threading.local()
+# Every open (path, connection) across all threads, so close_all() can
+# reach them, and every thread's pool, so it can drop them from those too
+_open_connections = []
+_pools = []
+_lock = threading.Lock()
+# Bumped by close_all() so other threads drop their stale pools
+_generation = 0
+
+
+def configure(path=None, **pragmas):
+    """Sets the database path and/or pragma values used for new connections.
+
+    Args:
+        path: The database file, defaults to $NOTE_DB or notes.db in the
+            working dir. MEMORY for a database in memory.
+        pragmas: Pragma names and values, e.g. synchronous="FULL"."""
+
+    global DB_PATH
+
+    if path is not None:
+        DB_PATH = _location(path)
+
+    PRAGMAS.update(pragmas)
+
+
+def _pool():
+    """Returns this thread's path -> connection dict"""
+
+    if getattr(_local, "generation", None) != _generation:
+        _local.connections = {}
+        _local.generation = _generation
+
+        with _lock:
+            _pools.append(_local.connections)
+
+    return _local.connections
+
+
+def open_connection(path=None):
+    """Opens (or returns the already open) connection for this thread.
+
+    Args:
+        path: The database file, defaults to DB_PATH.
+
+    Returns:
+        conn: A sqlite3 connection in WAL mode with PRAGMAS applied."""
+
+    path = _location(path or DB_PATH)
+    pool = _pool()
+
+    if path in pool:
+        return pool[path]
+
+    # check_same_thread is off so close_all() can close from any thread,
+    # each connection is still only used by the thread that opened it.
+    # file: paths are URIs, used for in-memory databases
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                           cached_statements=256,
+                           uri=path.startswith("file:"))
+
+    conn.execute("PRAGMA journal_mode = WAL")
+
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+    if instrumentation.SQLITE:
+        conn.set_trace_callback(instrumentation.sqlite_trace)
+        conn.set_progress_handler(instrumentation.sqlite_progress,
+                                  instrumentation.PROGRESS_STEPS)
+
+    pool[path] = conn
+
+    with _lock:
+        _open_connections.append((path, conn))
+
+    return conn
+
+
+def get_connection(path=None):
+    """Returns this thread's connection, opening it on first use"""
+
+    return _pool().get(path or DB_PATH) or open_connection(path)
+
+
+def close(path=None):
+    """Closes this thread's connection to the given database"""
+
+    path = _location(path or DB_PATH)
+    conn = _pool().pop(path, None)
+
+    if conn is not None:
+
+        with _lock:
+            _open_connections.remove((path, conn))
+
+        conn.close()
+
+
+def close_all(path=None):
+    """Closes every connection opened by any thread, call on app exit.
+
+    Args:
+        path: Only close the connections to this database, those to
+            others stay open."""
+
+    global _generation
+
+    with _lock:
+
+        if path is None:
+
+            for _, conn in _open_connections:
+                conn.close()
+
+            _open_connections.clear()
+            _pools.clear()
+            _generation += 1
+            return
+
+        path = _location(path)
+
+        for pool in _pools:
+            pool.pop(path, None)
+
+        for entry in [entry for entry in _open_connections
+                      if entry[0] == path]:
+            entry[1].close()
+            _open_connections.remove(entry)
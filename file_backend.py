@@ -0,0 +1,807 @@
+"""One file per note storage backend for note_manager
+
+Each note is DIRECTORY/<id>.note, a line of JSON metadata followed by the
+body as it is, so listing notes never reads a body and huge ones stay out
+of any database. Every note's metadata is read into a NoteCache when the
+backend is opened, which answers listings and tree queries from memory.
+
+Files are replaced whole on every write, renaming a note included, and
+saving one chunk of a chunked body (see the chunks module) too, the
+chunks' lengths are kept in the metadata. There is no revision history,
+and search scans the bodies instead of using an index.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import re
+import threading
+
+import chunks
+from note_cache import NoteCache
+from note_manager import batches, body_size, check_name, now
+
+DIRECTORY = "notes"
+SUFFIX = ".note"
+
+# Word tokens for search, like the sqlite backend's FTS5 tokenizer
+_WORDS = re.compile(r"\w+")
+SNIPPET_TOKENS = 12
+
+_index = NoteCache()
+# The index and the files are shared by the app's threads
+_lock = threading.RLock()
+_last_id = 0
+# The directory the index was read from, None until init_db()
+_opened = None
+# Note files init_db() couldn't read, "path: error" for maintain() to report
+_damaged = []
+# What reading a damaged note file raises
+_READ_ERRORS = (OSError, ValueError, KeyError, TypeError)
+
+
+def configure(location=None):
+    """Points the backend at a directory.
+
+    Args:
+        location: The directory holding the note files, created if
+            missing. Defaults to DIRECTORY."""
+
+    global DIRECTORY
+
+    if location is not None:
+        DIRECTORY = location
+
+
+def _path(obj_id):
+    """Returns the file of a note"""
+
+    return os.path.join(DIRECTORY, f"{obj_id}{SUFFIX}")
+
+
+def _write(row, data, chunk_sizes=None):
+    """Writes a note's file, replacing any previous one in one step.
+
+    Args:
+        row: The note's metadata, in META_COLUMNS order.
+        data: Its body.
+        chunk_sizes: The length of each of the body's chunks, in
+            characters, if it's chunked."""
+
+    obj_id, name, modified, parent_id, size, notebook = row
+    header = {"name": name,
+              "last_modified": modified,
+              "parent_id": parent_id,
+              "size": size,
+              "is_notebook": notebook,
+              "body": (None if data is None else
+                       "bytes" if isinstance(data, bytes) else "text")}
+
+    if chunk_sizes is not None:
+        header["chunks"] = chunk_sizes
+
+    path = _path(obj_id)
+
+    with open(path + ".tmp", "wb") as note_file:
+        note_file.write(json.dumps(header).encode() + b"\n")
+
+        if data is not None:
+            note_file.write(data.encode() if isinstance(data, str) else data)
+
+    os.replace(path + ".tmp", path)
+
+
+def _read_header(note_file):
+    """Reads the metadata line at the start of an open note file"""
+
+    return json.loads(note_file.readline())
+
+
+def _read_metadata(obj_id):
+    """Returns a note's metadata row from its file, without the body"""
+
+    with open(_path(obj_id), "rb") as note_file:
+        header = _read_header(note_file)
+
+    return (obj_id, header["name"], header["last_modified"],
+            header["parent_id"], header["size"], header["is_notebook"])
+
+
+def _read_chunk_sizes(obj_id):
+    """Returns the lengths of a note's chunks, None if it isn't chunked"""
+
+    try:
+        with open(_path(obj_id), "rb") as note_file:
+            return _read_header(note_file).get("chunks")
+
+    except FileNotFoundError:  # Deleted since
+        return None
+
+
+def _read_body(obj_id):
+    """Returns a note's body from its file, None if it has none"""
+
+    try:
+        with open(_path(obj_id), "rb") as note_file:
+            kind = _read_header(note_file)["body"]
+            data = note_file.read()
+
+    except FileNotFoundError:  # Deleted since
+        return None
+
+    if kind is None:
+        return None
+
+    return data.decode() if kind == "text" else data
+
+
+def _full_row(row):
+    """Adds the body to a metadata row, giving a COLUMNS row"""
+
+    return (*row[:3], _read_body(row[0]), *row[3:])
+
+
+def init_db():
+    """Creates the directory and the root notebook if necessary, and reads
+    every note's metadata. Only the first call per directory does anything
+    until close(). Files that aren't notes or can't be read are left out,
+    and reported by maintain()."""
+
+    global _last_id, _opened
+
+    with _lock:
+
+        if _opened == DIRECTORY:
+            return
+
+        os.makedirs(DIRECTORY, exist_ok=True)
+        ids = []
+        rows = []
+        del _damaged[:]
+
+        for file_name in sorted(os.listdir(DIRECTORY)):
+
+            if not file_name.endswith(SUFFIX):
+                continue
+
+            stem = file_name[:-len(SUFFIX)]
+
+            if not stem.isdecimal():
+                _damaged.append(f"{os.path.join(DIRECTORY, file_name)}: "
+                                f"not named after a note id")
+                continue
+
+            # Damaged files keep their id, so no new note overwrites them
+            obj_id = int(stem)
+            ids.append(obj_id)
+
+            try:
+                rows.append(_read_metadata(obj_id))
+            except _READ_ERRORS as error:
+                _damaged.append(f"{_path(obj_id)}: {error}")
+
+        _index.load(sorted(rows))
+        _last_id = max(ids, default=0)
+
+        if not ids:
+            _insert("My Notes", "Notebook", None, now(), True)
+
+        _opened = DIRECTORY
+
+
+def close():
+    """Forgets the index, init_db() reads it again"""
+
+    global _last_id, _opened
+
+    with _lock:
+        _index.load(())
+        _last_id = 0
+        _opened = None
+        del _damaged[:]
+
+
+# The index holds one directory at a time, so there's no other to close
+close_all = close
+
+
+def _insert(name, data, parent_id, modified, notebook, obj_id=None):
+    """Writes a new note and indexes it, returning its id"""
+
+    global _last_id
+
+    check_name(name)
+
+    if obj_id is None:
+        obj_id = _last_id + 1
+
+    _last_id = max(_last_id, obj_id)
+    row = (obj_id, name, modified, parent_id, body_size(data), int(notebook))
+    _write(row, data)
+    _index.insert(row)
+
+    return obj_id
+
+
+@contextmanager
+def transaction():
+    """Holds the backend's lock, so no other thread sees or makes changes
+    until the block ends. Every file is still written as it's changed,
+    there is nothing to roll back on an exception."""
+
+    with _lock:
+        yield
+
+
+def new_obj(name, data, parent_nb, modified=None, notebook=False):
+    """Writes a new note file.
+
+    Returns:
+        The id of the new note."""
+
+    with _lock:
+        return _insert(name, data, parent_nb,
+                       now() if modified is None else modified, notebook)
+
+
+def new_objs(objs, notebook=False):
+    """Writes a file per (name, data, parent_nb) tuple."""
+
+    modified = now()
+
+    with _lock:
+
+        for name, data, parent_nb in objs:
+            _insert(name, data, parent_nb, modified, notebook)
+
+
+def restore(objs, progress=None):
+    """Writes exported rows with new ids past the ones in use, merging an
+    exported root into this directory's root.
+
+    Returns:
+        The number of notes written."""
+
+    with _lock:
+        offset = _last_id
+        roots = _index.children(None)
+        root = roots[0][0] if roots else None
+
+    merged = {}  # Exported root id -> this directory's root id
+    count = 0
+
+    for batch in batches(objs):
+
+        with _lock:
+
+            for obj_id, name, modified, data, parent_id, notebook in batch:
+
+                if parent_id is None and root is not None:
+                    merged[obj_id] = root
+                    continue
+
+                if parent_id is None:  # Becomes the root
+                    root = obj_id + offset
+
+                elif parent_id in merged:
+                    parent_id = merged[parent_id]
+
+                elif parent_id != 0:
+                    parent_id += offset
+
+                _insert(name, data, parent_id, modified, notebook,
+                        obj_id + offset)
+                count += 1
+
+        if progress is not None:
+            progress(count)
+
+    return count
+
+
+def update_obj(obj_id, **kwargs):
+    """Rewrites a note's file with the given columns changed.
+
+    Returns:
+        The new last_modified value of the note."""
+
+    modified = now()
+
+    for column in kwargs:
+
+        if column not in ("name", "parent_id", "size", "data"):
+            raise ValueError(f"{column} is not an updatable column.")
+
+    with _lock:
+        row = _index.get(obj_id)
+
+        if row is None:
+            return modified
+
+        if "data" in kwargs:
+            data = kwargs.pop("data")
+            chunk_sizes = None  # Split again when next edited in chunks
+        else:
+            data = _read_body(obj_id)
+            chunk_sizes = _read_chunk_sizes(obj_id)
+
+        columns = dict(zip(("name", "last_modified", "parent_id", "size"),
+                           row[1:5]))
+        columns.update(kwargs, last_modified=modified, size=body_size(data))
+
+        if "name" in kwargs:
+            check_name(columns["name"])
+
+        row = (obj_id, columns["name"], modified, columns["parent_id"],
+               columns["size"], row[5])
+        _write(row, data, chunk_sizes)
+        _index.insert(row)
+
+    return modified
+
+
+def update_objs(columns, rows):
+    """Rewrites the file of every (obj_id, value, ...) row."""
+
+    with _lock:
+
+        for obj_id, *values in rows:
+            update_obj(obj_id, **dict(zip(columns, values)))
+
+
+def get_row(obj_id):
+    """Returns the note with the given id, body included."""
+
+    with _lock:
+        row = _index.get(obj_id)
+
+    return None if row is None else _full_row(row)
+
+
+def get_children(obj_id):
+    """Returns the children of a note, bodies included."""
+
+    with _lock:
+        rows = _index.children(obj_id)
+
+    return [_full_row(row) for row in rows]
+
+
+def load():
+    """Returns every note, bodies included."""
+
+    with _lock:
+        rows = list(_index)
+
+    return [_full_row(row) for row in rows]
+
+
+def get_metadata(obj_id):
+    """Returns the indexed metadata of a note."""
+
+    with _lock:
+        return _index.get(obj_id)
+
+
+def get_children_metadata(obj_id):
+    """Returns the indexed metadata of a note's children."""
+
+    with _lock:
+        return _index.children(obj_id)
+
+
+def get_children_page(obj_id, order, after, limit):
+    """Returns up to limit of a note's children in the given order,
+    sorted from the index."""
+
+    with _lock:
+        return _index.children_page(obj_id, order, after, limit)
+
+
+def load_metadata():
+    """Returns every note's indexed metadata."""
+
+    with _lock:
+        return list(_index)
+
+
+def get_body(obj_id):
+    """Reads a note's body from its file, None if missing."""
+
+    with _lock:
+
+        if obj_id not in _index:
+            return None
+
+    return _read_body(obj_id)
+
+
+def _split(obj_id):
+    """Returns a note's body split into the chunks its metadata lists,
+    no chunks if it isn't chunked"""
+
+    try:
+        with open(_path(obj_id), "rb") as note_file:
+            sizes = _read_header(note_file).get("chunks") or []
+            data = note_file.read().decode() if sizes else ""
+
+    except FileNotFoundError:  # Deleted since
+        return []
+
+    parts = []
+    start = 0
+
+    for size in sizes:
+        parts.append(data[start:start + size])
+        start += size
+
+    return parts
+
+
+def chunk_body(obj_id):
+    """Chunks a body big enough to chunk, if it isn't already, by noting
+    its chunks in the metadata.
+
+    Returns:
+        The number of chunks, 0 if the body is too small to chunk."""
+
+    with _lock:
+        row = _index.get(obj_id)
+
+        if row is None:
+            return 0
+
+        count = len(_split(obj_id))
+
+        if count:
+            return count
+
+        data = _read_body(obj_id)
+
+        if not chunks.needed(data, row[4]):
+            return 0
+
+        sizes = [len(chunk) for chunk in chunks.split(data)]
+        _write(row, data, sizes)
+
+        return len(sizes)
+
+
+def get_chunks(obj_id, start=0, count=1):
+    """Returns count chunks of a chunked body from chunk start on."""
+
+    with _lock:
+        return _split(obj_id)[start:start + count]
+
+
+def update_chunks(obj_id, edits):
+    """Replaces chunks of a chunked body, rewriting the file. A body
+    that isn't chunked is split the way chunk_body() would, or is one
+    chunk if too small to chunk.
+
+    Returns:
+        The new last_modified value of the note."""
+
+    modified = now()
+
+    with _lock:
+        row = _index.get(obj_id)
+
+        if row is None:
+            return modified
+
+        parts = _split(obj_id)
+
+        if not parts:
+            data = _read_body(obj_id) or ""
+            parts = (chunks.split(data) if chunks.needed(data, row[4])
+                     else [data])
+
+        for index, text in edits.items():
+
+            if not 0 <= index < len(parts):
+                raise ValueError(f"{obj_id} has no chunk {index}.")
+
+            parts[index] = text
+
+        data = "".join(parts)
+        row = (obj_id, row[1], modified, row[3], body_size(data), row[5])
+        _write(row, data, [len(part) for part in parts])
+        _index.insert(row)
+
+    return modified
+
+
+def _descendants(obj_id):
+    """Yields (row, depth) for everything below obj_id, depth first and
+    children in id order, like the sqlite backend"""
+
+    stack = [(row, 1) for row in sorted(_index.children(obj_id),
+                                        reverse=True)]
+    seen = {obj_id}
+
+    while stack:
+        row, depth = stack.pop()
+
+        if row[0] in seen:  # A parent_id loop
+            continue
+
+        seen.add(row[0])
+        yield row, depth
+        stack.extend((child, depth + 1) for child
+                     in sorted(_index.children(row[0]), reverse=True))
+
+
+def get_subtree(obj_id):
+    """Returns the note and everything below it with their depth, depth
+    first."""
+
+    with _lock:
+        row = _index.get(obj_id)
+
+        if row is None:
+            return []
+
+        return [(*row, 0)] + [(*child, depth) for child, depth
+                              in _descendants(obj_id)]
+
+
+def get_path(obj_id):
+    """Returns the note and its ancestors, outermost first."""
+
+    path = []
+
+    with _lock:
+        row = _index.get(obj_id)
+
+        while row is not None and row not in path:
+            path.append(row)
+            row = _index.get(row[3])
+
+    return path[::-1]
+
+
+def get_subtree_stats(obj_id):
+    """Returns (descendant count, total body bytes) below the note."""
+
+    count = size = 0
+
+    with _lock:
+
+        for row, _ in _descendants(obj_id):
+            count += 1
+            size += row[4]
+
+    return count, size
+
+
+def dump():
+    """Yields every note reachable from the top level with its depth,
+    reading each body as it's reached."""
+
+    rows = []
+
+    with _lock:
+
+        for root in sorted(_index.children(None) + _index.children(0)):
+            rows.append((root, 0))
+            rows.extend(_descendants(root[0]))
+
+    for row, depth in rows:
+        yield (*_full_row(row), depth)
+
+
+def get_revisions(obj_id):
+    """There is no history in this backend, returns no revisions."""
+
+    return []
+
+
+def get_revision(obj_id, revision):
+    """There is no history in this backend, returns None."""
+
+    return None
+
+
+def prune_revisions():
+    """There is no history in this backend, returns 0."""
+
+    return 0
+
+
+def _terms(query):
+    """Returns (lower case word, is prefix) for each word of a query"""
+
+    terms = []
+
+    for term in query.split():
+
+        word = term.rstrip("*").lower()
+
+        if word:
+            terms.append((word, term.endswith("*")))
+
+    return terms
+
+
+def _matches(token, terms):
+    """Returns True if a lower case token matches any of the terms"""
+
+    return any(token.startswith(word) if prefix else token == word
+               for word, prefix in terms)
+
+
+def _snippet(body, terms, marks):
+    """Returns about SNIPPET_TOKENS words of body around its first match,
+    with marks around each matching word"""
+
+    tokens = list(_WORDS.finditer(body))
+    first = next((i for i, token in enumerate(tokens)
+                  if _matches(token.group().lower(), terms)), 0)
+    start = max(0, first - SNIPPET_TOKENS // 4)
+    window = tokens[start:start + SNIPPET_TOKENS]
+
+    if not window:
+        return ""
+
+    parts = ["..." if start else ""]
+    position = window[0].start()
+
+    for token in window:
+        parts.append(body[position:token.start()])
+
+        if _matches(token.group().lower(), terms):
+            parts.append(marks[0] + token.group() + marks[1])
+        else:
+            parts.append(token.group())
+
+        position = token.end()
+
+    if start + SNIPPET_TOKENS < len(tokens):
+        parts.append("...")
+
+    return "".join(parts)
+
+
+def search(query, limit=20, notebook_id=None, marks=("[", "]")):
+    """Scans note names and bodies for every word of query, best match
+    (most matching words) first."""
+
+    terms = _terms(query)
+
+    if not terms:
+        return []
+
+    with _lock:
+
+        if notebook_id is None:
+            rows = [row for row in _index if not row[5]]
+        else:
+            rows = [row for row, _ in _descendants(notebook_id)
+                    if not row[5]]
+
+    results = []
+
+    for row in rows:
+
+        body = _read_body(row[0])
+
+        if not isinstance(body, str):
+            body = ""
+
+        name_tokens = [token.lower() for token in _WORDS.findall(row[1])]
+        body_tokens = [token.lower() for token in _WORDS.findall(body)]
+        tokens = name_tokens + body_tokens
+
+        if all(any(_matches(token, [term]) for token in tokens)
+               for term in terms):
+            score = sum(_matches(token, terms) for token in tokens)
+            results.append((-score, row[0], row[1], row[3],
+                            _snippet(body, terms, marks)))
+
+    results.sort()
+
+    return [result[1:] for result in results[:limit]]
+
+
+def delete(obj_id):
+    """Deletes the note's file and those of everything below it."""
+
+    with _lock:
+        ids = [obj_id] + [row[0] for row, _ in _descendants(obj_id)]
+
+        for note_id in ids:
+
+            try:
+                os.remove(_path(note_id))
+            except FileNotFoundError:
+                pass
+
+            _index.remove(note_id)
+
+
+def compact(progress=None):
+    """Bodies are plain files here, so there is nothing to recompress.
+
+    Returns:
+        (0, body bytes, body bytes)."""
+
+    with _lock:
+        size = sum(row[4] for row in _index)
+
+    if progress is not None:
+        progress(len(_index))
+
+    return 0, size, size
+
+
+def remove_orphans():
+    """Deletes notes whose parent no longer exists, and everything below
+    them.
+
+    Returns:
+        The number of notes deleted."""
+
+    with _lock:
+        before = len(_index)
+        orphans = [row[0] for row in _index
+                   if row[3] not in (None, 0) and row[3] not in _index]
+
+        for obj_id in orphans:
+            delete(obj_id)
+
+        return before - len(_index)
+
+
+def _storage_stats():
+    """Returns the number of note files and their total size"""
+
+    with os.scandir(DIRECTORY) as entries:
+        sizes = [entry.stat().st_size for entry in entries
+                 if entry.name.endswith(SUFFIX)]
+
+    return {"files": len(sizes), "bytes": sum(sizes),
+            "file_bytes": sum(sizes)}
+
+
+def maintain(vacuum_pages=1000):
+    """Checks that every note file's metadata reads back, then removes
+    orphans and the .tmp files of writes that never finished. Nothing is
+    removed if a file is unreadable, those init_db() skipped included.
+    vacuum_pages is ignored, files give their space back as they are
+    replaced.
+
+    Yields:
+        (step, report) after each step, like sqlite_backend.maintain()."""
+
+    report = {"before": _storage_stats(), "after": None, "integrity": None,
+              "orphans": 0}
+    problems = list(_damaged)
+
+    with _lock:
+
+        for row in _index:
+
+            try:
+                _read_metadata(row[0])
+            except _READ_ERRORS as error:
+                problems.append(f"{_path(row[0])}: {error}")
+
+    report["integrity"] = problems or ["ok"]
+    yield "integrity_check", report
+
+    if not problems:
+        report["orphans"] = remove_orphans()
+        yield "remove_orphans", report
+
+        with _lock:
+
+            for file_name in os.listdir(DIRECTORY):
+
+                if file_name.endswith(SUFFIX + ".tmp"):
+                    os.remove(os.path.join(DIRECTORY, file_name))
+
+        yield "remove_temporary", report
+
+    report["after"] = _storage_stats()
+    yield "done", report
@@ -0,0 +1,160 @@
+"""Call counts and timings for the app's hot paths
+
+Off unless NOTE_METRICS is set when the app starts. While off, timed()
+returns functions untouched, so there is nothing to pay for:
+
+    NOTE_METRICS=1            time every note_manager call and screen
+                              on_enter/on_pre_leave, F12 shows them in app
+    NOTE_METRICS_SQLITE=1     also count statements and VM progress ticks
+                              through sqlite's trace and progress callbacks
+    NOTE_METRICS_DUMP=FILE    write the stats to FILE (- for stderr) on
+                              exit, implies NOTE_METRICS
+
+Stats are kept per name as (calls, total seconds, slowest call), counters
+have no time.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+
+DUMP = os.environ.get("NOTE_METRICS_DUMP")
+ENABLED = bool(os.environ.get("NOTE_METRICS") or DUMP)
+SQLITE = ENABLED and bool(os.environ.get("NOTE_METRICS_SQLITE"))
+# Virtual machine instructions between sqlite progress callbacks
+PROGRESS_STEPS = 1000
+
+_stats = {}  # name -> [calls, total seconds, max seconds]
+# Updated from the UI thread and the async_note_manager worker
+_lock = threading.Lock()
+
+
+def record(name, seconds=0.0, calls=1):
+    """Adds calls taking seconds in total to name's stats"""
+
+    with _lock:
+        stats = _stats.get(name)
+
+        if stats is None:
+            _stats[name] = [calls, seconds, seconds]
+
+        else:
+            stats[0] += calls
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+
+def timed(name):
+    """Decorator recording every call of a function under name, a no-op
+    when instrumentation is off"""
+
+    def decorator(func):
+
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(namespace, names, prefix):
+    """Replaces functions in a module's namespace with timed versions.
+
+    Args:
+        namespace: The module's globals().
+        names: The functions to time.
+        prefix: Put before each name in the stats, e.g. note_manager."""
+
+    if not ENABLED:
+        return
+
+    for name in names:
+        namespace[name] = timed(prefix + name)(namespace[name])
+
+
+def sqlite_trace(statement):
+    """sqlite trace callback, counts statements by their first word"""
+
+    words = statement.split(None, 2) or ["?"]
+
+    # Statements run inside another one, by triggers or FTS5, are traced
+    # as comments
+    if words[0] == "--" and len(words) > 1:
+        record("sqlite nested " + words[1].upper())
+    else:
+        record("sqlite " + words[0].upper())
+
+
+def sqlite_progress():
+    """sqlite progress handler, counts every PROGRESS_STEPS instructions
+    so long queries stand out"""
+
+    record("sqlite vm steps", calls=PROGRESS_STEPS)
+
+    return 0  # Carry on
+
+
+def stats():
+    """Returns (name, calls, total ms, mean ms, max ms) tuples, most total
+    time first"""
+
+    with _lock:
+        items = [(name, calls, total * 1000, total * 1000 / calls,
+                  slowest * 1000)
+                 for name, (calls, total, slowest) in _stats.items()]
+
+    return sorted(items, key=lambda item: (-item[2], -item[1], item[0]))
+
+
+def report(limit=None):
+    """Returns the stats as a text table"""
+
+    lines = [f"{'':<40}{'calls':>9}{'total ms':>11}{'mean ms':>10}"
+             f"{'max ms':>10}"]
+
+    for name, calls, total, mean, slowest in stats()[:limit]:
+
+        if total:
+            lines.append(f"{name:<40}{calls:>9,}{total:>11,.1f}"
+                         f"{mean:>10,.2f}{slowest:>10,.2f}")
+        else:  # A counter
+            lines.append(f"{name:<40}{calls:>9,}")
+
+    return "\n".join(lines)
+
+
+def reset():
+    """Forgets every stat"""
+
+    with _lock:
+        _stats.clear()
+
+
+def dump(path=None):
+    """Writes the report to path, - for stderr, defaults to DUMP"""
+
+    path = path or DUMP
+
+    if path == "-":
+        print(report(), file=sys.stderr)
+
+    elif path:
+        with open(path, "w") as dump_file:
+            dump_file.write(report() + "\n")
+
+
+if DUMP:
+    atexit.register(dump)
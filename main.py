@@ -3,11 +3,57 @@
 
 Usage:
 
-    python3 Note/main.py
+    python3 Note/main.py [--settings PATH] [--db PATH]
+
+Settings are kept in ~/.note/settings.ini, or in $NOTE_SETTINGS or
+--settings, whichever directory the app is started from. An earlier
+version's settings.ini in the working directory is copied there on the
+first start. The notes are in notes.db beside them, other databases can
+be added as profiles in the settings screen and switched between. --db,
+or $NOTE_DB, opens another database for this run only, :memory: for one
+in memory. Kivy's own options follow the app's.
+
+Set NOTE_STARTUP_TIMES=1 to print how long the imports, opening the notes
+and the first frame take, then quit. See instrumentation.py for the call
+timings shown with F12.
 
 """
 
+import time
+
+# Before Kivy is imported, for the startup times
+_import_start = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+
+def parse_args():
+    """Reads the app's own options, leaving the rest of sys.argv for Kivy,
+    which reads it when imported."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settings",
+                        help="the settings file, defaults to $NOTE_SETTINGS "
+                             "or ~/.note/settings.ini")
+    parser.add_argument("--db",
+                        help="a database to open instead of the profile's, "
+                             "defaults to $NOTE_DB")
+    args, sys.argv[1:] = parser.parse_known_args()
+
+    return args
+
+
+# Only when run as the app, not when imported by the benchmarks
+args = (parse_args() if __name__ == '__main__'
+        else argparse.Namespace(settings=None, db=None))
+
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.logger import Logger
+from kivy.properties import NumericProperty
 from kivy.core.window import Window
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.screenmanager import ScreenManager, Screen, NoTransition
@@ -17,29 +63,166 @@ from kivy.uix.gridlayout import GridLayout
 
 from kivy.uix.button import Button
 from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.scrollview import ScrollView
-from kivy.uix.textinput import TextInput
-from kivy.uix.widget import WidgetException
+from kivy.utils import escape_markup
 
+from concurrent.futures import Future
 import configparser
-import os
 
 # My scripts:
+import async_note_manager
+import chunks
+import instrumentation
 import note_manager
+from note_cache import BodyCache, NoteCache
 
 config = configparser.ConfigParser()
 __version__ = 'v1.1.0'
 
+STARTUP_TIMES = bool(os.environ.get("NOTE_STARTUP_TIMES"))
+
+# settings.ini, the same file whichever directory the app is started from
+DEFAULT_SETTINGS = os.path.join(os.path.expanduser("~"), ".note",
+                                "settings.ini")
+SETTINGS_PATH = os.path.abspath(
+    args.settings or os.environ.get("NOTE_SETTINGS") or DEFAULT_SETTINGS)
+# Where earlier versions kept it, and the notes, see Settings.load_settings
+LEGACY_SETTINGS = "settings.ini"
+# A database given for this run only, shown as its own profile
+DB_OVERRIDE = args.db or os.environ.get("NOTE_DB")
+
+# The profile kept in the Storage section, more are Profile sections
+DEFAULT_PROFILE = "Default"
+# Where a profile without a Location keeps its notes, beside settings.ini
+DEFAULT_LOCATIONS = {"sqlite": "notes.db", "files": "notes"}
+
+# The UI never waits on the database, note_manager calls go through
+# async_note_manager and their callbacks come back on the UI thread
+async_note_manager.set_dispatcher(
+    lambda func: Clock.schedule_once(lambda dt: func()))
+
+
+def open_storage(backend, location):
+    """Opens a profile's storage backend, queued on the
+    async_note_manager worker before anything else so the first frame
+    doesn't wait for it, and again on switching profiles.
+
+    Returns:
+        The seconds it took."""
+
+    start = time.perf_counter()
+
+    # The previous profile's store stays open, switching back to it
+    # doesn't open it again
+    note_manager.configure(backend, location)
+    note_manager.init_db()
+
+    return time.perf_counter() - start
+
+
+def write_note(note_id, name, body, parent_id):
+    """Creates or updates a note, runs on the async_note_manager worker.
+
+    Args:
+        note_id: The note's id, a Future of it, or None for a new note.
+        name: The note's name.
+        body: The note's body.
+        parent_id: The notebook a new note is created in.
+
+    Returns:
+        The note's metadata row."""
+
+    if isinstance(note_id, Future):
+        # Calls run in order, so the note has already been created
+        note_id = note_id.result()[0]
+
+    with note_manager.transaction():
+
+        if note_id is None:
+            note_id = note_manager.new_obj(name, body, parent_id)
+
+        else:
+            note_manager.update_obj(note_id, name=name, data=body)
+
+        return note_manager.get_metadata(note_id)
+
+
+def open_chunk(note_id, index):
+    """Reads one chunk of a large note, chunking its body first if it
+    isn't yet, runs on the async_note_manager worker.
+
+    Returns:
+        (the note's metadata row, its number of chunks, the chunk), no
+        chunk if the body turned out too small to chunk."""
+
+    count = note_manager.chunk_body(note_id)
+    chunk = note_manager.get_chunks(note_id, index)[0] if count else None
+
+    return note_manager.get_metadata(note_id), count, chunk
+
+
+def write_chunk(note_id, name, edits):
+    """Saves the name and edited chunks of a large note, runs on the
+    async_note_manager worker.
+
+    Args:
+        note_id: The note's id.
+        name: The note's name.
+        edits: Dict of chunk index -> text, empty if only renamed.
+
+    Returns:
+        The note's metadata row."""
+
+    with note_manager.transaction():
+
+        if note_manager.get_metadata(note_id)[1] != name:
+            note_manager.update_obj(note_id, name=name)
+
+        if edits:
+            note_manager.update_chunks(note_id, edits)
+
+        return note_manager.get_metadata(note_id)
+
+
+def delete_note(note_id):
+    """Deletes a note, runs on the async_note_manager worker after any
+    queued saves of it.
+
+    Returns:
+        The id of the deleted note."""
+
+    if isinstance(note_id, Future):
+        note_id = note_id.result()[0]
+
+    note_manager.delete(note_id)
+
+    return note_id
+
+
+def create_notebook(name, parent_id):
+    """Creates a notebook, runs on the async_note_manager worker.
+
+    Returns:
+        The notebook's metadata row."""
+
+    with note_manager.transaction():
+        return note_manager.get_metadata(
+            note_manager.new_obj(name, "Notebook", parent_id, notebook=True))
+
 
 # App-wide variables:
 class Settings:
     """Settings for the app. Allows user defined colors, which change when app
     is reopened."""
 
-    def __init__(self):
+    def __init__(self, path=SETTINGS_PATH):
         """Loads color preferences and store them for accessibility."""
 
         # Load settings
+        self.path = path
         self.settings = self.load_settings()
 
         colors = self.settings["Colors"]
@@ -54,13 +237,55 @@ class Settings:
 
         self.window_color = self.app_bg_color
 
+        # Note stores to switch between, name -> (backend, location), see
+        # note_manager.BACKENDS and storage(). Older settings files have
+        # no Storage section
+        self.profiles = {DEFAULT_PROFILE: (
+            self.settings.get("Storage", "Backend", fallback="sqlite"),
+            self.settings.get("Storage", "Location", fallback=""))}
+
+        for section in self.settings.sections():
+
+            if section.startswith("Profile "):
+                self.profiles[section[len("Profile "):]] = (
+                    self.settings.get(section, "Backend", fallback="sqlite"),
+                    self.settings.get(section, "Location", fallback=""))
+
+        self.profile = self.settings.get("Storage", "Profile",
+                                         fallback=DEFAULT_PROFILE)
+
+        if self.profile not in self.profiles:
+            self.profile = DEFAULT_PROFILE
+
+        # Not saved, the next run is back on the saved profile
+        self.override = None
+
+        if DB_OVERRIDE:
+            self.override = os.path.basename(DB_OVERRIDE) or DB_OVERRIDE
+            self.profiles[self.override] = (
+                "sqlite", DB_OVERRIDE if DB_OVERRIDE == ":memory:"
+                else os.path.abspath(DB_OVERRIDE))
+            self.profile = self.override
+
+        # Storage upkeep once the app has been left alone for Idle
+        # Minutes, at most every Interval Hours, 0 minutes turns it off.
+        # See NoteApp.check_idle
+        self.idle_minutes = self.settings.getfloat(
+            "Maintenance", "Idle Minutes", fallback=5)
+        self.maintenance_hours = self.settings.getfloat(
+            "Maintenance", "Interval Hours", fallback=24)
+        self.last_maintenance = self.settings.getint(
+            "Maintenance", "Last Run", fallback=0)
+
     def save_settings(self, settings):
         """Saves user settings when Settings screen is exited.
 
         Args:
             settings: The config file."""
 
-        with open('settings.ini', 'w') as config_file:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path, 'w') as config_file:
             settings.write(config_file)
 
     def load_settings(self):
@@ -70,18 +295,113 @@ class Settings:
         Returns:
             settings: The config file"""
 
-        # Create a settings file if there isn't one
-        if not os.path.isfile('settings.ini'):
-            self.initialize_config()
+        # Create a settings file if there isn't one. Earlier versions
+        # kept it in the working directory, take that one over if there
+        if not os.path.isfile(self.path):
+
+            if (self.path == DEFAULT_SETTINGS and
+                    os.path.isfile(LEGACY_SETTINGS)):
+                self.adopt_legacy_config()
+            else:
+                self.initialize_config()
 
         # Store it
-        config.read('settings.ini')
+        config.read(self.path)
         settings = config
 
         return settings
 
+    def adopt_legacy_config(self):
+        """Copies the settings.ini of an earlier version, in the working
+        directory, pointing its default profile at the notes beside it
+        which it used to find there."""
+
+        config.read(LEGACY_SETTINGS)
+
+        if not config.has_section('Storage'):
+            config['Storage'] = {'Backend': 'sqlite', 'Location': ''}
+
+        storage = config['Storage']
+        backend = storage.get('Backend', 'sqlite')
+
+        if not storage.get('Location') and backend in DEFAULT_LOCATIONS:
+            storage['Location'] = os.path.abspath(DEFAULT_LOCATIONS[backend])
+
+        self.save_settings(config)
+
+    def storage(self, profile=None):
+        """Returns where a profile keeps its notes, the current profile
+        by default.
+
+        Returns:
+            (backend, location) for note_manager.configure(). Relative
+            locations are in the settings file's directory."""
+
+        backend, location = self.profiles[profile or self.profile]
+
+        if backend not in DEFAULT_LOCATIONS or location == ":memory:":
+            return backend, location or None
+
+        return backend, os.path.join(os.path.dirname(self.path),
+                                     location or DEFAULT_LOCATIONS[backend])
+
+    def add_profile(self, location):
+        """Adds a profile keeping its notes at location, in the files
+        backend if it's a directory, and saves it.
+
+        Returns:
+            The new profile's name, after the file."""
+
+        backend = "files" if os.path.isdir(location) else "sqlite"
+        name = base = (os.path.splitext(os.path.basename(
+            location.rstrip(os.sep)))[0] or location)
+        number = 1
+
+        while name in self.profiles:
+            number += 1
+            name = f"{base} {number}"
+
+        if location != ":memory:":
+            location = os.path.abspath(location)
+
+        self.profiles[name] = (backend, location)
+        config[f'Profile {name}'] = {'Backend': backend,
+                                     'Location': location}
+        self.save_settings(config)
+
+        return name
+
+    def set_profile(self, name):
+        """Makes name the current profile, remembered for the next start
+        unless it's the one given by --db."""
+
+        self.profile = name
+
+        if name == self.override:
+            return
+
+        if not config.has_section('Storage'):
+            config['Storage'] = {'Backend': 'sqlite', 'Location': ''}
+
+        config['Storage']['Profile'] = name
+        self.save_settings(config)
+
+    def maintained(self, when):
+        """Records when storage maintenance last finished.
+
+        Args:
+            when: Seconds since the epoch."""
+
+        if not config.has_section('Maintenance'):
+            config['Maintenance'] = {'Idle Minutes': self.idle_minutes,
+                                     'Interval Hours': self.maintenance_hours}
+
+        config['Maintenance']['Last Run'] = str(when)
+        self.last_maintenance = when
+        self.save_settings(config)
+
     def initialize_config(self):
-        """Initializes the user settings.ini
+        """Initializes the user settings.ini, at self.path
 
         Returns:
             config: The settings config file."""
@@ -90,6 +410,12 @@ class Settings:
         config['Colors'] = {'Text Color': [0, 1, 1, 1],
                             'App Bg Color': [0, 0, 0, 1],
                             'TextInput Color': [.25, .25, .25, 1]}
+        config['Storage'] = {'Backend': 'sqlite',
+                             'Location': '',
+                             'Profile': DEFAULT_PROFILE}
+        config['Maintenance'] = {'Idle Minutes': 5,
+                                 'Interval Hours': 24,
+                                 'Last Run': 0}
         # Save config file
         self.save_settings(config)
 
@@ -101,18 +427,21 @@ class AppVariables:
         self.default_colors = [[0, 1, 1, 1],
                                [0, 0, 0, 1],
                                [.25, .25, .25, 1]]
-        self.notes = []
+        # Loaded once by the menu, then kept current by each write
+        self.notes = NoteCache()
+        self.notes_loaded = False
+        # Bodies of recently opened notes, reopening one doesn't read it
+        self.bodies = BodyCache()
+        # note id -> saves still queued for it, whose body isn't cached
+        # until the last one is written
+        self.writing = {}
         self.active_notebook = None
         self.active_note = None
 
     def get_note_obj(self, obj_id):
-        """Searches notes for object with provided id"""
-
-        for note_obj in self.notes:
+        """Returns the cached note object with provided id"""
 
-            if note_obj[0] == obj_id:
-
-                return note_obj
+        return self.notes.get(obj_id)
 
 
 # Redefined widgets:
@@ -173,21 +502,258 @@ class TopBar(BoxLayout):
         self.add_widget(buttons[1])
 
 
-class CustomTextInput(TextInput):
-    """A Label widget with a background color."""
+def custom_text_input(**kwargs):
+    """Returns a TextInput in the app's colors. TextInput is the slowest
+    widget to import, so it's imported when the first screen using one is
+    built rather than at startup."""
 
-    def __init__(self, **kwargs):
-        super(CustomTextInput, self).__init__(**kwargs)
+    from kivy.uix.textinput import TextInput
+
+    text_input = TextInput(**kwargs)
+    text_input.foreground_color = app_settings.text_color  # Font color
+
+    text_input.background_active = ''  # Background styling/coloring
+    text_input.background_normal = ''
+    text_input.background_color = app_settings.textinput_color
+
+    return text_input
+
+
+class NoteListButton(RecycleDataViewBehavior, Button):
+    """A button in a NoteList, reused for whichever row scrolls into view."""
 
-        self.foreground_color = app_settings.text_color  # Font color
+    note_id = NumericProperty()
+
+    def __init__(self, **kwargs):
+        super(NoteListButton, self).__init__(**kwargs)
 
-        self.background_active = ''  # Background styling/coloring
         self.background_normal = ''
         self.background_color = app_settings.textinput_color
+        self.color = app_settings.text_color
+        self.note_list = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        """Called when the button is given a row to show."""
+
+        self.note_list = rv.parent
+        return super(NoteListButton, self).refresh_view_attrs(rv, index, data)
+
+    def on_release(self):
+        self.note_list.select_callback(self.note_id)
+
+
+class NoteList(BoxLayout):
+    """A virtualized list of note objects. Only the visible rows get a
+    button, and buttons are reused while scrolling.
+
+    Args:
+        select_callback: Called with the id of the note object pressed.
+        empty_text: Shown instead of the list when there are no rows.
+        more_callback: Called when the list is scrolled to within a
+            screen of its end, to extend() it with the next page."""
+
+    def __init__(self, select_callback, empty_text='', more_callback=None,
+                 **kwargs):
+        super(NoteList, self).__init__(**kwargs)
+
+        self.select_callback = select_callback
+        self.more_callback = more_callback
+        self.empty_text = empty_text
+        self.empty_lbl = Label(text=empty_text)
+
+        self.view = RecycleView(size_hint=(1, 1),
+                                bar_color=app_settings.text_color,
+                                bar_pos_y='right')
+
+        layout = RecycleBoxLayout(orientation='vertical',
+                                  spacing=2,
+                                  size_hint_y=None,
+                                  default_size=(None, 100),
+                                  default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter('height'))
+        self.view.add_widget(layout)
+
+        if more_callback is not None:
+            self.view.bind(scroll_y=self.check_end, height=self.check_end)
+        # Set after the layout is added, it's passed on to the layout
+        self.view.viewclass = NoteListButton
+
+        self.add_widget(self.empty_lbl)
+
+    def show_loading(self):
+        """Shows a placeholder until update() is called with the rows."""
+
+        self.view.data = []
+        self.empty_lbl.text = "Loading..."
+
+        if self.children[0] is self.view:
+            self.remove_widget(self.view)
+            self.add_widget(self.empty_lbl)
+
+    def update(self, rows):
+        """Shows the given note objects, changing only the rows that differ
+        from what is shown.
+
+        Args:
+            rows: Note object metadata rows, notebooks are shown in bold."""
+
+        self.empty_lbl.text = self.empty_text
+        data = self.view.data
+        new_data = [{'note_id': row[0], 'text': row[1], 'bold': bool(row[5])}
+                    for row in rows]
+
+        if len(new_data) == len(data):  # Same length, patch changed rows
+
+            for index, item in enumerate(new_data):
+
+                if data[index] != item:
+                    data[index] = item
+
+        else:
+            self.view.data = new_data
+
+        shown = self.children[0]
+
+        if new_data and shown is self.empty_lbl:
+            self.remove_widget(self.empty_lbl)
+            self.add_widget(self.view)
+
+        elif not new_data and shown is self.view:
+            self.remove_widget(self.view)
+            self.add_widget(self.empty_lbl)
+
+    def extend(self, rows):
+        """Adds rows to the end of the list, the next page of a listing.
+
+        Args:
+            rows: Note object metadata rows."""
+
+        if not rows:
+            return
+
+        if not self.view.data:  # Nothing shown yet
+            self.update(rows)
+            return
+
+        # scroll_y is relative, keep the rows in view where they are
+        # rather than the same fraction of the way down
+        above = (1 - self.view.scroll_y) * max(
+            self.content_height() - self.view.height, 0)
+
+        self.view.data.extend({'note_id': row[0], 'text': row[1],
+                               'bold': bool(row[5])} for row in rows)
+
+        scrollable = self.content_height() - self.view.height
+
+        if scrollable > 0:
+            self.view.scroll_y = 1 - above / scrollable
+
+    def content_height(self):
+        """Height of all the rows, as the layout will be once it catches
+        up with the data"""
+
+        layout = self.view.layout_manager
+        count = len(self.view.data)
+
+        return count * (layout.default_size[1] + layout.spacing) - (
+            layout.spacing if count else 0)
+
+    def check_end(self, *args):
+        """Asks for more rows once less than a screen of them is left
+        below the visible ones."""
+
+        below = self.view.scroll_y * (self.content_height() -
+                                      self.view.height)
+
+        if below < self.view.height:
+            self.more_callback()
+
+
+class LazyScreenManager(ScreenManager):
+    """A ScreenManager building each screen the first time it's shown, so
+    startup only pays for the menu.
+
+    Screens are registered with add_screen_class() instead of being
+    added."""
+
+    def __init__(self, **kwargs):
+        super(LazyScreenManager, self).__init__(**kwargs)
+
+        self.screen_classes = {}
+
+    def add_screen_class(self, name, screen_class):
+        """Registers the class to build the screen called name with."""
+
+        self.screen_classes[name] = screen_class
+
+    def get_screen(self, name):
+        """Returns the screen called name, building it if necessary."""
+
+        if (name in self.screen_classes and
+                not super(LazyScreenManager, self).has_screen(name)):
+            self.add_widget(self.screen_classes[name](name=name))
+
+        return super(LazyScreenManager, self).get_screen(name)
+
+    def has_screen(self, name):
+        return (name in self.screen_classes or
+                super(LazyScreenManager, self).has_screen(name))
+
+
+class MetricsOverlay(Label):
+    """The instrumentation stats drawn over the app, refreshed every
+    second while shown."""
+
+    def __init__(self, **kwargs):
+        super(MetricsOverlay, self).__init__(font_name='RobotoMono-Regular',
+                                             font_size=10,
+                                             halign='left',
+                                             valign='top',
+                                             color=app_settings.text_color,
+                                             **kwargs)
+
+        with self.canvas.before:
+            Color(0, 0, 0, .8)
+            self.background = Rectangle()
+
+        self.bind(pos=self.resize, size=self.resize)
+        self.refresh_event = Clock.schedule_interval(self.refresh, 1)
+        self.refresh()
+
+    def resize(self, *args):
+        self.text_size = self.size
+        self.background.pos = self.pos
+        self.background.size = self.size
+
+    def refresh(self, *args):
+        """Shows the stats taking the most time"""
+
+        self.text = instrumentation.report(limit=30)
+
+
+class TimedScreen(Screen):
+    """A Screen timing its on_enter and on_pre_leave handlers when
+    instrumentation is on."""
+
+    def dispatch(self, event_type, *args, **kwargs):
+
+        if not (instrumentation.ENABLED and
+                event_type in ('on_enter', 'on_pre_leave')):
+            return super(TimedScreen, self).dispatch(event_type, *args,
+                                                     **kwargs)
+
+        start = time.perf_counter()
+
+        try:
+            return super(TimedScreen, self).dispatch(event_type, *args,
+                                                     **kwargs)
+        finally:
+            instrumentation.record(f"{type(self).__name__}.{event_type}",
+                                   time.perf_counter() - start)
 
 
 # Screens:
-class MenuScreen(Screen):
+class MenuScreen(TimedScreen):
     """The uppermost screen in an hierarchical view, shows on load."""
 
     def __init__(self, **kwargs):
@@ -215,17 +781,18 @@ class MenuScreen(Screen):
 
         # *Screen Content------------------------------------------------------
 
-        #       Populate Notebooks layout
-        self.notebooks = BoxLayout(size_hint_y=None,
-                                   orientation='vertical',
-                                   spacing=2)
-        self.notebooks.bind(minimum_height=self.notebooks.setter('height'))
+        #       Search Button, told apart by instance, Kivy 2 has no id=
+        self.search_btn = Button(text="Search notes...",
+                                 size_hint=(1, .08),
+                                 background_normal='',
+                                 background_color=app_settings.textinput_color,
+                                 color=app_settings.text_color)
+        self.search_btn.bind(on_release=self.switch_screen)
+        screen_container.add_widget(self.search_btn)
 
-        #       Make scrollable
-        self.nb_scroll = ScrollView(size_hint=(1, 1),
-                                    bar_color=app_settings.text_color,
-                                    bar_pos_y='right')
-        self.nb_scroll.add_widget(self.notebooks)
+        #       Notebooks list, scrollable
+        self.nb_scroll = NoteList(self.open_notebook,
+                                  empty_text="No Notebooks to display :(")
         screen_container.add_widget(self.nb_scroll)
 
         # Pack
@@ -240,58 +807,54 @@ class MenuScreen(Screen):
         Args:
             args[0]: The button object selected, passed automatically."""
 
-        if args[0].id == 'New':
+        if args[0] is self.search_btn:
+            sm.current = 'search'
+
+        elif args[0].id == 'New':
             app_variables.active_notebook = None
             sm.current = 'newnotebook'
 
         elif args[0].id == 'Settings':
             sm.current = 'settings'
 
-        else:
-            app_variables.active_notebook = int(args[0].id)
-            sm.current = 'notebook'
+    def open_notebook(self, notebook_id):
+        """Opens the notebook selected from the list.
+
+        Args:
+            notebook_id: The id of the notebook, passed by the NoteList."""
+
+        app_variables.active_notebook = notebook_id
+        sm.current = 'notebook'
 
     def load(self, *args):
         """Loads all notebooks when screen loads."""
 
-        app_variables.notes = note_manager.load()
-        print(app_variables.notes)
-
         app_variables.active_notebook = None
         app_variables.active_note = None
-        self.notebooks.clear_widgets()
-
-        child_note_objs = note_manager.get_children(0)
-
-        if len(child_note_objs) > 0:
 
-            for note_obj in child_note_objs:
+        if app_variables.notes_loaded:
 
-                bg_color = app_settings.textinput_color
+            self.nb_scroll.update(app_variables.notes.children(0))
 
-                notebook_btn = Button(text=note_obj[1],
-                                      size_hint=(1, None),
-                                      background_normal='',
-                                      background_color=bg_color,
-                                      color=app_settings.text_color,
-                                      id=str(note_obj[0]))
+        else:  # First visit, fill the note cache
 
-                self.notebooks.add_widget(notebook_btn)
+            self.nb_scroll.show_loading()
+            async_note_manager.load_metadata(callback=self.notes_loaded)
 
-                notebook_btn.bind(on_press=lambda button:
-                                  self.switch_screen(button))
+    def notes_loaded(self, rows):
+        """Fills the note cache once the notes are read.
 
-            #       Buffer
-            self.notebooks.add_widget(Label(text="",
-                                            size_hint=(0, 1-(len(
-                                                child_note_objs)*.1))))
+        Args:
+            rows: Every note object's metadata."""
 
-        else:
+        app_variables.notes.load(rows)
+        app_variables.notes_loaded = True
 
-            self.notebooks.add_widget(Label(text="No Notebooks to display :("))
+        if sm.current == 'menu':
+            self.load()
 
 
-class NewNotebookScreen(Screen):
+class NewNotebookScreen(TimedScreen):
     """The screen for creating a new notebook. Simply asks for a name."""
 
     def __init__(self, **kwargs):
@@ -310,6 +873,8 @@ class NewNotebookScreen(Screen):
                                            size_hint=(1, .5)))
 
         # *Notebook Name Entry-------------------------------------------------
+        from kivy.uix.textinput import TextInput
+
         self.nb_name = TextInput(hint_text="Notebook Name...",
                                  multiline=False,
                                  size_hint=(1, .085),)
@@ -345,21 +910,48 @@ class NewNotebookScreen(Screen):
         if name:
 
             self.nb_name.text = ''
-            note_manager.new_obj(name, "Notebook", 0)
-            app_variables.notes = note_manager.load()
-            app_variables.active_notebook = app_variables.notes[-1][0]
 
-            sm.current = 'notebook'
+            # Inside the open notebook, or top level from the menu
+            parent_id = app_variables.active_notebook or 0
+            async_note_manager.submit(create_notebook, name, parent_id,
+                                      callback=self.saved)
+
+    def saved(self, row):
+        """Opens the new notebook once it's created.
 
+        Args:
+            row: The new notebook's metadata row."""
+
+        app_variables.notes.insert(row)
+        app_variables.active_notebook = row[0]
+
+        sm.current = 'notebook'
 
-class NotebookScreen(Screen):
+
+class NotebookScreen(TimedScreen):
     """The screen for viewing the notes inside a notebook, each note
     represented by a button that leads to the View Note screen. Can also add
-    a note or delete the entire notebook from the top bar."""
+    a note or delete the entire notebook from the top bar.
+
+    Notebooks nest: child notebooks are listed in bold and open in place,
+    the header shows the path to the open notebook and goes up a level.
+
+    The list is read a page at a time in the chosen order, the next page
+    once it's scrolled near its end, so a huge notebook opens as quickly
+    as a small one."""
+
+    page_size = 20  # Rows per page, a few screens of them
+    # Listing orders the sort button cycles through, with its label
+    orders = {"modified": "New", "name": "A-z", "size": "Big"}
 
     def __init__(self, **kwargs):
         super(NotebookScreen, self).__init__(**kwargs)
 
+        self.order = "modified"
+        self._listing = 0  # Bumped per listing, older pages are dropped
+        self._cursor = None  # Where the next page starts, None at the end
+        self._loading = False
+
         # Container------------------------------------------------------------
         self.screen_container = BoxLayout(orientation="vertical",
                                           spacing=5)
@@ -380,24 +972,47 @@ class NotebookScreen(Screen):
         self.content_container = BoxLayout(orientation="vertical",
                                            spacing=2)
 
-        #       Active Notebook Label
+        header = BoxLayout(size_hint=(1, .1))
+
+        #       Up Button
+        up_btn = Button(text="<-",
+                        background_normal='',
+                        background_color=app_settings.app_bg_color,
+                        color=app_settings.text_color,
+                        size_hint=(.15, 1))
+        up_btn.bind(on_release=self.up)
+        header.add_widget(up_btn)
+
+        #       Sort Button, cycles through the listing orders
+        self.sort_btn = Button(text=self.orders[self.order],
+                               background_normal='',
+                               background_color=app_settings.app_bg_color,
+                               color=app_settings.text_color,
+                               size_hint=(.15, 1))
+        self.sort_btn.bind(on_release=self.next_order)
+        header.add_widget(self.sort_btn)
+
+        #       Active Notebook Label, the path to it and its size
         self.current_notebook = Label(color=app_settings.textinput_color,
-                                      size_hint=(1, .1))
-        self.content_container.add_widget(self.current_notebook)
+                                      halign='center')
+        header.add_widget(self.current_notebook)
 
-        self.no_note_lbl = Label(text="No notes to display")
+        #       New Notebook Button
+        new_nb_btn = Button(text="+NB",
+                            background_normal='',
+                            background_color=app_settings.app_bg_color,
+                            color=app_settings.text_color,
+                            size_hint=(.15, 1))
+        new_nb_btn.bind(on_release=self.new_notebook)
+        header.add_widget(new_nb_btn)
 
-        #       Note Container
-        self.notes = BoxLayout(size_hint_y=None,
-                               orientation="vertical",
-                               spacing=2)
-        self.notes.bind(minimum_height=self.notes.setter('height'))
+        self.content_container.add_widget(header)
+        self._confirm_delete = False
 
-        #       Make scrollable
-        self.note_scroll = ScrollView(size_hint=(1, 1),
-                                      bar_color=app_settings.text_color,
-                                      bar_pos_y='right')
-        self.note_scroll.add_widget(self.notes)
+        #       Notes list, scrollable
+        self.note_scroll = NoteList(self.open_note,
+                                    empty_text="No notes to display",
+                                    more_callback=self.load_more)
 
         self.content_container.add_widget(self.note_scroll)
         self.screen_container.add_widget(self.content_container)
@@ -408,94 +1023,197 @@ class NotebookScreen(Screen):
         self.bind(on_enter=self.update_widgets)
 
     def switch_screen(self, *args):
-        """A method for switching screens.
+        """A method for switching screens, to add a new note.
 
         Args:
             args[0]: The button object selected, passed
             automatically.
-            args[1]: The ID of the note to edit, not passed if new note
         """
 
-        try:
-            app_variables.active_note = args[1]
+        app_variables.active_note = None
+        sm.current = 'editnote'
 
-        except IndexError:
-            pass
+    def new_notebook(self, *args):
+        """Switches to the New Notebook screen, to add a notebook inside
+        the open one."""
 
-        sm.current = 'editnote'
+        sm.current = 'newnotebook'
+
+    def open_note(self, note_id):
+        """Opens the note selected from the list for editing, or moves into
+        it if it's a notebook.
+
+        Args:
+            note_id: The id of the note, passed by the NoteList."""
+
+        if app_variables.get_note_obj(note_id)[5]:  # A nested notebook
+
+            app_variables.active_notebook = note_id
+            self.update_widgets()
+
+        else:
+
+            app_variables.active_note = note_id
+            sm.current = 'editnote'
+
+    def up(self, *args):
+        """Goes to the notebook containing this one, or the menu from a top
+        level notebook."""
+
+        self.open_parent(app_variables.active_notebook)
+
+    def open_parent(self, notebook_id):
+        """Shows the parent of the given notebook.
+
+        Args:
+            notebook_id: The notebook whose parent to show."""
+
+        parent_id = app_variables.get_note_obj(notebook_id)[3]
+
+        if not parent_id:  # Top level
+
+            sm.current = 'menu'
+
+        else:
+
+            app_variables.active_notebook = parent_id
+            self.update_widgets()
 
     def update_widgets(self, *args):
         """Populates the notebook container with buttons representing
             notes."""
 
-        def new_note_btn(note):
-            """Returns a button representing a note
+        notebook = app_variables.get_note_obj(app_variables.active_notebook)
 
-            Args:
-                note: The note object to represent."""
+        # Breadcrumbs, walking up the cached parents to the top level
+        names = []
+        row = notebook
 
-            note_button = Button(text=note[1],
-                                 size_hint=(1, None),
-                                 background_normal='',
-                                 background_color=app_settings.textinput_color,
-                                 color=app_settings.text_color)
+        while row is not None and row[3] is not None:
+            names.insert(0, row[1])
+            row = app_variables.get_note_obj(row[3])
 
-            note_button.bind(on_press=lambda button:
-                             self.switch_screen(button, note[0]))
+        self._confirm_delete = False
+        self.current_notebook.text = " > ".join(names) + "\n..."
+        self.current_notebook.color = app_settings.textinput_color
 
-            return note_button
+        self.list_notes(notebook[0])
 
-        notebook = app_variables.get_note_obj(app_variables.active_notebook)
+        async_note_manager.get_subtree_stats(
+            notebook[0],
+            callback=lambda stats: self.show_stats(names, notebook[0], stats))
 
-        self.current_notebook.text = notebook[1]
-        self.current_notebook.color = app_settings.textinput_color
+    def next_order(self, *args):
+        """Lists the notebook in the next of the orders."""
+
+        orders = list(self.orders)
+        self.order = orders[(orders.index(self.order) + 1) % len(orders)]
+        self.sort_btn.text = self.orders[self.order]
+        self.list_notes(app_variables.active_notebook)
+
+    def list_notes(self, notebook_id):
+        """Starts listing the notebook's children from the first page.
+
+        Args:
+            notebook_id: The notebook to list."""
+
+        self._listing += 1
+        self._cursor = None
+        self._loading = True
+        listing = self._listing
 
-        notebook_children = note_manager.get_children(notebook[0])
+        async_note_manager.get_children_page(
+            notebook_id, self.order, None, self.page_size,
+            callback=lambda page: self.show_page(listing, page, True))
 
-        if len(notebook_children) > 0:
+    def load_more(self):
+        """Fetches the page after the ones shown, called by the NoteList
+        as it's scrolled near its end."""
 
-            self.notes.clear_widgets()
+        if self._cursor is None or self._loading:
+            return
 
-            for note in notebook_children:
+        self._loading = True
+        listing = self._listing
 
-                note_btn = new_note_btn(note)
-                self.notes.add_widget(note_btn)
+        async_note_manager.get_children_page(
+            app_variables.active_notebook, self.order, self._cursor,
+            self.page_size,
+            callback=lambda page: self.show_page(listing, page, False))
 
-            self.notes.add_widget(Label(text=""))
+    def show_page(self, listing, page, first):
+        """Shows a page of the listing once it's read.
 
-        else:  # If there are no notes to display
+        Args:
+            listing: The listing the page belongs to.
+            page: (rows, cursor of the next page) from get_children_page.
+            first: True to replace the rows shown instead of adding."""
+
+        if listing != self._listing:
+            return  # Another notebook or order since
+
+        rows, self._cursor = page
+        self._loading = False
+
+        if first:
+            self.note_scroll.update(rows)
+            self.note_scroll.view.scroll_y = 1
+        else:
+            self.note_scroll.extend(rows)
+
+        self.note_scroll.check_end()
 
-            try:
+    def show_stats(self, names, notebook_id, stats):
+        """Adds the notebook's size under its path, once it's counted.
 
-                self.notes.clear_widgets()
-                self.notes.add_widget(self.no_note_lbl)  # Say so
+        Args:
+            names: The path to the notebook.
+            notebook_id: The notebook the stats are for.
+            stats: (descendant count, total bytes) from the database."""
 
-            except WidgetException:
+        if (app_variables.active_notebook != notebook_id or
+                self._confirm_delete):
+            return  # Moved on since
 
-                pass  # WidgetException raised if navigating back to the screen
+        count, size = stats
+        self.current_notebook.text = (" > ".join(names) + "\n" +
+                                      f"{count} items, {size / 1024:.1f} KB")
 
     def delete(self, *args):
-        """Method for deleting a notebook"""
+        """Method for deleting a notebook, and everything in it"""
 
         notebook_lbl = self.current_notebook
 
-        if "Delete" not in notebook_lbl.text:
+        if not self._confirm_delete:
 
+            self._confirm_delete = True
             notebook_lbl.text = "Delete " + app_variables.get_note_obj(
                 app_variables.active_notebook)[1] + "?"
             notebook_lbl.color = [1, 0, 0, 1]
 
         else:
 
-            note_manager.delete(app_variables.active_notebook)
-            app_variables.notes = note_manager.load()
+            notebook_id = app_variables.active_notebook
 
-            sm.current = 'menu'
+            async_note_manager.delete(notebook_id)
+            self.open_parent(notebook_id)
 
+            for note_id in app_variables.notes.remove(notebook_id):
+                app_variables.bodies.discard(note_id)
 
-class EditNoteScreen(Screen):
+
+class EditNoteScreen(TimedScreen):
     """Screen for editing a note's name and content. When a new note is to be
-    created the user is redirected here to create it."""
+    created the user is redirected here to create it.
+
+    Changes are saved in the background once typing pauses, and when
+    leaving the screen. Unchanged notes are never written.
+
+    Notes of chunks.THRESHOLD bytes or more are edited a chunk at a time,
+    moving between chunks with the buttons under the body, and only the
+    chunk shown is saved."""
+
+    autosave_delay = 1.5  # Seconds without an edit before autosaving
 
     def __init__(self, **kwargs):
         super(EditNoteScreen, self).__init__(**kwargs)
@@ -533,15 +1251,14 @@ class EditNoteScreen(Screen):
         # *Note Name-----------------------------------------------------------
 
         #       Name Text Input
-        self.note_name_ti = CustomTextInput(hint_text="Untitled",
-                                            font_size=18,
-                                            multiline=False,
-                                            write_tab=False,
-                                            size_hint=(1, .09),
-                                            padding=(10, 10))
+        self.note_name_ti = custom_text_input(hint_text="Untitled",
+                                              font_size=18,
+                                              multiline=False,
+                                              write_tab=False,
+                                              size_hint=(1, .09),
+                                              padding=(10, 10))
 
         self.note_container.add_widget(self.note_name_ti)
-        self._name = 'Untitled'  # This is the default title for notes
 
         # *Note Body-----------------------------------------------------------
         body_container = BoxLayout()
@@ -553,10 +1270,11 @@ class EditNoteScreen(Screen):
                                       bar_pos_y='right', )
 
         #       Body TextInput Widget
-        self.notebody_textinput = CustomTextInput(hint_text="Enter note body",
-                                                  multiline=True,
-                                                  size_hint_y=None,
-                                                  padding=(10, 10))
+        self.notebody_textinput = custom_text_input(
+            hint_text="Enter note body",
+            multiline=True,
+            size_hint_y=None,
+            padding=(10, 10))
 
         # Bind the two widgets to the greater height
         self.body_scroll.bind(height=self.textinput_height)
@@ -568,10 +1286,42 @@ class EditNoteScreen(Screen):
 
         self.note_container.add_widget(body_container)
 
+        # *Chunk Navigation, only shown for large notes------------------------
+        self.chunk_bar = BoxLayout(size_hint=(1, .07), spacing=2)
+
+        prev_btn = Button(text="<",
+                          background_normal='',
+                          background_color=app_settings.app_bg_color,
+                          color=app_settings.text_color,
+                          size_hint=(.15, 1))
+        prev_btn.bind(on_release=lambda *args: self.move_chunk(-1))
+        self.chunk_bar.add_widget(prev_btn)
+
+        self.chunk_lbl = Label(color=app_settings.textinput_color)
+        self.chunk_bar.add_widget(self.chunk_lbl)
+
+        next_btn = Button(text=">",
+                          background_normal='',
+                          background_color=app_settings.app_bg_color,
+                          color=app_settings.text_color,
+                          size_hint=(.15, 1))
+        next_btn.bind(on_release=lambda *args: self.move_chunk(1))
+        self.chunk_bar.add_widget(next_btn)
+
         # *Pack----------------------------------------------------------------
         self.editnote_container.add_widget(self.note_container)
         self.add_widget(self.editnote_container)
 
+        # *Autosave------------------------------------------------------------
+        self._saved = None  # (name, body) as last loaded or saved
+        self._note_id = None  # A Future of the id until a new note is saved
+        self._chunk = None  # Index of the chunk shown, None if not chunked
+        self._chunk_count = 0
+        self._autosave_trigger = Clock.create_trigger(self.autosave,
+                                                      self.autosave_delay)
+        self.note_name_ti.bind(text=self.schedule_autosave)
+        self.notebody_textinput.bind(text=self.schedule_autosave)
+
         # *Load on enter, save on exit-----------------------------------------
         self.bind(on_enter=self.load,
                   on_pre_leave=self.save)
@@ -581,33 +1331,142 @@ class EditNoteScreen(Screen):
 
         sm.current = 'notebook'
 
-    def save(self, *args):
-        """Save the note."""
+    def note_contents(self):
+        """Returns the (name, body) being edited."""
+
+        # This is the default title for notes
+        return (self.note_name_ti.text or 'Untitled',
+                self.notebody_textinput.text)
+
+    def is_dirty(self):
+        """Returns True if the note changed since it was loaded or saved."""
+
+        return self._saved is not None and self.note_contents() != self._saved
+
+    def schedule_autosave(self, *args):
+        """Restarts the autosave countdown, called on every edit."""
+
+        self._autosave_trigger.cancel()
+        self._autosave_trigger()
+
+    def autosave(self, *args):
+        """Saves the note on the writer thread if it has changed."""
+
+        if not self.is_dirty():
+            return
+
+        note_id = self._note_id
+
+        if self._chunk is not None:  # Only the chunk shown can have changed
+            name, body = self.note_contents()
+            edits = {self._chunk: body} if body != self._saved[1] else {}
+            self._saved = (name, body)
+            counted = self.writing(note_id)
+
+            async_note_manager.submit(
+                write_chunk, note_id, name, edits,
+                callback=lambda row: self.saved(row, None, counted),
+                errback=lambda error: self.save_failed(note_id, counted,
+                                                       error))
+            return
+
+        if self.notebody_textinput.text.strip() == '':
+            return
+
+        name, body = self._saved = self.note_contents()
+        counted = self.writing(note_id)
+
+        future = async_note_manager.submit(
+            write_note, note_id, name, body, app_variables.active_notebook,
+            callback=lambda row: self.saved(row, body, counted),
+            errback=lambda error: self.save_failed(note_id, counted, error))
+
+        if self._note_id is None:  # Later saves update the note this creates
+            self._note_id = future
+
+    def writing(self, note_id):
+        """Drops a note's cached body as a save of it is queued, so
+        reopening the note before the save is written reads it back
+        behind the save instead of showing the body from before.
+
+        Returns:
+            True if the save is counted in app_variables.writing, not
+            for a note whose creation is still queued, which has no
+            cached body yet."""
+
+        if not isinstance(note_id, int):
+            return False
+
+        app_variables.bodies.discard(note_id)
+        app_variables.writing[note_id] = (
+            app_variables.writing.get(note_id, 0) + 1)
 
-        if self.notebody_textinput.text.strip() != '':
+        return True
 
-            if self.note_name_ti.text != '':
+    def written(self, note_id):
+        """Counts off a queued save of note_id.
 
-                self._name = self.note_name_ti.text
+        Returns:
+            True if it was the last one queued."""
+
+        left = app_variables.writing.pop(note_id) - 1
+
+        if left:
+            app_variables.writing[note_id] = left
+
+        return not left
 
-            if app_variables.active_note is None:  # If we're adding a new note
+    def save_failed(self, note_id, counted, error):
+        """Counts off a save that raised, and logs it."""
 
-                # Add note to database
-                note_manager.new_obj(self._name,
-                                     self.notebody_textinput.text.strip(),
-                                     app_variables.active_notebook)
+        if counted:
+            self.written(note_id)
+
+        Logger.error("EditNote: saving note %s failed", note_id,
+                     exc_info=error)
+
+    def saved(self, row, body, counted=False):
+        """Puts a finished save into the note list, on the UI thread.
+
+        Args:
+            row: The saved note's metadata row.
+            body: The body saved, None for a chunk of a large note.
+            counted: True if writing() counted the save."""
 
-            else:  # If we're editing an existing
+        pending = self._note_id
 
-                note_manager.update_obj(app_variables.active_note,
-                                        name=self._name,
-                                        data=self.notebody_textinput.text)
+        # Still editing a note whose creation has now finished
+        if (isinstance(pending, Future) and pending.done() and
+                pending.exception() is None):
+            self._note_id = app_variables.active_note = pending.result()[0]
+
+        # Update note list
+        app_variables.notes.insert(row)
+
+        # Another save of the note is still queued, its body is newer
+        queued = (not self.written(row[0]) if counted
+                  else row[0] in app_variables.writing)
+
+        if body is None or queued:
+            app_variables.bodies.discard(row[0])
+        else:
+            app_variables.bodies.put(row[0], row[2], body)
+
+        if sm.current == 'notebook':
+            sm.current_screen.update_widgets()
+
+    def save(self, *args):
+        """Save the note, without waiting for the write."""
 
-            self.note_name_ti.text = ''
-            self.notebody_textinput.text = ''
+        self._autosave_trigger.cancel()
+        self.autosave()
 
-            # Update note list
-            app_variables.notes = note_manager.load()
+        # Done with this note, clearing the inputs isn't an edit
+        self._saved = None
+        self._note_id = None
+        self.note_name_ti.text = ''
+        self.notebody_textinput.text = ''
+        self.show_chunk_bar(None)
 
     def load(self, *args):
         """
@@ -618,34 +1477,166 @@ class EditNoteScreen(Screen):
         solution.
         """
 
-        if app_variables.active_note is not None:
+        note_id = self._note_id = app_variables.active_note
 
-            # Fill the TextInputs with the note data
-            self.note_name_ti.text = app_variables.get_note_obj(
-                app_variables.active_note)[1]
-            self.notebody_textinput.text = app_variables.get_note_obj(
-                app_variables.active_note)[3]
+        self.note_name_ti.text = ''
+        self.notebody_textinput.text = ''
+
+        if note_id is None:  # New note
+
+            self._saved = self.note_contents()
 
         else:
+            row = app_variables.get_note_obj(note_id)
+
+            if row is not None and row[4] >= chunks.THRESHOLD:
+                self.load_chunk(note_id, 0)
+                return
+
+            body = app_variables.bodies.get(note_id, row and row[2])
 
-            self.note_name_ti.text = ''  # New note
-            self.notebody_textinput.text = ''
+            if body is not None:  # Opened recently and unchanged since
+                self.loaded(note_id, row[:3] + (body,) + row[3:])
+                return
+
+            # Placeholder until the note is read
+            self._saved = None
+            self.notebody_textinput.disabled = True
+            self.notebody_textinput.hint_text = "Loading..."
+
+            async_note_manager.get_row(
+                note_id, callback=lambda row: self.loaded(note_id, row))
+
+    def loaded(self, note_id, row):
+        """Fills the TextInputs once the note is read.
+
+        Args:
+            note_id: The note that was requested.
+            row: Its full row, body included."""
+
+        app_variables.bodies.put(note_id, row[2], row[3] or '')
+
+        if self._note_id != note_id or sm.current != 'editnote':
+            return  # Left the note while it was loading
+
+        self.note_name_ti.text = row[1]
+        self.notebody_textinput.text = row[3] or ''
+        self.notebody_textinput.hint_text = "Enter note body"
+        self.notebody_textinput.disabled = False
+
+        self._saved = self.note_contents()
+
+    def load_chunk(self, note_id, index):
+        """Reads a chunk of a large note to show in place of the body.
+
+        Args:
+            note_id: The note being edited.
+            index: The chunk to show."""
+
+        self._saved = None
+        self.notebody_textinput.disabled = True
+        self.notebody_textinput.hint_text = "Loading..."
+
+        async_note_manager.submit(
+            open_chunk, note_id, index,
+            callback=lambda result: self.chunk_loaded(note_id, index,
+                                                      result))
+
+    def chunk_loaded(self, note_id, index, result):
+        """Shows a chunk once it's read.
+
+        Args:
+            note_id: The note that was requested.
+            index: The chunk that was requested.
+            result: (metadata row, number of chunks, chunk) from
+                open_chunk()."""
+
+        if self._note_id != note_id or sm.current != 'editnote':
+            return  # Left the note while it was loading
+
+        row, count, chunk = result
+
+        if chunk is None:  # Too small to chunk after all, load it whole
+            self.show_chunk_bar(None)
+            async_note_manager.get_row(
+                note_id, callback=lambda row: self.loaded(note_id, row))
+            return
+
+        self._chunk_count = count
+        self.show_chunk_bar(index)
+
+        self.note_name_ti.text = row[1]
+        self.notebody_textinput.text = chunk
+        self.notebody_textinput.hint_text = "Enter note body"
+        self.notebody_textinput.disabled = False
+        self.body_scroll.scroll_y = 1
+
+        self._saved = self.note_contents()
+
+    def move_chunk(self, step):
+        """Saves the chunk shown and shows the one step chunks away.
+
+        Args:
+            step: -1 for the previous chunk, 1 for the next."""
+
+        if self._chunk is None or self._saved is None:
+            return  # Not chunked, or still loading
+
+        index = self._chunk + step
+
+        if not 0 <= index < self._chunk_count:
+            return
+
+        self._autosave_trigger.cancel()
+        self.autosave()  # Queued before the read, which sees it
+        self.load_chunk(self._note_id, index)
+
+    def show_chunk_bar(self, index):
+        """Shows which chunk is being edited, or hides the bar.
+
+        Args:
+            index: The chunk shown, None when the note isn't chunked."""
+
+        self._chunk = index
+
+        if index is None:
+
+            if self.chunk_bar.parent is not None:
+                self.note_container.remove_widget(self.chunk_bar)
+            return
+
+        self.chunk_lbl.text = f"Part {index + 1} of {self._chunk_count}"
+
+        if self.chunk_bar.parent is None:
+            self.note_container.add_widget(self.chunk_bar)
 
     def delete(self, *args):
         """Deletes Note."""
 
-        if app_variables.active_note is not None:  # If this isn't a new note
+        self._autosave_trigger.cancel()
+        note_id = self._note_id
+        self._saved = None  # Nothing left to save when leaving
 
-            note_manager.delete(app_variables.active_note)
+        if note_id is not None:  # If this note was ever saved
 
-            app_variables.notes = note_manager.load()
+            async_note_manager.submit(delete_note, note_id,
+                                      callback=self.deleted)
             app_variables.active_note = None
 
-            # Hacky workaround to deal with save method
-            self.notebody_textinput.text = ''
-
         sm.current = 'notebook'
 
+    def deleted(self, note_id):
+        """Takes a deleted note out of the note list, on the UI thread.
+
+        Args:
+            note_id: The id of the deleted note."""
+
+        app_variables.notes.remove(note_id)
+        app_variables.bodies.discard(note_id)
+
+        if sm.current == 'notebook':
+            sm.current_screen.update_widgets()
+
     def textinput_height(self, *args):
 
         max_var = max(self.notebody_textinput.minimum_height,
@@ -653,7 +1644,122 @@ class EditNoteScreen(Screen):
         self.notebody_textinput.height = max_var
 
 
-class SettingsScreen(Screen):
+class SearchScreen(TimedScreen):
+    """Screen for full text search over every note, results update while
+    typing and open the note when selected."""
+
+    # Snippet match markers, swapped for markup after escaping the snippet
+    marks = ("\x02", "\x03")
+
+    def __init__(self, **kwargs):
+        super(SearchScreen, self).__init__(**kwargs)
+
+        # Container------------------------------------------------------------
+        screen_container = BoxLayout(orientation="vertical",
+                                     spacing=5)
+
+        # *Top Bar-------------------------------------------------------------
+
+        #       Back Button
+        back_btn = Button(text="<-")
+        back_btn.bind(on_release=self.back)
+
+        screen_container.add_widget(TopBar(back_btn))
+
+        # *Search Entry--------------------------------------------------------
+        self.query_ti = custom_text_input(hint_text="Search... (word* for "
+                                                    "prefixes)",
+                                          multiline=False,
+                                          size_hint=(1, .085),
+                                          padding=(10, 10))
+        self.query_ti.bind(text=self.update_results)
+        screen_container.add_widget(self.query_ti)
+
+        # *Results-------------------------------------------------------------
+        self.results = BoxLayout(size_hint_y=None,
+                                 orientation='vertical',
+                                 spacing=2)
+        self.results.bind(minimum_height=self.results.setter('height'))
+
+        #       Make scrollable
+        results_scroll = ScrollView(size_hint=(1, 1),
+                                    bar_color=app_settings.text_color,
+                                    bar_pos_y='right')
+        results_scroll.add_widget(self.results)
+        screen_container.add_widget(results_scroll)
+
+        # Pack
+        self.add_widget(screen_container)
+
+        self.bind(on_enter=self.update_results)
+
+    def back(self, *args):
+        """Method for back button, clears the search."""
+
+        self.query_ti.text = ''
+        sm.current = 'menu'
+
+    def open_note(self, result):
+        """Opens a search result in the Edit Note screen.
+
+        Args:
+            result: The (id, name, parent_id, snippet) search result."""
+
+        app_variables.active_notebook = result[2]
+        app_variables.active_note = result[0]
+        sm.current = 'editnote'
+
+    def update_results(self, *args):
+        """Runs the search and shows a button per result."""
+
+        query = self.query_ti.text
+
+        if not query.strip():
+            self.results.clear_widgets()
+            return
+
+        async_note_manager.search(
+            query, marks=self.marks,
+            callback=lambda results: self.show_results(query, results))
+
+    def show_results(self, query, results):
+        """Shows a button per result, unless the query changed since.
+
+        Args:
+            query: The text searched for.
+            results: The search results for it."""
+
+        if query != self.query_ti.text:
+            return
+
+        self.results.clear_widgets()
+
+        if not results:
+            self.results.add_widget(Label(text="No matching notes",
+                                          size_hint=(1, None)))
+
+        for result in results:
+
+            snippet = escape_markup(result[3].replace("\n", " "))
+            snippet = snippet.replace(self.marks[0], "[b]")
+            snippet = snippet.replace(self.marks[1], "[/b]")
+
+            result_btn = Button(text=escape_markup(result[1]) + "\n" +
+                                snippet,
+                                markup=True,
+                                halign='center',
+                                size_hint=(1, None),
+                                height=60,
+                                background_normal='',
+                                background_color=app_settings.textinput_color,
+                                color=app_settings.text_color)
+            result_btn.bind(on_release=lambda button, result=result:
+                            self.open_note(result))
+
+            self.results.add_widget(result_btn)
+
+
+class SettingsScreen(TimedScreen):
     """A screen for editing the App Settings."""
 
     def __init__(self, **kwargs):
@@ -695,9 +1801,9 @@ class SettingsScreen(Screen):
                               color=app_settings.text_color,
                               size_hint=(1, .15))
 
-        self.primary_ti = CustomTextInput(text=str(app_settings.text_color),
-                                          multiline=False,
-                                          size_hint=(1, .15))
+        self.primary_ti = custom_text_input(text=str(app_settings.text_color),
+                                            multiline=False,
+                                            size_hint=(1, .15))
 
         #       Bind
         self.settings_cntnr.add_widget(primary_label)
@@ -707,9 +1813,9 @@ class SettingsScreen(Screen):
         secondary_label = Label(text='App Background Color: ',
                                 color=app_settings.text_color,
                                 size_hint=(1, .15))
-        self.secondary_ti = CustomTextInput(text=str(bg_color),
-                                            multiline=False,
-                                            size_hint=(1, .15))
+        self.secondary_ti = custom_text_input(text=str(bg_color),
+                                              multiline=False,
+                                              size_hint=(1, .15))
         #       Bind
         self.settings_cntnr.add_widget(secondary_label)
         self.settings_cntnr.add_widget(self.secondary_ti)
@@ -718,13 +1824,40 @@ class SettingsScreen(Screen):
         tertiary_label = Label(text='Input Color: ',
                                color=app_settings.text_color,
                                size_hint=(1, .15))
-        self.tertiary_ti = CustomTextInput(text=str(textinput_color),
-                                           multiline=False,
-                                           size_hint=(1, .15))
+        self.tertiary_ti = custom_text_input(text=str(textinput_color),
+                                             multiline=False,
+                                             size_hint=(1, .15))
         #       Bind
         self.settings_cntnr.add_widget(tertiary_label)
         self.settings_cntnr.add_widget(self.tertiary_ti)
 
+        # *Profiles------------------------------------------------------------
+        #       Current profile, pressed to switch to the next one
+        profile_label = Label(text='Notes: ',
+                              color=app_settings.text_color,
+                              size_hint=(1, .15))
+        self.profile_btn = Button(text=app_settings.profile,
+                                  background_normal='',
+                                  background_color=textinput_color,
+                                  color=app_settings.text_color,
+                                  size_hint=(1, .15))
+        self.profile_btn.bind(on_release=self.next_profile)
+        #       Bind
+        self.settings_cntnr.add_widget(profile_label)
+        self.settings_cntnr.add_widget(self.profile_btn)
+
+        #       New profile, a database file or a notes directory--------------
+        new_profile_label = Label(text='Add Notes: ',
+                                  color=app_settings.text_color,
+                                  size_hint=(1, .15))
+        self.new_profile_ti = custom_text_input(hint_text='path/to/notes.db',
+                                                multiline=False,
+                                                size_hint=(1, .15))
+        self.new_profile_ti.bind(on_text_validate=self.add_profile)
+        #       Bind
+        self.settings_cntnr.add_widget(new_profile_label)
+        self.settings_cntnr.add_widget(self.new_profile_ti)
+
         # *Buffer------------------------------------------------------------
         self.settings_cntnr.add_widget(Label())
 
@@ -751,6 +1884,34 @@ class SettingsScreen(Screen):
         self.save()
         sm.current = 'menu'
 
+    def next_profile(self, *args):
+        """Switches to the next of the profiles' notes."""
+
+        profiles = list(app_settings.profiles)
+        self.switch_profile(profiles[(profiles.index(app_settings.profile)
+                                      + 1) % len(profiles)])
+
+    def add_profile(self, *args):
+        """Adds the entered database or directory as a profile and
+        switches to it."""
+
+        location = self.new_profile_ti.text.strip()
+
+        if not location:
+            return
+
+        self.new_profile_ti.text = ''
+        self.switch_profile(app_settings.add_profile(location))
+
+    def switch_profile(self, name):
+        """Opens a profile's notes, right away."""
+
+        if name != app_settings.profile:
+            App.get_running_app().switch_profile(name)
+
+        self.profile_btn.text = name
+        self.msg_lbl.text = f'Notes: {app_settings.storage()[1] or name}'
+
     def set_default(self, *args):
         """Reverts color fields to default."""
 
@@ -802,27 +1963,187 @@ class SettingsScreen(Screen):
 app_settings = Settings()
 app_variables = AppVariables()
 
-# Screen Manager object manages which screen is visible
-sm = ScreenManager(transition=NoTransition())
-screens = [MenuScreen(name='menu'),
-           NotebookScreen(name='notebook'),
-           NewNotebookScreen(name='newnotebook'),
-           EditNoteScreen(name="editnote"),
-           SettingsScreen(name="settings")]
+# Screen Manager object manages which screen is visible, each is built
+# when first shown
+sm = LazyScreenManager(transition=NoTransition())
+screens = {'menu': MenuScreen,
+           'notebook': NotebookScreen,
+           'newnotebook': NewNotebookScreen,
+           "editnote": EditNoteScreen,
+           "search": SearchScreen,
+           "settings": SettingsScreen}
+
+for name, screen_class in screens.items():
+    sm.add_screen_class(name, screen_class)
 
-for screen in screens:
-    sm.add_widget(screen)
+import_time = time.perf_counter() - _import_start
 
 
 class NoteApp(App):
     """Represents the application itself, Window settings modified here."""
 
     def build(self):
+        # Queued first, every note_manager call made by the screens runs
+        # after it
+        self.storage = async_note_manager.submit(
+            open_storage, *app_settings.storage())
+
         # I don't want a white window background
         Window.clearcolor = app_settings.window_color
         Window.size = (500, 550)  # Set window size
+
+        if STARTUP_TIMES:
+            Window.bind(on_flip=self.first_frame)
+
+        if instrumentation.ENABLED:
+            self.metrics_overlay = None
+            Window.bind(on_key_down=self.toggle_metrics)
+
+        # Storage maintenance, run a step at a time while nobody is
+        # using the app
+        self.last_input = time.monotonic()
+        self.maintenance = None  # The note_manager.maintain() run going
+        self.maintenance_step = None  # Future of the step on the worker
+
+        if app_settings.idle_minutes > 0:
+            Window.bind(on_touch_down=self.user_active,
+                        on_key_down=self.user_active)
+            Clock.schedule_interval(self.check_idle, 30)
+
+        sm.current = 'menu'
         return sm  # Return screen manager, runs app
 
+    def first_frame(self, *args):
+        """Prints the startup times once the first frame is drawn, then
+        quits. Only bound with NOTE_STARTUP_TIMES set."""
+
+        Window.unbind(on_flip=self.first_frame)
+        first_frame = time.perf_counter() - _import_start
+
+        times = {"import": import_time,
+                 "open storage": self.storage.result(),
+                 "first frame": first_frame}
+
+        for name, seconds in times.items():
+            print(f"    {name:<16}{seconds * 1000:>10,.1f} ms",
+                  file=sys.stderr)
+
+        self.stop()
+
+    def toggle_metrics(self, window, key, *args):
+        """Shows or hides the instrumentation stats on F12."""
+
+        if key != 293:  # F12
+            return False
+
+        if self.metrics_overlay is None:
+            self.metrics_overlay = MetricsOverlay()
+            Window.add_widget(self.metrics_overlay)
+
+        else:
+            self.metrics_overlay.refresh_event.cancel()
+            Window.remove_widget(self.metrics_overlay)
+            self.metrics_overlay = None
+
+        return True
+
+    def user_active(self, *args):
+        """Notes the time of the latest touch or key press, which still
+        reaches the widgets."""
+
+        self.last_input = time.monotonic()
+
+    def is_idle(self):
+        """True once there's been no input for Idle Minutes"""
+
+        return (time.monotonic() - self.last_input >=
+                app_settings.idle_minutes * 60)
+
+    def check_idle(self, *args):
+        """Starts or resumes storage maintenance if the app is idle and
+        it's due. A run stops between steps as soon as the user is back,
+        and carries on from there the next time the app is idle."""
+
+        if self.maintenance_step is not None or not self.is_idle():
+            return
+
+        if self.maintenance is None:
+            due = (app_settings.last_maintenance +
+                   app_settings.maintenance_hours * 60 * 60)
+
+            if time.time() < due or not self.storage.done():
+                return
+
+            self.maintenance = note_manager.maintain()
+
+        self.maintenance_step = async_note_manager.submit(
+            next, self.maintenance, callback=self.maintenance_stepped,
+            errback=self.maintenance_failed)
+
+    def maintenance_stepped(self, result):
+        """Runs the next maintenance step while still idle, and records
+        the run once done."""
+
+        self.maintenance_step = None
+        step, report = result
+
+        if self.maintenance is None:  # Dropped by switch_profile()
+            return
+
+        if step != "done":
+            self.check_idle()
+            return
+
+        self.maintenance = None
+        app_settings.maintained(int(time.time()))
+
+        if report["integrity"] != ["ok"]:
+            Logger.warning("Maintenance: integrity check failed, storage "
+                           "left as it was: %s",
+                           "; ".join(report["integrity"]))
+            return
+
+        Logger.info("Maintenance: %s orphans removed, %.1f MB -> %.1f MB",
+                    report["orphans"],
+                    report["before"]["file_bytes"] / 2 ** 20,
+                    report["after"]["file_bytes"] / 2 ** 20)
+
+    def maintenance_failed(self, error):
+        """Drops a run that raised, it's retried once it's due again."""
+
+        Logger.error("Maintenance: step failed", exc_info=error)
+        self.maintenance = self.maintenance_step = None
+        # Not saved, the next start of the app tries again
+        app_settings.last_maintenance = int(time.time())
+
+    def switch_profile(self, name):
+        """Opens another profile's notes in place of the current ones.
+
+        The caches start over empty and the menu reloads them when next
+        shown. Queued on the worker behind the calls already made, so
+        those still go to the store they were made for."""
+
+        app_settings.set_profile(name)
+        app_variables.notes.load(())
+        app_variables.notes_loaded = False
+        app_variables.bodies.clear()
+        app_variables.active_notebook = None
+        app_variables.active_note = None
+        # A maintenance run belongs to the store it started on
+        self.maintenance = None
+
+        self.storage = async_note_manager.submit(
+            open_storage, *app_settings.storage())
+
+    def on_stop(self):
+        # Save the open note, and wait for pending writes before closing
+        # the storage backend
+        if sm.current == 'editnote':
+            sm.current_screen.save()
+
+        async_note_manager.shutdown()
+        note_manager.close_all()
+
 
 if __name__ == '__main__':
     NoteApp().run()
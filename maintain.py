@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Checks a database for damage and returns its free space to the disk.
+
+Usage:
+
+    python3 Note/maintain.py [--db PATH] [--vacuum-pages PAGES]
+
+Runs note_manager.maintain(): an integrity check, then removing orphans,
+ANALYZE and an incremental VACUUM, and prints the size before and after.
+Nothing is written if the check finds problems, which are printed and
+exit with status 1. The app runs the same steps by itself while idle.
+
+"""
+
+import argparse
+import sys
+
+import connection_manager
+
+
+def describe(stats):
+    """Formats a maintain() report's before or after sizes"""
+
+    text = f"{stats['file_bytes'] / 2 ** 20:,.1f} MB on disk"
+
+    if "pages" in stats:
+        text += (f", {stats['pages']:,} pages of {stats['page_size']:,} "
+                 f"bytes, {stats['free_pages']:,} free")
+    else:
+        text += f", {stats['files']:,} files"
+
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db",
+                        help="the database, defaults to $NOTE_DB or notes.db")
+    parser.add_argument("--vacuum-pages", type=int, default=1000,
+                        help="free pages to return to the disk per step")
+    args = parser.parse_args()
+
+    connection_manager.configure(path=args.db)
+
+    import note_manager
+
+    note_manager.init_db()
+
+    try:
+        for step, report in note_manager.maintain(args.vacuum_pages):
+            print(f"\r{step:<20}", end="", file=sys.stderr)
+
+        print(file=sys.stderr)
+
+        if report["integrity"] != ["ok"]:
+            print("integrity check failed, nothing was changed:")
+            print("\n".join(report["integrity"]))
+            sys.exit(1)
+
+        print(f"removed {report['orphans']:,} orphans")
+        print(f"before: {describe(report['before'])}")
+        print(f"after:  {describe(report['after'])}")
+
+    finally:
+        connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
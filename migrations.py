@@ -0,0 +1,338 @@
+"""Versioned schema migrations for notes.db
+
+The schema version is kept in PRAGMA user_version. MIGRATIONS[n] upgrades
+a database at version n to version n + 1, so a new migration is only ever
+appended to the list.
+"""
+
+import query_manager
+
+
+def _v1_indexed_schema(conn):
+    """Integer timestamps, a size column and parent_id indexes.
+
+    Version 0 is the original schema (or no database at all), whose
+    last_modified column holds str(datetime.datetime.now()) text."""
+
+    legacy = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master "
+        "WHERE type='table' AND name='note_objs'").fetchone()[0]
+
+    if legacy:
+        conn.execute("ALTER TABLE note_objs RENAME TO note_objs_v0")
+
+    conn.execute("""CREATE TABLE note_objs (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        last_modified INTEGER NOT NULL,
+        data BLOB,
+        parent_id INT,
+        size INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(parent_id) REFERENCES note_objs(id)
+        ON DELETE CASCADE
+    )""")
+
+    if legacy:
+        # Old timestamps are local time, falling back to now if unparsable
+        conn.execute("""INSERT INTO note_objs(
+            id, name, last_modified, data, parent_id, size)
+            SELECT id, name,
+                   COALESCE(CAST(strftime('%s', last_modified, 'utc')
+                                 AS INTEGER),
+                            CAST(strftime('%s', 'now') AS INTEGER)),
+                   data, parent_id, COALESCE(length(CAST(data AS BLOB)), 0)
+            FROM note_objs_v0""")
+        conn.execute("DROP TABLE note_objs_v0")
+
+    else:
+        conn.execute("INSERT INTO note_objs("
+                     "name, last_modified, data, parent_id, size) "
+                     "VALUES ('My Notes', CAST(strftime('%s', 'now') "
+                     "AS INTEGER), 'Notebook', NULL, 8)")
+
+    conn.execute("CREATE INDEX note_objs_parent ON note_objs(parent_id)")
+    conn.execute("CREATE INDEX note_objs_parent_modified "
+                 "ON note_objs(parent_id, last_modified)")
+
+
+def _v2_separate_bodies(conn):
+    """Moves note bodies into note_bodies, so listing metadata from
+    note_objs never reads them."""
+
+    conn.execute("ALTER TABLE note_objs RENAME TO note_objs_v1")
+
+    conn.execute("""CREATE TABLE note_objs (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        last_modified INTEGER NOT NULL,
+        parent_id INT,
+        size INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(parent_id) REFERENCES note_objs(id)
+        ON DELETE CASCADE
+    )""")
+    conn.execute("""CREATE TABLE note_bodies (
+        id INTEGER PRIMARY KEY REFERENCES note_objs(id) ON DELETE CASCADE,
+        data BLOB
+    )""")
+
+    conn.execute("INSERT INTO note_objs(id, name, last_modified, parent_id, "
+                 "size) SELECT id, name, last_modified, parent_id, size "
+                 "FROM note_objs_v1")
+    conn.execute("INSERT INTO note_bodies(id, data) "
+                 "SELECT id, data FROM note_objs_v1")
+    conn.execute("DROP TABLE note_objs_v1")
+
+    conn.execute("CREATE INDEX note_objs_parent ON note_objs(parent_id)")
+    conn.execute("CREATE INDEX note_objs_parent_modified "
+                 "ON note_objs(parent_id, last_modified)")
+
+    # Foreign keys are off, so bodies follow their row out by trigger
+    conn.execute("""CREATE TRIGGER note_objs_delete_body
+        AFTER DELETE ON note_objs BEGIN
+            DELETE FROM note_bodies WHERE id = old.id;
+        END""")
+
+
+def _v3_search_index(conn):
+    """Full text index over note names and bodies, kept in sync by
+    triggers on note_objs and note_bodies."""
+
+    conn.execute("CREATE VIRTUAL TABLE note_search USING fts5(name, data)")
+
+    conn.execute("INSERT INTO note_search(rowid, name, data) "
+                 "SELECT o.id, o.name, b.data FROM note_objs o "
+                 "JOIN note_bodies b ON b.id = o.id")
+
+    # new_obj inserts the note_objs row first, then its body
+    conn.execute("""CREATE TRIGGER note_search_insert
+        AFTER INSERT ON note_bodies BEGIN
+            INSERT INTO note_search(rowid, name, data)
+            SELECT new.id, name, new.data FROM note_objs WHERE id = new.id;
+        END""")
+    conn.execute("""CREATE TRIGGER note_search_update_data
+        AFTER UPDATE OF data ON note_bodies BEGIN
+            UPDATE note_search SET data = new.data WHERE rowid = new.id;
+        END""")
+    conn.execute("""CREATE TRIGGER note_search_update_name
+        AFTER UPDATE OF name ON note_objs BEGIN
+            UPDATE note_search SET name = new.name WHERE rowid = new.id;
+        END""")
+    conn.execute("""CREATE TRIGGER note_search_delete
+        AFTER DELETE ON note_objs BEGIN
+            DELETE FROM note_search WHERE rowid = old.id;
+        END""")
+
+
+def _v4_remove_orphans(conn):
+    """Deletes grandchildren orphaned by delete() before it was recursive,
+    so they stop being scanned and searched."""
+
+    conn.execute(query_manager.DELETE_ORPHANS)
+    conn.execute(query_manager.DELETE_ORPHAN_BODIES)
+
+
+def _v5_notebook_flag(conn):
+    """Marks notebooks explicitly, so they can nest inside each other.
+
+    Until now a notebook was anything at the top level (parent_id 0, or
+    the NULL parented root) or anything with children."""
+
+    conn.execute("ALTER TABLE note_objs "
+                 "ADD COLUMN is_notebook INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE note_objs SET is_notebook = 1 "
+                 "WHERE parent_id IS NULL OR parent_id = 0 OR id IN ("
+                 "SELECT parent_id FROM note_objs "
+                 "WHERE parent_id IS NOT NULL)")
+    # Small partial index, for leaving notebooks out of search results
+    conn.execute("CREATE INDEX note_objs_notebooks ON note_objs(id) "
+                 "WHERE is_notebook")
+
+
+def _v6_body_codec(conn):
+    """Records how each body is stored, so big ones can be compressed.
+
+    The search index can't read compressed bodies, so its triggers only
+    handle plain ones and note_manager indexes the rest itself."""
+
+    conn.execute("ALTER TABLE note_bodies ADD COLUMN codec TEXT")
+
+    conn.execute("DROP TRIGGER note_search_insert")
+    conn.execute("DROP TRIGGER note_search_update_data")
+    conn.execute("""CREATE TRIGGER note_search_insert
+        AFTER INSERT ON note_bodies WHEN new.codec IS NULL BEGIN
+            INSERT INTO note_search(rowid, name, data)
+            SELECT new.id, name, new.data FROM note_objs WHERE id = new.id;
+        END""")
+    conn.execute("""CREATE TRIGGER note_search_update_data
+        AFTER UPDATE OF data ON note_bodies WHEN new.codec IS NULL BEGIN
+            UPDATE note_search SET data = new.data WHERE rowid = new.id;
+        END""")
+
+
+def _v7_revisions(conn):
+    """History of note bodies, a full snapshot followed by deltas against
+    each previous version (see the revisions module)."""
+
+    conn.execute("""CREATE TABLE note_revisions (
+        note_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        modified INTEGER NOT NULL,
+        snapshot INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB,
+        codec TEXT,
+        PRIMARY KEY (note_id, revision)
+    )""")
+
+    conn.execute("""CREATE TRIGGER note_objs_delete_revisions
+        AFTER DELETE ON note_objs BEGIN
+            DELETE FROM note_revisions WHERE note_id = old.id;
+        END""")
+
+
+def _v8_sync_log(conn):
+    """Change tracking for syncing replicas of a database (see the sync
+    module), kept current by triggers on note_objs.
+
+    note_sync gives every note a uid shared by all replicas and a version
+    counter, and keeps a tombstone (id NULL) once the note is deleted.
+    note_oplog lists changed notes in order, only the latest change of
+    each. Existing notes get random uids like new ones. Databases made
+    apart can hold different notes with the same id and name, which
+    mustn't sync as one note, so copies of one database made before this
+    migration sync as separate notes too."""
+
+    conn.execute("CREATE TABLE sync_meta (replica TEXT NOT NULL)")
+    conn.execute("INSERT INTO sync_meta VALUES (lower(hex(randomblob(8))))")
+    # How far each peer has been synced, in our seq (sent) and theirs
+    conn.execute("""CREATE TABLE sync_peers (
+        peer TEXT PRIMARY KEY,
+        sent INTEGER NOT NULL DEFAULT 0,
+        received INTEGER NOT NULL DEFAULT 0
+    )""")
+    conn.execute("""CREATE TABLE note_sync (
+        uid TEXT PRIMARY KEY,
+        id INTEGER UNIQUE,
+        version INTEGER NOT NULL,
+        modified INTEGER NOT NULL,
+        origin TEXT NOT NULL
+    )""")
+    conn.execute("""CREATE TABLE note_oplog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid TEXT NOT NULL,
+        op TEXT NOT NULL
+    )""")
+    conn.execute("CREATE INDEX note_oplog_uid ON note_oplog(uid)")
+
+    # The root is the same note everywhere
+    conn.execute("""INSERT INTO note_sync(uid, id, version, modified, origin)
+        SELECT CASE WHEN id = (SELECT MIN(id) FROM note_objs
+                               WHERE parent_id IS NULL) THEN 'root'
+               ELSE lower(hex(randomblob(8)))
+               END, id, 1, last_modified, ''
+        FROM note_objs ORDER BY id""")
+    conn.execute("INSERT INTO note_oplog(uid, op) "
+                 "SELECT uid, 'put' FROM note_sync ORDER BY id")
+
+    conn.execute("""CREATE TRIGGER note_oplog_supersede
+        AFTER INSERT ON note_oplog BEGIN
+            DELETE FROM note_oplog WHERE uid = new.uid AND seq < new.seq;
+        END""")
+    # sync inserts the note_sync row first for notes it brings over, with
+    # the uid they already have
+    conn.execute("""CREATE TRIGGER note_objs_sync_insert
+        AFTER INSERT ON note_objs BEGIN
+            INSERT OR IGNORE INTO note_sync(uid, id, version, modified, origin)
+            VALUES (CASE WHEN new.parent_id IS NULL AND NOT EXISTS (
+                        SELECT 1 FROM note_sync WHERE uid = 'root')
+                    THEN 'root' ELSE lower(hex(randomblob(8))) END,
+                    new.id, 1, new.last_modified,
+                    (SELECT replica FROM sync_meta));
+            INSERT INTO note_oplog(uid, op)
+            SELECT uid, 'put' FROM note_sync WHERE id = new.id;
+        END""")
+    conn.execute("""CREATE TRIGGER note_objs_sync_update
+        AFTER UPDATE ON note_objs BEGIN
+            UPDATE note_sync SET version = version + 1,
+                modified = new.last_modified,
+                origin = (SELECT replica FROM sync_meta)
+            WHERE id = new.id;
+            INSERT INTO note_oplog(uid, op)
+            SELECT uid, 'put' FROM note_sync WHERE id = new.id;
+        END""")
+    # Never older than the note it deletes, so the deletion wins over it
+    conn.execute("""CREATE TRIGGER note_objs_sync_delete
+        AFTER DELETE ON note_objs BEGIN
+            INSERT INTO note_oplog(uid, op)
+            SELECT uid, 'delete' FROM note_sync WHERE id = old.id;
+            UPDATE note_sync SET id = NULL, version = version + 1,
+                modified = MAX(CAST(strftime('%s', 'now') AS INTEGER),
+                               old.last_modified),
+                origin = (SELECT replica FROM sync_meta)
+            WHERE id = old.id;
+        END""")
+
+
+def _v9_sorted_children(conn):
+    """Indexes for listing a notebook's children a page at a time by name
+    or by size, note_objs_parent_modified already covers last_modified.
+    The rowid at the end of each index entry breaks ties."""
+
+    conn.execute("CREATE INDEX note_objs_parent_name "
+                 "ON note_objs(parent_id, name COLLATE NOCASE)")
+    conn.execute("CREATE INDEX note_objs_parent_size "
+                 "ON note_objs(parent_id, size)")
+
+
+def _v10_body_chunks(conn):
+    """Chunks of large bodies (see the chunks module), in order within
+    each note, with each chunk's own size and codec."""
+
+    conn.execute("""CREATE TABLE note_chunks (
+        note_id INTEGER NOT NULL,
+        chunk INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB,
+        codec TEXT,
+        PRIMARY KEY (note_id, chunk)
+    )""")
+
+    conn.execute("""CREATE TRIGGER note_objs_delete_chunks
+        AFTER DELETE ON note_objs BEGIN
+            DELETE FROM note_chunks WHERE note_id = old.id;
+        END""")
+
+
+MIGRATIONS = [_v1_indexed_schema,
+              _v2_separate_bodies,
+              _v3_search_index,
+              _v4_remove_orphans,
+              _v5_notebook_flag,
+              _v6_body_codec,
+              _v7_revisions,
+              _v8_sync_log,
+              _v9_sorted_children,
+              _v10_body_chunks]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """Upgrades the database in place to SCHEMA_VERSION.
+
+    Each migration runs in its own transaction together with the version
+    bump, so an interrupted upgrade resumes where it stopped."""
+
+    while True:
+
+        with conn:
+            # IMMEDIATE takes the write lock before the version is read,
+            # so two processes can't both apply the same migration
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+            if version >= SCHEMA_VERSION:
+                return
+
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
@@ -0,0 +1,267 @@
+"""In-memory copy of note metadata, updated incrementally
+"""
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+import sys
+
+from note_manager import META_COLUMNS
+
+# Kinds of id in NoteCache._kinds
+_NONE, _NOTE, _NOTEBOOK = 0, 1, 2
+# parent_id None (the root) in NoteCache._parents
+_NO_PARENT = -1
+
+
+class NoteCache:
+    """Note rows indexed by id and by parent id.
+
+    Rows are in note_manager.META_COLUMNS order. Load it once from
+    note_manager.load_metadata(), then apply each write with
+    insert(), update() or remove() instead of reloading the table.
+
+    Rows aren't kept as tuples. Each column is an array indexed by id,
+    which is small and dense (sqlite's rowid), so a note costs its name
+    and 25 bytes rather than a tuple and four int objects. Tuples are
+    built as rows are asked for."""
+
+    def __init__(self, rows=()):
+        # Set by load(), one item per id up to the highest
+        self._names = self._modified = self._parents = self._sizes = None
+        self._kinds = None  # _NONE where there is no row with that id
+        self._count = 0
+        self._children = None  # parent_id -> array of child ids, in order
+        self.load(rows)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, obj_id):
+        return (obj_id is not None and 0 <= obj_id < len(self._kinds) and
+                self._kinds[obj_id] != _NONE)
+
+    def __iter__(self):
+        names, modified, parents = self._names, self._modified, self._parents
+        sizes, kinds = self._sizes, self._kinds
+
+        for obj_id, kind in enumerate(kinds):
+
+            if kind != _NONE:
+                parent_id = parents[obj_id]
+                yield (obj_id, names[obj_id], modified[obj_id],
+                       None if parent_id == _NO_PARENT else parent_id,
+                       sizes[obj_id], kind - 1)
+
+    def _row(self, obj_id):
+        """Builds the row of a cached id"""
+
+        parent_id = self._parents[obj_id]
+
+        return (obj_id, self._names[obj_id], self._modified[obj_id],
+                None if parent_id == _NO_PARENT else parent_id,
+                self._sizes[obj_id], self._kinds[obj_id] - 1)
+
+    def load(self, rows):
+        """Replaces the cache contents with the given rows"""
+
+        rows = rows if isinstance(rows, list) else list(rows)
+        size = max((row[0] for row in rows), default=-1) + 1
+
+        # Filled in one pass over preallocated columns, the cache is
+        # loaded on the UI thread
+        names = self._names = [None] * size
+        modified = self._modified = array("q", bytes(8 * size))
+        parents = self._parents = array("q", bytes(8 * size))
+        sizes = self._sizes = array("q", bytes(8 * size))
+        kinds = self._kinds = bytearray(size)
+        children = self._children = {}
+
+        for obj_id, name, last_modified, parent_id, body_size, notebook \
+                in rows:
+            names[obj_id] = name
+            modified[obj_id] = last_modified
+            parents[obj_id] = _NO_PARENT if parent_id is None else parent_id
+            sizes[obj_id] = body_size
+            kinds[obj_id] = _NOTEBOOK if notebook else _NOTE
+            siblings = children.get(parent_id)
+
+            if siblings is None:
+                siblings = children[parent_id] = array("q")
+
+            siblings.append(obj_id)
+
+        self._count = len(rows)
+
+    def get(self, obj_id):
+        """Returns the row with the given id, None if not cached"""
+
+        return self._row(obj_id) if obj_id in self else None
+
+    def children(self, parent_id):
+        """Returns the rows whose parent is parent_id"""
+
+        names, modified, sizes, kinds = (self._names, self._modified,
+                                         self._sizes, self._kinds)
+
+        return [(child_id, names[child_id], modified[child_id], parent_id,
+                 sizes[child_id], kinds[child_id] - 1)
+                for child_id in self._children.get(parent_id, ())]
+
+    def children_page(self, parent_id, order, after=None, limit=100):
+        """Returns up to limit rows whose parent is parent_id, sorted like
+        note_manager.get_children_page, starting after the (key, id)
+        cursor after"""
+
+        names, modified, sizes = self._names, self._modified, self._sizes
+
+        # Sort keys ascending in listing order, so descending ones negated
+        if order == "name":
+            def sort_key(key, child_id):
+                return key.lower(), child_id
+            keys = names
+        else:
+            def sort_key(key, child_id):
+                return -key, -child_id
+            keys = modified if order == "modified" else sizes
+
+        ordered = sorted((sort_key(keys[child_id], child_id), child_id)
+                         for child_id in self._children.get(parent_id, ()))
+        start = 0 if after is None else bisect_right(
+            ordered, (sort_key(*after), float("inf")))
+
+        return [self._row(child_id)
+                for _, child_id in ordered[start:start + limit]]
+
+    def insert(self, row):
+        """Adds a new row, or replaces the cached row with the same id"""
+
+        obj_id, name, modified, parent_id, size, notebook = row
+
+        if obj_id in self:
+            self._unlink(obj_id)
+        else:
+            self._count += 1
+
+        if obj_id >= len(self._kinds):  # Grow every column to fit
+            grow = obj_id + 1 - len(self._kinds)
+            self._names.extend([None] * grow)
+            self._modified.extend(array("q", bytes(8 * grow)))
+            self._parents.extend(array("q", bytes(8 * grow)))
+            self._sizes.extend(array("q", bytes(8 * grow)))
+            self._kinds.extend(bytes(grow))
+
+        self._names[obj_id] = name
+        self._modified[obj_id] = modified
+        self._parents[obj_id] = (_NO_PARENT if parent_id is None
+                                 else parent_id)
+        self._sizes[obj_id] = size
+        self._kinds[obj_id] = _NOTEBOOK if notebook else _NOTE
+        self._children.setdefault(parent_id, array("q")).append(obj_id)
+
+    def update(self, obj_id, **columns):
+        """Sets the given columns on a cached row.
+
+        Args:
+            obj_id: The id of the row to update.
+            columns: Column names and their new values."""
+
+        row = list(self._row(obj_id))
+
+        for column, value in columns.items():
+            row[META_COLUMNS.index(column)] = value
+
+        self.insert(tuple(row))
+
+    def remove(self, obj_id):
+        """Removes a row and all of its descendants.
+
+        Returns:
+            The ids removed."""
+
+        if obj_id not in self:
+            return []
+
+        self._unlink(obj_id)
+        self._names[obj_id] = None
+        self._kinds[obj_id] = _NONE
+        self._count -= 1
+        removed = [obj_id]
+
+        for child_id in self._children.pop(obj_id, ()):
+            removed.extend(self.remove(child_id))
+
+        return removed
+
+    def _unlink(self, obj_id):
+        """Drops obj_id from its parent's child index"""
+
+        parent_id = self._parents[obj_id]
+
+        if parent_id == _NO_PARENT:
+            parent_id = None
+
+        siblings = self._children.get(parent_id)
+
+        if siblings is not None and obj_id in siblings:
+            siblings.remove(obj_id)
+
+            if not siblings:
+                del self._children[parent_id]
+
+
+class BodyCache:
+    """Recently opened note bodies, least recently used dropped first
+    once they take more than max_bytes.
+
+    Each body is kept with the last_modified it was read or saved at,
+    get() ignores it once the note's metadata says it changed since."""
+
+    def __init__(self, max_bytes=16 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()  # id -> (last_modified, body, bytes)
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get(self, obj_id, modified):
+        """Returns the body of obj_id as of modified, None if not cached"""
+
+        entry = self._bodies.get(obj_id)
+
+        if entry is None or entry[0] != modified:
+            return None
+
+        self._bodies.move_to_end(obj_id)
+
+        return entry[1]
+
+    def put(self, obj_id, modified, body):
+        """Caches the body of obj_id as of modified"""
+
+        self.discard(obj_id)
+        size = sys.getsizeof(body)
+
+        if size > self.max_bytes:  # Would push out everything else
+            return
+
+        self._bodies[obj_id] = (modified, body, size)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            self._bytes -= self._bodies.popitem(last=False)[1][2]
+
+    def discard(self, obj_id):
+        """Forgets the body of obj_id, if cached"""
+
+        entry = self._bodies.pop(obj_id, None)
+
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self):
+        """Forgets every body"""
+
+        self._bodies.clear()
+        self._bytes = 0
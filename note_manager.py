@@ -1,163 +1,454 @@
-"""Interfaces with the sqlite database
+"""Interfaces with the note storage backend
+
+Every function here is passed on to the configured backend, a module
+implementing them all:
+
+    sqlite: sqlite_backend on a database file (the default, notes.db)
+    memory: sqlite_backend on an in-memory database, for tests and
+        benchmarks
+    files: file_backend, one file per note in a directory, for huge notes
+
+Nothing is opened on import, call init_db() first, after configure() to
+pick another backend. configure() again switches to another store, the
+ones opened before stay open until close_all().
 """
 
-import sqlite3
-import datetime
+import importlib
+import inspect
+import itertools
+import time
 
+import instrumentation
 
-def init_db():
-    """Creates database file and schema if necessary"""
-
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
-
-    with conn:
-
-        c.execute(
-            "SELECT COUNT(*) FROM sqlite_master "
-            "WHERE type='table' AND name='note_objs';")
-
-        exists = c.fetchall()[0][0]
-        current_time = datetime.datetime.now()
-
-        if not exists:
-
-            c.execute("""CREATE TABLE note_objs (
-               id INTEGER PRIMARY KEY,
-               name VARCHAR(100) NOT NULL,
-               last_modified VARCHAR(100),
-               data BLOB,
-               parent_id INT, 
-               FOREIGN KEY(parent_id) REFERENCES note_objs(id) 
-               ON DELETE CASCADE
-            );""")
-
-            c.execute(f"""INSERT INTO note_objs(
-            name, 
-            last_modified, 
-            data, 
-            parent_id) 
-            VALUES (
-            'My Notes', 
-            '{current_time}', 
-            'Notebook', 
-            NULL);""")
-
-
-def new_obj(name, data, parent_nb, modified=str(datetime.datetime.now())):
-    """Create a new note object inside the provided notebook"""
-
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
+# Column order of the rows returned by get_row, get_children and load,
+# last_modified is in epoch seconds and size is the body length in bytes
+COLUMNS = ("id", "name", "last_modified", "data", "parent_id", "size",
+           "is_notebook")
+# Column order of the *_metadata and tree rows, which leave the body out
+META_COLUMNS = ("id", "name", "last_modified", "parent_id", "size",
+                "is_notebook")
+# get_children_page orders -> the META_COLUMNS column sorted on, names
+# come first to last ignoring case, times and sizes largest first
+CHILDREN_ORDERS = {"name": "name", "modified": "last_modified",
+                   "size": "size"}
+
+# Backend name -> (module, configure() keyword arguments)
+BACKENDS = {"sqlite": ("sqlite_backend", {}),
+            "memory": ("sqlite_backend", {"memory": True}),
+            "files": ("file_backend", {})}
+
+BACKEND = "sqlite"
+_backend = None
+# Every backend module configured so far, for close_all()
+_backends = set()
+
+
+# Helpers shared by the backends ---------------------------------------------
+def now():
+    """Returns the current time as integer epoch seconds"""
+
+    return int(time.time())
+
+
+def body_size(data):
+    """Returns the size of a note body in bytes"""
+
+    if data is None:
+        return 0
+
+    if isinstance(data, str):
+        return len(data.encode())
+
+    return len(data)
+
+
+def check_name(name):
+    """Raises ValueError for names sqlite reserves"""
 
     if "sqlite_" in name.lower():
         raise ValueError("sqlite_ is reserved for internal use.")
 
-    with conn:
-        c.execute(f"""INSERT INTO note_objs(
-        name, 
-        last_modified, 
-        data, 
-        parent_id) 
-        VALUES (
-        '{name}', 
-        '{modified}', 
-        '{data}', 
-        '{parent_nb}');""")
 
-    conn.commit()
-    conn.close()
+def batches(iterable, size=1000):
+    """Yields lists of up to size items from iterable"""
 
+    iterator = iter(iterable)
 
-def update_obj(obj_id, **kwargs):
-    """Updates a row with provided information"""
+    while True:
+        batch = list(itertools.islice(iterator, size))
 
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
+        if not batch:
+            return
 
-    modified = str(datetime.datetime.now())
+        yield batch
 
-    # Formats the kwargs to set values in query -------------------------------
 
-    sql_string = ''
+# Backend selection ----------------------------------------------------------
+def configure(backend="sqlite", location=None):
+    """Selects the storage backend, call init_db() afterwards to open it.
 
-    for column, value in kwargs.items():
-        sql_string += f"{column} = '{value}', "
+    The store in use until now isn't closed, so switching back to it
+    doesn't open it again, and an in-memory one keeps its notes. close()
+    it first if it won't be used again.
 
-    # Update query ------------------------------------------------------------
-    with conn:
-        c.execute("UPDATE note_objs "
-                  "SET " + sql_string +
-                  "last_modified = '" + modified + "' "
-                  "WHERE id = '" + str(obj_id) + "'")
+    Args:
+        backend: A BACKENDS name.
+        location: Where the backend keeps the notes, a database file for
+            sqlite (":memory:" for one in memory), a name for memory and
+            a directory for files. Each has its own default."""
 
-    conn.commit()
-    conn.close()
+    global BACKEND, _backend
 
+    if backend not in BACKENDS:
+        raise ValueError(f"{backend} is not a storage backend.")
 
-def get_row(obj_id):
-    """Returns the row with the given id."""
+    module, options = BACKENDS[backend]
 
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
+    BACKEND = backend
+    _backend = importlib.import_module(module)
+    _backend.configure(location, **options)
+    _backends.add(_backend)
 
-    with conn:
-        c.execute(f"SELECT * FROM note_objs WHERE id = {obj_id}")
-        return c.fetchone()
 
+def init_db():
+    """Opens the store, creating it if necessary and upgrading the format
+    of an existing one in place. Cached, later calls return at once until
+    configure() or close()."""
 
-def get_children(obj_id):
-    """Gets the children rows of the provided row, via row ID"""
+    if _backend is None:
+        configure(BACKEND)
+
+    _backend.init_db()
+
+
+def close():
+    """Closes the store in use, the others configured before stay open"""
+
+    if _backend is not None:
+        _backend.close()
+
+
+def close_all():
+    """Closes every store configured so far, call on app exit"""
+
+    for backend in _backends:
+        backend.close_all()
+
+
+def transaction():
+    """Groups the note_manager calls made inside it on this thread into
+    one atomic commit, so several writes pay for one sync to disk:
+
+        with note_manager.transaction():
+            note_id = note_manager.new_obj(...)
+            note_manager.update_obj(note_id, ...)
+
+    Every write already is a transaction of its own. Nested ones are
+    savepoints, an exception raised inside one undoes its changes only,
+    the outermost block commits. The files backend only serializes the
+    block against other threads, it can't roll back."""
+
+    return _backend.transaction()
+
+
+# Notes ----------------------------------------------------------------------
+def new_obj(name, data, parent_nb, modified=None, notebook=False):
+    """Create a new note object inside the provided notebook, parent_nb 0
+    for a top level notebook. With notebook=True the object is a notebook,
+    which can hold notes and other notebooks.
 
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
+    Returns:
+        The id of the new row."""
 
-    with conn:
-        c.execute(f"SELECT * FROM note_objs WHERE parent_id = {obj_id}")
-        children = c.fetchall()
-        return children
+    return _backend.new_obj(name, data, parent_nb, modified, notebook)
+
+
+def new_objs(objs, notebook=False):
+    """Bulk version of new_obj, inserts every object in one transaction.
+
+    Args:
+        objs: Iterable of (name, data, parent_nb) tuples.
+        notebook: True if the objects are notebooks."""
+
+    _backend.new_objs(objs, notebook)
+
+
+def restore(objs, progress=None):
+    """Bulk inserts exported rows, a batch at a time so memory stays small
+    however many rows there are. Rows keep their tree but get new ids, an
+    exported root (parent_id None) is merged into this store's root.
+
+    Args:
+        objs: Iterable of (id, name, last_modified, data, parent_id,
+            is_notebook) tuples, each parent before its children.
+        progress: Called with the number of rows inserted so far, after
+            each batch.
+
+    Returns:
+        The number of rows inserted."""
+
+    return _backend.restore(objs, progress)
+
+
+def update_obj(obj_id, **kwargs):
+    """Updates a row with provided information
+
+    Returns:
+        The new last_modified value of the row."""
+
+    return _backend.update_obj(obj_id, **kwargs)
+
+
+def update_objs(columns, rows):
+    """Bulk version of update_obj, updates every row in one transaction.
+
+    Args:
+        columns: Names of the columns to set on every row.
+        rows: Iterable of (obj_id, value, ...) tuples, one value per
+            column in the same order."""
+
+    _backend.update_objs(columns, rows)
+
+
+def get_row(obj_id):
+    """Returns the row with the given id, body included."""
+
+    return _backend.get_row(obj_id)
+
+
+def get_children(obj_id):
+    """Gets the children rows of the provided row, via row ID. Reads every
+    child's body, use get_children_metadata for listings."""
+
+    return _backend.get_children(obj_id)
 
 
 def load():
-    """Returns the entire table as list of tuples(rows)"""
+    """Returns the entire table as list of tuples(rows), bodies included"""
+
+    return _backend.load()
+
+
+def get_metadata(obj_id):
+    """Returns the row with the given id, without its body (META_COLUMNS)"""
+
+    return _backend.get_metadata(obj_id)
+
+
+def get_children_metadata(obj_id):
+    """Gets the children of the provided row without their bodies"""
+
+    return _backend.get_children_metadata(obj_id)
 
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
 
-    with conn:
-        c.execute("SELECT * FROM note_objs")
+def get_children_page(obj_id, order="name", after=None, limit=100):
+    """Gets one page of the children of a row, without their bodies,
+    sorted by one of CHILDREN_ORDERS (ties in id order).
 
-    return c.fetchall()
+    Args:
+        obj_id: The row whose children to list.
+        order: "name", "modified" or "size".
+        after: The cursor returned with the previous page, None for the
+            first page.
+        limit: The most rows on the page.
+
+    Returns:
+        (rows, cursor), cursor is None once there are no more pages."""
+
+    if order not in CHILDREN_ORDERS:
+        raise ValueError(f"{order} is not a listing order.")
+
+    rows = _backend.get_children_page(obj_id, order, after, limit)
+
+    if len(rows) < limit:
+        return rows, None
+
+    column = META_COLUMNS.index(CHILDREN_ORDERS[order])
+
+    return rows, (rows[-1][column], rows[-1][0])
+
+
+def load_metadata():
+    """Returns every row without its body"""
+
+    return _backend.load_metadata()
+
+
+def get_body(obj_id):
+    """Returns the body of the note with the given id, None if missing"""
+
+    return _backend.get_body(obj_id)
+
+
+def chunk_body(obj_id):
+    """Stores a body of at least chunks.THRESHOLD bytes in chunks, if it
+    isn't already, without modifying the note. Call before reading or
+    saving the body a chunk at a time.
+
+    Returns:
+        The number of chunks, 0 if the body is too small to chunk."""
+
+    return _backend.chunk_body(obj_id)
+
+
+def get_chunks(obj_id, start=0, count=1):
+    """Returns count chunks of a chunked body, from chunk start on, fewer
+    past its end. "".join() of every chunk is the body."""
+
+    return _backend.get_chunks(obj_id, start, count)
+
+
+def update_chunks(obj_id, edits):
+    """Saves edited chunks of a chunked body, leaving the rest untouched.
+
+    Args:
+        obj_id: The note whose body to change.
+        edits: Dict of chunk index -> the chunk's new text.
+
+    Returns:
+        The new last_modified value of the row."""
+
+    return _backend.update_chunks(obj_id, edits)
+
+
+# Trees ----------------------------------------------------------------------
+def get_subtree(obj_id):
+    """Returns the row and everything below it, without bodies.
+
+    Returns:
+        Rows in META_COLUMNS order plus each row's depth below obj_id,
+        depth first so every row comes right after its parent."""
+
+    return _backend.get_subtree(obj_id)
+
+
+def get_path(obj_id):
+    """Returns the row and its ancestors, outermost first, for
+    breadcrumbs. Rows are in META_COLUMNS order."""
+
+    return _backend.get_path(obj_id)
+
+
+def get_subtree_stats(obj_id):
+    """Returns (descendant count, total body bytes) for everything below
+    the row."""
+
+    return _backend.get_subtree_stats(obj_id)
+
+
+def dump():
+    """Streams every row for export, bodies included, without loading
+    them all at once.
+
+    Returns:
+        An iterator of rows in COLUMNS order plus each row's depth below
+        the top level, depth first so every row comes right after its
+        parent."""
+
+    return _backend.dump()
+
+
+# History --------------------------------------------------------------------
+def get_revisions(obj_id):
+    """Returns the note's saved versions, newest first. Backends without
+    history return none.
+
+    Returns:
+        A list of (revision, last_modified, size) tuples."""
+
+    return _backend.get_revisions(obj_id)
+
+
+def get_revision(obj_id, revision):
+    """Rebuilds the note's body as of the given revision.
+
+    Returns:
+        The body, None if there is no such revision (or it was pruned)."""
+
+    return _backend.get_revision(obj_id, revision)
+
+
+def prune_revisions():
+    """Drops history past revisions.KEEP_AGE and revisions.KEEP_COUNT for
+    every note.
+
+    Returns:
+        The number of revisions deleted."""
+
+    return _backend.prune_revisions()
+
+
+# Search and maintenance -----------------------------------------------------
+def search(query, limit=20, notebook_id=None, marks=("[", "]")):
+    """Full text search over note names and bodies.
+
+    Args:
+        query: The words to look for, word* matches a prefix.
+        limit: The most results to return.
+        notebook_id: Only search notes below this notebook, all if None.
+        marks: Strings placed before and after matches in the snippet.
+
+    Returns:
+        A list of (id, name, parent_id, snippet) tuples, best match
+        first."""
+
+    return _backend.search(query, limit, notebook_id, marks)
 
 
 def delete(obj_id):
-    """Delete note object"""
+    """Delete note object and everything below it"""
+
+    _backend.delete(obj_id)
+
+
+def compact(progress=None):
+    """Recompresses every body with the current compression settings.
+
+    Args:
+        progress: Called with the number of bodies checked so far, after
+            each batch.
+
+    Returns:
+        (bodies rewritten, stored body bytes before, bytes after)."""
+
+    return _backend.compact(progress)
+
+
+def remove_orphans():
+    """Deletes rows whose parent no longer exists, along with their
+    descendants.
+
+    Returns:
+        The number of rows deleted."""
+
+    return _backend.remove_orphans()
+
 
-    # Connects to database file, if db file doesn't exist it creates one
-    conn = sqlite3.connect("notes.db")
-    # Cursor to execute sql commands
-    c = conn.cursor()
+def maintain(vacuum_pages=1000):
+    """Checks the storage for damage and tidies it up a step at a time:
+    integrity check, remove_orphans(), and for sqlite ANALYZE and an
+    incremental VACUUM. Nothing is written if the check finds problems.
+    Run the steps while the app is idle, a step at a time so it can stop
+    in between.
 
-    with conn:
+    Args:
+        vacuum_pages: Free pages returned to the file per step.
 
-        c.execute(f"DELETE FROM note_objs "
-                  f"WHERE id = {obj_id}")
+    Yields:
+        (step name, report) after each step, ending with "done". The
+        report dict has the storage's "before" and "after" sizes, the
+        check's "integrity" messages (["ok"] if it passed) and the
+        number of "orphans" removed."""
 
-        # Cascade delete doesn't seem to be triggering, manually doing it:
-        c.execute(f"DELETE FROM note_objs "
-                  f"WHERE parent_id = {obj_id}")
+    return _backend.maintain(vacuum_pages)
 
 
-init_db()  # Initialize database
+# Times every call when instrumentation is on, except the helpers, which
+# the backends call too often for too little, and transaction() and
+# maintain(), whose block or steps are what take time
+instrumentation.instrument(
+    globals(), [name for name, value in list(globals().items())
+                if inspect.isfunction(value) and not name.startswith("_")
+                and name not in ("now", "body_size", "check_name",
+                                 "batches", "transaction", "maintain")],
+    "note_manager.")
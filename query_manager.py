@@ -0,0 +1,319 @@
+"""Parameterized SQL for note_manager, run on the shared connection
+
+Every statement is a fixed string with ? placeholders, so sqlite3's
+per-connection statement cache hands back the already prepared statement
+instead of parsing the SQL again on each call.
+"""
+
+from contextlib import contextmanager
+
+import connection_manager
+
+# note_objs statements -------------------------------------------------------
+INSERT_OBJ = ("INSERT INTO note_objs("
+              "id, name, last_modified, parent_id, size, is_notebook) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+UPDATE_OBJ = "UPDATE note_objs SET {columns}last_modified = ? WHERE id = ?"
+SELECT_MAX_ID = "SELECT COALESCE(MAX(id), 0) FROM note_objs"
+# A row and all of its descendants, UNION so a parent_id loop can't recurse
+# forever. Triggers take the bodies and search entries along
+DELETE_TREE = ("WITH RECURSIVE tree(id) AS ("
+               "SELECT ? UNION "
+               "SELECT o.id FROM note_objs o "
+               "JOIN tree ON o.parent_id = tree.id) "
+               "DELETE FROM note_objs WHERE id IN tree")
+# Rows whose parent no longer exists, and all of their descendants.
+# parent_id 0 (top level notebooks) and NULL (the root) have no parent row
+DELETE_ORPHANS = ("WITH RECURSIVE orphans(id) AS ("
+                  "SELECT id FROM note_objs o "
+                  "WHERE o.parent_id IS NOT NULL AND o.parent_id != 0 "
+                  "AND NOT EXISTS (SELECT 1 FROM note_objs p "
+                  "WHERE p.id = o.parent_id) UNION "
+                  "SELECT o.id FROM note_objs o "
+                  "JOIN orphans ON o.parent_id = orphans.id) "
+                  "DELETE FROM note_objs WHERE id IN orphans")
+# Rows changed by the last statement, rowcount isn't set for WITH ... DELETE
+CHANGES = "SELECT changes()"
+DELETE_ORPHAN_BODIES = ("DELETE FROM note_bodies "
+                        "WHERE id NOT IN (SELECT id FROM note_objs)")
+DELETE_ORPHAN_CHUNKS = ("DELETE FROM note_chunks "
+                        "WHERE note_id NOT IN (SELECT id FROM note_objs)")
+DELETE_ORPHAN_REVISIONS = ("DELETE FROM note_revisions "
+                           "WHERE note_id NOT IN (SELECT id FROM note_objs)")
+
+# Metadata only, these never touch note_bodies
+META_SELECT = ("SELECT o.id, o.name, o.last_modified, o.parent_id, o.size, "
+               "o.is_notebook")
+META = META_SELECT + " FROM note_objs o"
+SELECT_META = META + " WHERE id = ?"
+SELECT_CHILDREN_META = META + " WHERE parent_id = ?"
+SELECT_ALL_META = META
+# Children a page at a time in each listing order, key and direction.
+# A page after the first continues past the (key, id) of the previous
+# page's last row, ?2 and ?3, so its cost doesn't grow with the pages
+# before it. Written out rather than as a row value, which only gets the
+# NOCASE index as far as parent_id
+CHILDREN_ORDERS = {"name": ("name COLLATE NOCASE", "ASC"),
+                   "modified": ("last_modified", "DESC"),
+                   "size": ("size", "DESC")}
+SELECT_CHILDREN_PAGE = {
+    order: (META + f" WHERE parent_id = ?1 "
+            f"ORDER BY {key} {direction}, id {direction} LIMIT ?4")
+    for order, (key, direction) in CHILDREN_ORDERS.items()}
+SELECT_CHILDREN_PAGE_AFTER = {
+    order: (META + f" WHERE parent_id = ?1 AND {key} {op}= ?2 "
+            f"AND ({key} {op} ?2 OR id {op} ?3) "
+            f"ORDER BY {key} {direction}, id {direction} LIMIT ?4")
+    for order, (key, direction) in CHILDREN_ORDERS.items()
+    for op in (">" if direction == "ASC" else "<",)}
+
+# Full rows, bodies included, plus the body's codec to decompress it with
+FULL = ("SELECT o.id, o.name, o.last_modified, b.data, o.parent_id, o.size, "
+        "o.is_notebook, b.codec "
+        "FROM note_objs o LEFT JOIN note_bodies b ON b.id = o.id")
+SELECT_OBJ = FULL + " WHERE o.id = ?"
+SELECT_CHILDREN = FULL + " WHERE o.parent_id = ?"
+SELECT_ALL = FULL
+
+# Tree statements, one recursive query each --------------------------------
+# Sorting by the ids on the way down from the top, zero padded, puts every
+# row right after its parent and before its parent's next child
+TREE_PATH = "tree.path || printf('/%010d', o.id)"
+# The row and everything below it, depth first, with each row's depth
+SELECT_SUBTREE = ("WITH RECURSIVE tree(id, depth, path) AS ("
+                  "SELECT ?, 0, '' UNION ALL "
+                  "SELECT o.id, tree.depth + 1, " + TREE_PATH + " "
+                  "FROM note_objs o JOIN tree ON o.parent_id = tree.id) " +
+                  META_SELECT + ", tree.depth "
+                  "FROM tree JOIN note_objs o ON o.id = tree.id "
+                  "ORDER BY tree.path")
+# The row and its ancestors, outermost first
+SELECT_PATH = ("WITH RECURSIVE path(id, parent_id, depth) AS ("
+               "SELECT id, parent_id, 0 FROM note_objs WHERE id = ? UNION "
+               "SELECT o.id, o.parent_id, path.depth + 1 FROM note_objs o "
+               "JOIN path ON o.id = path.parent_id) " +
+               META_SELECT + " "
+               "FROM path JOIN note_objs o ON o.id = path.id "
+               "ORDER BY path.depth DESC")
+# Number of descendants and their total body size
+SELECT_SUBTREE_STATS = ("WITH RECURSIVE tree(id) AS ("
+                        "SELECT id FROM note_objs WHERE parent_id = ? UNION "
+                        "SELECT o.id FROM note_objs o "
+                        "JOIN tree ON o.parent_id = tree.id) "
+                        "SELECT COUNT(*), COALESCE(SUM(o.size), 0) "
+                        "FROM tree JOIN note_objs o ON o.id = tree.id")
+# Every row reachable from the top level (the root and the notebooks with
+# parent_id 0), depth first so parents come before their children
+SELECT_DUMP = ("WITH RECURSIVE tree(id, depth, path) AS ("
+               "SELECT id, 0, printf('/%010d', id) FROM note_objs "
+               "WHERE parent_id IS NULL OR parent_id = 0 UNION ALL "
+               "SELECT o.id, tree.depth + 1, " + TREE_PATH + " "
+               "FROM note_objs o JOIN tree ON o.parent_id = tree.id) "
+               "SELECT o.id, o.name, o.last_modified, b.data, o.parent_id, "
+               "o.size, o.is_notebook, tree.depth, b.codec "
+               "FROM tree JOIN note_objs o ON o.id = tree.id "
+               "LEFT JOIN note_bodies b ON b.id = o.id "
+               "ORDER BY tree.path")
+SELECT_ROOT = "SELECT id FROM note_objs WHERE parent_id IS NULL LIMIT 1"
+
+# note_bodies statements -----------------------------------------------------
+INSERT_BODY = "INSERT INTO note_bodies(id, data, codec) VALUES (?, ?, ?)"
+UPDATE_BODY = "UPDATE note_bodies SET data = ?, codec = ? WHERE id = ?"
+SELECT_BODY = "SELECT data, codec FROM note_bodies WHERE id = ?"
+# Bodies in id order, a batch at a time from after the given id
+SELECT_BODIES_AFTER = ("SELECT b.id, b.data, b.codec, o.last_modified "
+                       "FROM note_bodies b JOIN note_objs o ON o.id = b.id "
+                       "WHERE b.id > ? ORDER BY b.id LIMIT ?")
+SELECT_BODIES_SIZE = ("SELECT COALESCE(SUM(length(CAST(data AS BLOB))), 0) "
+                      "FROM note_bodies")
+
+# note_chunks statements -----------------------------------------------------
+INSERT_CHUNK = ("INSERT INTO note_chunks(note_id, chunk, size, data, codec) "
+                "VALUES (?, ?, ?, ?, ?)")
+UPDATE_CHUNK = ("UPDATE note_chunks SET size = ?, data = ?, codec = ? "
+                "WHERE note_id = ? AND chunk = ?")
+DELETE_CHUNKS = "DELETE FROM note_chunks WHERE note_id = ?"
+SELECT_CHUNKS = ("SELECT data, codec FROM note_chunks WHERE note_id = ? "
+                 "ORDER BY chunk")
+# count chunks from start, in order
+SELECT_CHUNK_RANGE = ("SELECT data, codec FROM note_chunks "
+                      "WHERE note_id = ? AND chunk >= ? "
+                      "ORDER BY chunk LIMIT ?")
+SELECT_CHUNK_COUNT = "SELECT COUNT(*) FROM note_chunks WHERE note_id = ?"
+SELECT_CHUNKS_SIZE = ("SELECT COALESCE(SUM(size), 0) FROM note_chunks "
+                      "WHERE note_id = ?")
+
+# note_revisions statements --------------------------------------------------
+INSERT_REVISION = ("INSERT INTO note_revisions("
+                   "note_id, revision, modified, snapshot, size, data, codec) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)")
+SELECT_REVISIONS = ("SELECT revision, modified, size FROM note_revisions "
+                    "WHERE note_id = ? ORDER BY revision DESC")
+# The latest snapshot and the revisions after it, with their stored size
+SELECT_REVISION_CHAIN = ("SELECT revision, snapshot, "
+                         "length(CAST(data AS BLOB)) FROM note_revisions "
+                         "WHERE note_id = ?1 AND revision >= COALESCE(("
+                         "SELECT MAX(revision) FROM note_revisions "
+                         "WHERE note_id = ?1 AND snapshot), 0) "
+                         "ORDER BY revision")
+# What rebuilding a revision takes, from the snapshot before it
+SELECT_REVISION_DELTAS = ("SELECT snapshot, data, codec FROM note_revisions "
+                          "WHERE note_id = ?1 AND revision BETWEEN ("
+                          "SELECT MAX(revision) FROM note_revisions "
+                          "WHERE note_id = ?1 AND snapshot "
+                          "AND revision <= ?2) AND ?2 "
+                          "ORDER BY revision")
+SELECT_REVISED_NOTES = "SELECT DISTINCT note_id FROM note_revisions"
+# Revisions before the chain holding the oldest one to keep, which is the
+# oldest modified since ?2 or among the last ?3
+PRUNE_REVISIONS = ("DELETE FROM note_revisions "
+                   "WHERE note_id = ?1 AND revision < ("
+                   "SELECT MAX(revision) FROM note_revisions "
+                   "WHERE note_id = ?1 AND snapshot AND revision <= ("
+                   "SELECT MIN(revision) FROM note_revisions "
+                   "WHERE note_id = ?1 AND (modified >= ?2 OR revision > ("
+                   "SELECT MAX(revision) FROM note_revisions "
+                   "WHERE note_id = ?1) - ?3)))")
+
+# note_search statements -----------------------------------------------------
+# The triggers only index plain bodies, these index compressed ones and
+# bulk inserts that add bodies before their rows
+INSERT_SEARCH = "INSERT INTO note_search(rowid, name, data) VALUES (?, ?, ?)"
+UPDATE_SEARCH = "UPDATE note_search SET data = ? WHERE rowid = ?"
+# Best match first, the limit applies before parent ids are looked up.
+# Notebooks aren't notes, so left out
+SEARCH = ("SELECT rowid, name, "
+          "(SELECT parent_id FROM note_objs WHERE id = note_search.rowid), "
+          "snippet(note_search, 1, ?, ?, '...', 12) "
+          "FROM note_search WHERE note_search MATCH ? AND rowid NOT IN ("
+          "SELECT id FROM note_objs WHERE is_notebook) "
+          "ORDER BY rank LIMIT ?")
+# Notes anywhere below the notebook
+SEARCH_NOTEBOOK = ("WITH RECURSIVE tree(id) AS ("
+                   "SELECT id FROM note_objs WHERE parent_id = ? UNION "
+                   "SELECT o.id FROM note_objs o "
+                   "JOIN tree ON o.parent_id = tree.id) "
+                   "SELECT rowid, name, "
+                   "(SELECT parent_id FROM note_objs "
+                   "WHERE id = note_search.rowid), "
+                   "snippet(note_search, 1, ?, ?, '...', 12) "
+                   "FROM note_search WHERE note_search MATCH ? "
+                   "AND rowid IN tree AND rowid NOT IN ("
+                   "SELECT id FROM note_objs WHERE is_notebook) "
+                   "ORDER BY rank LIMIT ?")
+
+# sync statements ------------------------------------------------------------
+SELECT_REPLICA = "SELECT replica FROM sync_meta"
+RENAME_REPLICA = "UPDATE sync_meta SET replica = lower(hex(randomblob(8)))"
+SELECT_PEER = "SELECT sent, received FROM sync_peers WHERE peer = ?"
+UPSERT_PEER = ("INSERT INTO sync_peers(peer, sent, received) "
+               "VALUES (?1, COALESCE(?2, 0), COALESCE(?3, 0)) "
+               "ON CONFLICT(peer) DO UPDATE SET "
+               "sent = COALESCE(?2, sent), received = COALESCE(?3, received)")
+SELECT_MAX_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM note_oplog"
+# Notes changed after a seq, oldest change first, with their sync state
+SELECT_OPLOG_AFTER = ("SELECT l.seq, s.uid, s.version, s.modified, s.origin, "
+                      "s.id FROM note_oplog l JOIN note_sync s USING (uid) "
+                      "WHERE l.seq > ? ORDER BY l.seq")
+SELECT_SYNC_STATE = ("SELECT version, modified, origin, id FROM note_sync "
+                     "WHERE uid = ?")
+SELECT_UID = "SELECT uid FROM note_sync WHERE id = ?"
+SELECT_SYNCED_OBJ = ("SELECT o.name, o.parent_id, o.is_notebook, b.data, "
+                     "b.codec FROM note_objs o "
+                     "LEFT JOIN note_bodies b ON b.id = o.id WHERE o.id = ?")
+# Points a uid at the row about to be inserted for it, so the insert
+# trigger keeps the uid instead of making one up
+UPSERT_SYNC_ID = ("INSERT INTO note_sync(uid, id, version, modified, origin) "
+                  "VALUES (?, ?, 0, 0, '') "
+                  "ON CONFLICT(uid) DO UPDATE SET id = excluded.id")
+# Takes on the remote version, after the triggers bumped the local one
+SET_SYNC_STATE = ("UPDATE note_sync SET version = ?, modified = ?, "
+                  "origin = ? WHERE uid = ?")
+INSERT_TOMBSTONE = ("INSERT INTO note_sync(uid, id, version, modified, "
+                    "origin) VALUES (?, NULL, ?, ?, ?)")
+INSERT_OPLOG = "INSERT INTO note_oplog(uid, op) VALUES (?, ?)"
+UPDATE_SYNCED_OBJ = ("UPDATE note_objs SET name = ?, parent_id = ?, "
+                     "is_notebook = ?, size = ?, last_modified = ? "
+                     "WHERE id = ?")
+
+# maintenance statements -----------------------------------------------------
+SELECT_TABLE_COUNT = "SELECT COUNT(*) FROM sqlite_master"
+SELECT_PAGE_STATS = ("SELECT page_size, page_count, freelist_count "
+                     "FROM pragma_page_size, pragma_page_count, "
+                     "pragma_freelist_count")
+SELECT_AUTO_VACUUM = "PRAGMA auto_vacuum"
+# Only takes effect on an empty database or at the next VACUUM
+SET_AUTO_VACUUM = "PRAGMA auto_vacuum = INCREMENTAL"
+INTEGRITY_CHECK = "PRAGMA integrity_check"
+ANALYZE = "ANALYZE"
+VACUUM = "VACUUM"
+# Frees up to {pages} pages. Must be run with executescript(), execute()
+# steps it once, which frees a single page
+INCREMENTAL_VACUUM = "PRAGMA incremental_vacuum({pages})"
+CHECKPOINT = "PRAGMA wal_checkpoint(TRUNCATE)"
+
+
+def update_sql(columns):
+    """Returns the UPDATE statement setting the given columns.
+
+    Column names can't be parameters, so they're checked against the
+    writable columns. Each combination of columns is its own (cached)
+    statement.
+
+    Args:
+        columns: Names of the columns to set, besides last_modified."""
+
+    for column in columns:
+
+        if column not in ("name", "parent_id", "size"):
+            raise ValueError(f"{column} is not an updatable column.")
+
+    return UPDATE_OBJ.format(
+        columns="".join(f"{column} = ?, " for column in columns))
+
+
+def execute(sql, params=()):
+    """Runs one statement on the shared connection.
+
+    Returns:
+        The cursor, to fetch results or read lastrowid from."""
+
+    return connection_manager.get_connection().execute(sql, params)
+
+
+def executemany(sql, seq_of_params):
+    """Runs one statement for every parameter tuple, for bulk writes"""
+
+    return connection_manager.get_connection().executemany(sql, seq_of_params)
+
+
+@contextmanager
+def transaction():
+    """Groups the statements run inside it into one commit, rolling back
+    if an exception is raised.
+
+    The write lock is taken up front (BEGIN IMMEDIATE), so reads made
+    inside the transaction stay valid until it commits. Inside another
+    transaction on the same connection it is a savepoint instead, an
+    exception only rolls back what ran inside it and the outer
+    transaction still decides whether everything commits."""
+
+    conn = connection_manager.get_connection()
+
+    if conn.in_transaction:
+        # Savepoints stack, each name refers to the innermost one open
+        conn.execute("SAVEPOINT nested")
+
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            conn.execute("RELEASE nested")
+            raise
+
+        conn.execute("RELEASE nested")
+        return
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
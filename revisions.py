@@ -0,0 +1,94 @@
+"""Deltas between note versions, for the revision history
+
+Each save is stored as a delta against the version before it, as JSON
+[[start, end, text], ...] replacing old tokens start:end with text, where
+tokens are words with their trailing whitespace. A chain of deltas starts
+from a full snapshot. A new snapshot is taken once the chain's deltas add
+up to more than SNAPSHOT_RATIO times the note's size, so history grows
+with the size of the edits rather than the notes, or once the chain is
+MAX_CHAIN deltas long, which bounds the cost of rebuilding a version.
+
+Pruning only removes whole chains older than the retention, the snapshot
+starting a kept chain is never rewritten.
+"""
+
+import difflib
+import json
+import re
+
+SNAPSHOT_RATIO = 1.0
+MAX_CHAIN = 64
+KEEP_AGE = 30 * 24 * 60 * 60  # Seconds
+KEEP_COUNT = 20  # Revisions kept whatever their age
+
+_TOKENS = re.compile(r"\S+\s*|\s+")
+
+
+def configure(snapshot_ratio=None, max_chain=None, keep_age=None,
+              keep_count=None):
+    """Sets when snapshots are taken and how much history is kept.
+
+    Args:
+        snapshot_ratio: Delta bytes, relative to the note's size, before
+            the next save is a snapshot.
+        max_chain: The most deltas between two snapshots.
+        keep_age: Seconds revisions are kept for.
+        keep_count: Revisions kept per note, however old."""
+
+    global SNAPSHOT_RATIO, MAX_CHAIN, KEEP_AGE, KEEP_COUNT
+
+    if snapshot_ratio is not None:
+        SNAPSHOT_RATIO = snapshot_ratio
+
+    if max_chain is not None:
+        MAX_CHAIN = max_chain
+
+    if keep_age is not None:
+        KEEP_AGE = keep_age
+
+    if keep_count is not None:
+        KEEP_COUNT = keep_count
+
+
+def diff(old, new):
+    """Returns the delta turning the text old into new"""
+
+    old_tokens = _TOKENS.findall(old)
+    new_tokens = _TOKENS.findall(new)
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens,
+                                      autojunk=False)
+
+    return json.dumps([[i1, i2, "".join(new_tokens[j1:j2])]
+                       for op, i1, i2, j1, j2 in matcher.get_opcodes()
+                       if op != "equal"],
+                      ensure_ascii=False, separators=(",", ":"))
+
+
+def patch(old, delta):
+    """Applies a delta made by diff() to old, returning the new text"""
+
+    old_tokens = _TOKENS.findall(old)
+    parts = []
+    position = 0
+
+    for start, end, text in json.loads(delta):
+        parts.extend(old_tokens[position:start])
+        parts.append(text)
+        position = end
+
+    parts.extend(old_tokens[position:])
+
+    return "".join(parts)
+
+
+def needs_snapshot(chain_deltas, chain_bytes, delta_bytes, size):
+    """Decides whether a save starts a new chain.
+
+    Args:
+        chain_deltas: Deltas stored since the last snapshot.
+        chain_bytes: Their total size in bytes.
+        delta_bytes: The size of this save's delta.
+        size: The size of the saved text in bytes."""
+
+    return (chain_deltas >= MAX_CHAIN or
+            chain_bytes + delta_bytes > SNAPSHOT_RATIO * size)
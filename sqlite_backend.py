@@ -0,0 +1,792 @@
+"""SQLite storage backend for note_manager
+
+Keeps notes in note_objs, their bodies in note_bodies (large ones in
+note_chunks), a full text index in note_search and history in
+note_revisions. The database is a file, or
+an in-memory database shared between the app's threads for the memory
+backend.
+"""
+
+import os
+
+import chunks
+import compression
+import connection_manager
+import migrations
+import query_manager as queries
+import revisions
+from note_manager import batches, body_size, check_name, now
+
+# Databases already migrated since they were last closed
+_initialized = set()
+
+
+def configure(location=None, memory=False):
+    """Points the backend at a database.
+
+    Args:
+        location: The database file, defaults to connection_manager's.
+            connection_manager.MEMORY for an in-memory one.
+        memory: Use the in-memory database named location instead, one
+            database shared by every connection (thread) in the
+            process."""
+
+    if memory:
+        location = connection_manager.memory_path(location or "notes")
+
+    if location is not None:
+        connection_manager.configure(path=location)
+
+
+def init_db():
+    """Creates database file and schema if necessary, upgrading the schema
+    of an existing database in place. Only the first call per database
+    does anything until close()."""
+
+    if connection_manager.DB_PATH in _initialized:
+        return
+
+    # Shared connection, if db file doesn't exist it creates one
+    conn = connection_manager.get_connection()
+
+    if not conn.execute(queries.SELECT_TABLE_COUNT).fetchone()[0]:
+        # Free pages go back to the file with incremental_vacuum (see
+        # maintain()). A new database only takes the mode on a VACUUM,
+        # which is instant while it's empty
+        conn.execute(queries.SET_AUTO_VACUUM)
+        conn.execute(queries.VACUUM)
+
+    migrations.migrate(conn)
+    _initialized.add(connection_manager.DB_PATH)
+
+
+def close():
+    """Closes every connection to the database, those to any other stay
+    open. An in-memory database is gone once they're closed."""
+
+    connection_manager.close_all(connection_manager.DB_PATH)
+    _initialized.discard(connection_manager.DB_PATH)
+
+
+def close_all():
+    """Closes every connection to every database"""
+
+    connection_manager.close_all()
+    _initialized.clear()
+
+
+def transaction():
+    """One sqlite transaction on this thread's connection, a savepoint
+    when nested."""
+
+    return queries.transaction()
+
+
+def store_body(obj_id, data, new=False, conn=None):
+    """Prepares a body for its note_bodies row, first writing it to
+    note_chunks in place of any chunks it had if it's big enough.
+
+    Args:
+        obj_id: The note the body is for.
+        data: The body.
+        new: True if the note has no body stored yet.
+        conn: The connection to write with, defaults to the shared one.
+
+    Returns:
+        (stored data, codec) for note_bodies. The search triggers only
+        index bodies whose codec is None."""
+
+    conn = conn or connection_manager.get_connection()
+
+    if not new:
+        conn.execute(queries.DELETE_CHUNKS, (obj_id,))
+
+    if not chunks.needed(data):
+        return compression.compress(data)
+
+    conn.executemany(queries.INSERT_CHUNK, (
+        (obj_id, index, body_size(chunk), *compression.compress(chunk))
+        for index, chunk in enumerate(chunks.split(data))))
+
+    return None, chunks.CODEC
+
+
+def load_body(obj_id, data, codec, conn=None):
+    """Returns a body from its note_bodies data and codec, joining its
+    chunks if it's chunked"""
+
+    if codec != chunks.CODEC:
+        return compression.decompress(data, codec)
+
+    conn = conn or connection_manager.get_connection()
+
+    return "".join(compression.decompress(data, codec) for data, codec
+                   in conn.execute(queries.SELECT_CHUNKS, (obj_id,)))
+
+
+def new_obj(name, data, parent_nb, modified=None, notebook=False):
+    """Create a new note object inside the provided notebook, parent_nb 0
+    for a top level notebook. With notebook=True the object is a notebook,
+    which can hold notes and other notebooks.
+
+    Returns:
+        The id of the new row."""
+
+    check_name(name)
+
+    if modified is None:
+        modified = now()
+
+    with queries.transaction():
+        c = queries.execute(queries.INSERT_OBJ,
+                            (None, name, modified, parent_nb, body_size(data),
+                             notebook))
+        stored, codec = store_body(c.lastrowid, data, new=True)
+        queries.execute(queries.INSERT_BODY, (c.lastrowid, stored, codec))
+
+        if codec is not None:  # The search trigger only indexes plain text
+            queries.execute(queries.INSERT_SEARCH, (c.lastrowid, name, data))
+
+    return c.lastrowid
+
+
+def _decompressed(row):
+    """Drops the codec column from the end of a row read with its body,
+    decompressing (or joining) the body in place of it"""
+
+    if row is None:
+        return None
+
+    *row, codec = row
+
+    if codec is not None:
+        row[3] = load_body(row[0], row[3], codec)
+
+    return tuple(row)
+
+
+def new_objs(objs, notebook=False):
+    """Bulk version of new_obj, inserts every object in one transaction.
+
+    Args:
+        objs: Iterable of (name, data, parent_nb) tuples.
+        notebook: True if the objects are notebooks."""
+
+    modified = now()
+
+    with queries.transaction():
+
+        # The write lock is held, so ids past the current max are free
+        next_id = queries.execute(queries.SELECT_MAX_ID).fetchone()[0] + 1
+
+        for batch in batches(objs):
+
+            ids = range(next_id, next_id + len(batch))
+            next_id += len(batch)
+
+            for name, _, _ in batch:
+                check_name(name)
+
+            bodies = [(obj_id, *store_body(obj_id, data, new=True))
+                      for obj_id, (_, data, _) in zip(ids, batch)]
+
+            queries.executemany(queries.INSERT_OBJ, (
+                (obj_id, name, modified, parent_nb, body_size(data), notebook)
+                for obj_id, (name, data, parent_nb) in zip(ids, batch)))
+            queries.executemany(queries.INSERT_BODY, bodies)
+            queries.executemany(queries.INSERT_SEARCH, (
+                (obj_id, name, data)
+                for obj_id, (name, data, _), (_, _, codec)
+                in zip(ids, batch, bodies) if codec is not None))
+
+
+def restore(objs, progress=None):
+    """Bulk inserts exported rows, committing every batch so memory and
+    the WAL stay small however many rows there are. Run it while nothing
+    else writes to the database, ids are reserved up front.
+
+    Rows keep their tree but get new ids, past the ones in use. An
+    exported root (parent_id None) is merged into this database's root.
+
+    Args:
+        objs: Iterable of (id, name, last_modified, data, parent_id,
+            is_notebook) tuples, each parent before its children.
+        progress: Called with the number of rows inserted so far, after
+            each batch.
+
+    Returns:
+        The number of rows inserted."""
+
+    with queries.transaction():
+        offset = queries.execute(queries.SELECT_MAX_ID).fetchone()[0]
+        root = queries.execute(queries.SELECT_ROOT).fetchone()
+
+    merged = {}  # Exported root id -> this database's root id
+    count = 0
+
+    for batch in batches(objs):
+
+        rows = []
+
+        for obj_id, name, modified, data, parent_id, notebook in batch:
+
+            check_name(name)
+
+            if parent_id is None and root is not None:
+                merged[obj_id] = root[0]
+                continue
+
+            if parent_id is None:  # Becomes the root, later roots merge
+                root = (obj_id + offset,)
+
+            elif parent_id in merged:
+                parent_id = merged[parent_id]
+
+            elif parent_id != 0:
+                parent_id += offset
+
+            rows.append((obj_id + offset, name, modified, data, parent_id,
+                         notebook))
+
+        with queries.transaction():
+            # Bodies first, so the search trigger finds no row to index
+            # and the batch is indexed in one go instead (~2.5x faster)
+            queries.executemany(queries.INSERT_BODY, (
+                (row[0], *store_body(row[0], row[3], new=True))
+                for row in rows))
+            queries.executemany(queries.INSERT_OBJ, (
+                (obj_id, name, modified, parent_id, body_size(data), notebook)
+                for obj_id, name, modified, data, parent_id, notebook
+                in rows))
+            queries.executemany(queries.INSERT_SEARCH, (
+                (row[0], row[1], row[3]) for row in rows))
+
+        count += len(rows)
+
+        if progress is not None:
+            progress(count)
+
+    return count
+
+
+def _add_revision(obj_id, data, modified):
+    """Records a save of obj_id's body in its history, called inside the
+    save's transaction before the body is overwritten. The body from
+    before the first recorded save becomes the first revision."""
+
+    old = get_body(obj_id)
+
+    if old == data:
+        return
+
+    chain = queries.execute(queries.SELECT_REVISION_CHAIN,
+                            (obj_id,)).fetchall()
+
+    if not chain and old is not None:
+        stored, codec = compression.compress(old)
+        queries.execute(queries.INSERT_REVISION,
+                        (obj_id, 1, get_metadata(obj_id)[2], True,
+                         body_size(old), stored, codec))
+        chain = [(1, True, body_size(stored))]
+
+    snapshot = True
+
+    if chain and isinstance(old, str) and isinstance(data, str):
+        stored, codec = compression.compress(revisions.diff(old, data))
+        snapshot = revisions.needs_snapshot(
+            len(chain) - 1, sum(size for _, _, size in chain[1:]),
+            body_size(stored), body_size(data))
+
+    if snapshot:
+        stored, codec = compression.compress(data)
+
+    revision = chain[-1][0] + 1 if chain else 1
+    queries.execute(queries.INSERT_REVISION,
+                    (obj_id, revision, modified, snapshot, body_size(data),
+                     stored, codec))
+
+    if snapshot and chain:  # A chain ended, older ones may be past keeping
+        queries.execute(queries.PRUNE_REVISIONS,
+                        (obj_id, modified - revisions.KEEP_AGE,
+                         revisions.KEEP_COUNT))
+
+
+def update_obj(obj_id, **kwargs):
+    """Updates a row with provided information
+
+    Returns:
+        The new last_modified value of the row."""
+
+    modified = now()
+
+    with queries.transaction():
+
+        if "data" in kwargs:
+            data = kwargs.pop("data")
+            _add_revision(obj_id, data, modified)
+            kwargs["size"] = body_size(data)
+            stored, codec = store_body(obj_id, data)
+            queries.execute(queries.UPDATE_BODY, (stored, codec, obj_id))
+
+            if codec is not None:  # The trigger only indexes plain text
+                queries.execute(queries.UPDATE_SEARCH, (data, obj_id))
+
+        queries.execute(queries.update_sql(kwargs),
+                        (*kwargs.values(), modified, obj_id))
+
+    return modified
+
+
+def update_objs(columns, rows):
+    """Bulk version of update_obj, updates every row in one transaction.
+
+    Args:
+        columns: Names of the columns to set on every row.
+        rows: Iterable of (obj_id, value, ...) tuples, one value per
+            column in the same order."""
+
+    modified = now()
+    columns = list(columns)
+    data_index = columns.index("data") if "data" in columns else None
+
+    if data_index is not None:  # Bodies go to note_bodies, size stays here
+        columns[data_index] = "size"
+
+    sql = queries.update_sql(columns)
+
+    with queries.transaction():
+
+        for batch in batches(rows):
+
+            if data_index is not None:
+
+                for obj_id, *values in batch:
+                    _add_revision(obj_id, values[data_index], modified)
+
+                bodies = [(*store_body(obj_id, values[data_index]), obj_id)
+                          for obj_id, *values in batch]
+                queries.executemany(queries.UPDATE_BODY, bodies)
+                queries.executemany(queries.UPDATE_SEARCH, (
+                    (values[data_index], obj_id)
+                    for (obj_id, *values), (_, codec, _) in zip(batch, bodies)
+                    if codec is not None))
+                batch = [(obj_id, *values[:data_index],
+                          body_size(values[data_index]),
+                          *values[data_index + 1:])
+                         for obj_id, *values in batch]
+
+            queries.executemany(sql, ((*values, modified, obj_id)
+                                      for obj_id, *values in batch))
+
+
+def get_row(obj_id):
+    """Returns the row with the given id, body included."""
+
+    return _decompressed(
+        queries.execute(queries.SELECT_OBJ, (obj_id,)).fetchone())
+
+
+def get_children(obj_id):
+    """Gets the children rows of the provided row, via row ID. Reads every
+    child's body, use get_children_metadata for listings."""
+
+    return [_decompressed(row) for row in
+            queries.execute(queries.SELECT_CHILDREN, (obj_id,))]
+
+
+def load():
+    """Returns the entire table as list of tuples(rows), bodies included"""
+
+    return [_decompressed(row) for row in queries.execute(queries.SELECT_ALL)]
+
+
+def get_metadata(obj_id):
+    """Returns the row with the given id, without its body (META_COLUMNS)"""
+
+    return queries.execute(queries.SELECT_META, (obj_id,)).fetchone()
+
+
+def get_children_metadata(obj_id):
+    """Gets the children of the provided row without their bodies"""
+
+    return queries.execute(queries.SELECT_CHILDREN_META,
+                           (obj_id,)).fetchall()
+
+
+def get_children_page(obj_id, order, after, limit):
+    """Returns up to limit children of a row in the given order, starting
+    after the (key, id) cursor after"""
+
+    if after is None:
+        return queries.execute(queries.SELECT_CHILDREN_PAGE[order],
+                               (obj_id, None, None, limit)).fetchall()
+
+    return queries.execute(queries.SELECT_CHILDREN_PAGE_AFTER[order],
+                           (obj_id, *after, limit)).fetchall()
+
+
+def load_metadata():
+    """Returns every row without its body"""
+
+    return queries.execute(queries.SELECT_ALL_META).fetchall()
+
+
+def get_body(obj_id):
+    """Returns the body of the note with the given id, None if missing"""
+
+    row = queries.execute(queries.SELECT_BODY, (obj_id,)).fetchone()
+
+    return load_body(obj_id, *row) if row else None
+
+
+def chunk_body(obj_id):
+    """Stores a body big enough to chunk in chunks, if it isn't already
+    (it was saved before chunking, or chunks.THRESHOLD was lowered since).
+    The note isn't modified, its contents stay the same.
+
+    Returns:
+        The number of chunks, 0 if the body is too small to chunk."""
+
+    with queries.transaction():
+        count = queries.execute(queries.SELECT_CHUNK_COUNT,
+                                (obj_id,)).fetchone()[0]
+
+        if count:
+            return count
+
+        data = get_body(obj_id)
+
+        if not chunks.needed(data):
+            return 0
+
+        # The search index already holds the body
+        queries.execute(queries.UPDATE_BODY,
+                        (*store_body(obj_id, data), obj_id))
+
+        return queries.execute(queries.SELECT_CHUNK_COUNT,
+                               (obj_id,)).fetchone()[0]
+
+
+def get_chunks(obj_id, start=0, count=1):
+    """Returns count chunks of a chunked body from chunk start on, fewer
+    past its end"""
+
+    return [compression.decompress(data, codec) for data, codec in
+            queries.execute(queries.SELECT_CHUNK_RANGE,
+                            (obj_id, start, count))]
+
+
+def update_chunks(obj_id, edits):
+    """Replaces chunks of a chunked body, leaving the others untouched.
+    The body isn't split again, an edited chunk is stored whatever its
+    size. Saves of chunks add no revisions.
+
+    Args:
+        obj_id: The note whose body to change.
+        edits: Dict of chunk index -> the chunk's new text.
+
+    Returns:
+        The new last_modified value of the row."""
+
+    modified = now()
+
+    with queries.transaction():
+
+        for index, text in edits.items():
+
+            if not queries.execute(queries.UPDATE_CHUNK, (
+                    body_size(text), *compression.compress(text),
+                    obj_id, index)).rowcount:
+                raise ValueError(f"{obj_id} has no chunk {index}.")
+
+        size = queries.execute(queries.SELECT_CHUNKS_SIZE,
+                               (obj_id,)).fetchone()[0]
+        # The index only holds whole bodies
+        queries.execute(queries.UPDATE_SEARCH, (get_body(obj_id), obj_id))
+        queries.execute(queries.update_sql(["size"]),
+                        (size, modified, obj_id))
+
+    return modified
+
+
+def get_subtree(obj_id):
+    """Returns the row and everything below it, without bodies.
+
+    Returns:
+        Rows in META_COLUMNS order plus each row's depth below obj_id,
+        depth first so every row comes right after its parent."""
+
+    return queries.execute(queries.SELECT_SUBTREE, (obj_id,)).fetchall()
+
+
+def get_path(obj_id):
+    """Returns the row and its ancestors, outermost first, for
+    breadcrumbs. Rows are in META_COLUMNS order."""
+
+    return queries.execute(queries.SELECT_PATH, (obj_id,)).fetchall()
+
+
+def get_subtree_stats(obj_id):
+    """Returns (descendant count, total body bytes) for everything below
+    the row."""
+
+    return queries.execute(queries.SELECT_SUBTREE_STATS,
+                           (obj_id,)).fetchone()
+
+
+def dump():
+    """Streams every row for export, bodies included, without loading
+    them all at once.
+
+    Returns:
+        An iterator of rows in COLUMNS order plus each row's depth below
+        the top level, depth first so every row comes right after its
+        parent."""
+
+    return map(_decompressed, queries.execute(queries.SELECT_DUMP))
+
+
+def get_revisions(obj_id):
+    """Returns the note's saved versions, newest first.
+
+    Returns:
+        A list of (revision, last_modified, size) tuples."""
+
+    return queries.execute(queries.SELECT_REVISIONS, (obj_id,)).fetchall()
+
+
+def get_revision(obj_id, revision):
+    """Rebuilds the note's body as of the given revision, from the
+    snapshot before it and at most revisions.MAX_CHAIN deltas.
+
+    Returns:
+        The body, None if there is no such revision (or it was pruned)."""
+
+    body = None
+
+    for snapshot, data, codec in queries.execute(
+            queries.SELECT_REVISION_DELTAS, (obj_id, revision)):
+
+        data = compression.decompress(data, codec)
+        body = data if snapshot else revisions.patch(body, data)
+
+    return body
+
+
+def prune_revisions():
+    """Drops history past revisions.KEEP_AGE and revisions.KEEP_COUNT for
+    every note, a whole chain at a time. Saves prune their own note as
+    each chain ends, this catches notes no longer being edited.
+
+    Returns:
+        The number of revisions deleted."""
+
+    cutoff = now() - revisions.KEEP_AGE
+    note_ids = queries.execute(queries.SELECT_REVISED_NOTES).fetchall()
+
+    with queries.transaction():
+        # executemany's rowcount is summed over every run
+        return queries.executemany(queries.PRUNE_REVISIONS, (
+            (note_id, cutoff, revisions.KEEP_COUNT)
+            for note_id, in note_ids)).rowcount
+
+
+def _match_expression(query):
+    """Turns user input into an FTS5 query matching every word. A word
+    ending in * matches as a prefix, other FTS5 syntax is quoted."""
+
+    terms = []
+
+    for term in query.split():
+
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' +
+                         ("*" if prefix else ""))
+
+    return " ".join(terms)
+
+
+def search(query, limit=20, notebook_id=None, marks=("[", "]")):
+    """Full text search over note names and bodies.
+
+    Args:
+        query: The words to look for, word* matches a prefix.
+        limit: The most results to return.
+        notebook_id: Only search notes below this notebook, all if None.
+        marks: Strings placed before and after matches in the snippet.
+
+    Returns:
+        A list of (id, name, parent_id, snippet) tuples, best match
+        first."""
+
+    match = _match_expression(query)
+
+    if not match:
+        return []
+
+    if notebook_id is None:
+        return queries.execute(queries.SEARCH,
+                               (*marks, match, limit)).fetchall()
+
+    return queries.execute(queries.SEARCH_NOTEBOOK,
+                           (notebook_id, *marks, match, limit)).fetchall()
+
+
+def delete(obj_id):
+    """Delete note object and everything below it, in one statement. Its
+    body and search entry go with it by trigger"""
+
+    with queries.transaction():
+        queries.execute(queries.DELETE_TREE, (obj_id,))
+
+
+def compact(progress=None):
+    """Recompresses every body with the current compression settings,
+    cold notes with compression.COLD_CODEC. The search index keeps the
+    plain text, so it isn't touched.
+
+    Args:
+        progress: Called with the number of bodies checked so far, after
+            each batch.
+
+    Returns:
+        (bodies rewritten, stored body bytes before, bytes after). The
+        file only shrinks once vacuumed, freed pages are reused first."""
+
+    before = queries.execute(queries.SELECT_BODIES_SIZE).fetchone()[0]
+    cold = now() - compression.COLD_AGE
+    last_id = 0
+    checked = rewritten = 0
+
+    while True:
+
+        batch = queries.execute(queries.SELECT_BODIES_AFTER,
+                                (last_id, 1000)).fetchall()
+
+        if not batch:
+            break
+
+        changed = []
+
+        for obj_id, data, codec, modified in batch:
+
+            target = (compression.COLD_CODEC if modified < cold
+                      else compression.CODEC)
+
+            if codec is not None and codec in (target, chunks.CODEC):
+                continue  # Already stored as it would be, or in chunks
+
+            stored, new_codec = compression.compress(
+                compression.decompress(data, codec), target)
+
+            if new_codec != codec:
+                changed.append((stored, new_codec, obj_id))
+
+        with queries.transaction():
+            queries.executemany(queries.UPDATE_BODY, changed)
+
+        last_id = batch[-1][0]
+        checked += len(batch)
+        rewritten += len(changed)
+
+        if progress is not None:
+            progress(checked)
+
+    after = queries.execute(queries.SELECT_BODIES_SIZE).fetchone()[0]
+
+    return rewritten, before, after
+
+
+def remove_orphans():
+    """Deletes rows left behind by the old one level delete, whose parent
+    no longer exists, along with their descendants and any stray bodies,
+    chunks and revisions.
+
+    Returns:
+        The number of rows deleted."""
+
+    with queries.transaction():
+        queries.execute(queries.DELETE_ORPHANS)
+        removed = queries.execute(queries.CHANGES).fetchone()[0]
+        queries.execute(queries.DELETE_ORPHAN_BODIES)
+        queries.execute(queries.DELETE_ORPHAN_CHUNKS)
+        queries.execute(queries.DELETE_ORPHAN_REVISIONS)
+
+    return removed
+
+
+def _storage_stats():
+    """Returns the database's size, its pages and how many are free"""
+
+    page_size, pages, free_pages = queries.execute(
+        queries.SELECT_PAGE_STATS).fetchone()
+    path = connection_manager.DB_PATH
+    # The write-ahead log holds pages not yet copied into the file
+    file_bytes = sum(os.path.getsize(name)
+                     for name in (path, path + "-wal")
+                     if os.path.exists(name))
+
+    return {"page_size": page_size, "pages": pages,
+            "free_pages": free_pages, "bytes": pages * page_size,
+            "file_bytes": file_bytes}
+
+
+def maintain(vacuum_pages=1000):
+    """Checks the database and tidies it up, one step at a time.
+
+    The steps are integrity_check, remove_orphans(), ANALYZE, then
+    incremental_vacuum vacuum_pages at a time until no page is free, and
+    a checkpoint that truncates the write-ahead log. If the check finds
+    problems nothing is written. A database made before auto_vacuum was
+    turned on is converted by a full VACUUM first, once. Don't run it
+    inside transaction(), VACUUM can't be.
+
+    Yields:
+        (step, report) after each step, "done" last. report is one dict
+        filled in as the steps run, with "before" and "after" sizes
+        (see _storage_stats()), the "integrity" check's messages and
+        the number of "orphans" removed."""
+
+    conn = connection_manager.get_connection()
+    report = {"before": _storage_stats(), "after": None, "integrity": None,
+              "orphans": 0}
+
+    report["integrity"] = [row[0] for row in
+                           conn.execute(queries.INTEGRITY_CHECK)]
+    yield "integrity_check", report
+
+    if report["integrity"] == ["ok"]:
+        report["orphans"] = remove_orphans()
+        yield "remove_orphans", report
+
+        conn.execute(queries.ANALYZE)
+        yield "analyze", report
+
+        if conn.execute(queries.SELECT_AUTO_VACUUM).fetchone()[0] != 2:
+            conn.execute(queries.SET_AUTO_VACUUM)
+            conn.execute(queries.VACUUM)
+            yield "vacuum", report
+
+        # A batch at a time so the write lock is let go of in between
+        free_pages = _storage_stats()["free_pages"]
+
+        while free_pages:
+            conn.executescript(
+                queries.INCREMENTAL_VACUUM.format(pages=int(vacuum_pages)))
+            left = _storage_stats()["free_pages"]
+
+            if left >= free_pages:  # Nothing more can be freed
+                break
+
+            free_pages = left
+            yield "incremental_vacuum", report
+
+        conn.execute(queries.CHECKPOINT)
+        yield "checkpoint", report
+
+    report["after"] = _storage_stats()
+    yield "done", report
+
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""Syncs notes with another replica, moving only what changed.
+
+Usage:
+
+    python3 Note/sync.py REMOTE [--db PATH]
+
+REMOTE is either another database (a path ending in .db, created if
+missing), synced with directly, or a directory shared between machines,
+such as a network drive or a synced folder. Each replica writes its
+changes since its last sync there as a batch file, and reads the batches
+the other replicas wrote.
+
+Every note has a uid shared by all replicas and a version counter, bumped
+on each change (see the v8 migration). note_oplog lists what changed after
+a given point, so a sync only looks at those notes, and two databases
+first swap just their versions so only the notes the other side lacks
+cross over. When both sides changed a note, the later last_modified wins,
+then the higher version, then the higher replica id, so every replica
+picks the same one. A deletion is a change like any other.
+
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+
+import connection_manager
+import migrations
+import query_manager as queries
+from note_manager import body_size
+from sqlite_backend import load_body, store_body
+
+# Size of a change's sync state as sent between databases, uid and
+# (version, modified, origin), for counting the bytes a sync moves
+DIGEST_BYTES = 16 + 3 * 8
+
+
+def replica_id(conn):
+    """Returns the id this database goes by when syncing"""
+
+    return conn.execute(queries.SELECT_REPLICA).fetchone()[0]
+
+
+def _peer(conn, peer):
+    """Returns how far peer is synced, (sent, received) seqs"""
+
+    return conn.execute(queries.SELECT_PEER, (peer,)).fetchone() or (0, 0)
+
+
+def _set_peer(conn, peer, sent=None, received=None):
+    """Moves peer's sync markers, None leaves one as it is"""
+
+    conn.execute(queries.UPSERT_PEER, (peer, sent, received))
+
+
+def _max_seq(conn):
+    return conn.execute(queries.SELECT_MAX_SEQ).fetchone()[0]
+
+
+def changes(conn, since):
+    """Returns the notes changed after seq since.
+
+    Returns:
+        A dict of uid -> (version, modified, origin, local id), the id is
+        None for deleted notes, in the order they were last changed."""
+
+    return {uid: state for _, uid, *state
+            in conn.execute(queries.SELECT_OPLOG_AFTER, (since,))}
+
+
+def _state(conn, uid):
+    return conn.execute(queries.SELECT_SYNC_STATE, (uid,)).fetchone()
+
+
+def _wins(state, other):
+    """True if sync state beats other, a note the other side never had
+    always loses"""
+
+    if other is None:
+        return True
+
+    version, modified, origin = state[:3]
+
+    return (modified, version, origin) > (other[1], other[0], other[2])
+
+
+def read_change(conn, uid, state):
+    """Returns a note's change as a JSON serializable dict, with the note's
+    contents unless it was deleted"""
+
+    version, modified, origin, obj_id = state
+    change = {"uid": uid, "version": version, "modified": modified,
+              "origin": origin}
+
+    if obj_id is None:
+        change["deleted"] = True
+        return change
+
+    name, parent_id, notebook, data, codec = conn.execute(
+        queries.SELECT_SYNCED_OBJ, (obj_id,)).fetchone()
+
+    data = load_body(obj_id, data, codec, conn)
+
+    # Parents by uid, 0 (top level) and None (the root) are the same for all
+    if parent_id:
+        parent = conn.execute(queries.SELECT_UID, (parent_id,)).fetchone()
+        parent_id = {"uid": parent[0]} if parent else 0
+
+    if isinstance(data, bytes):  # Bodies from the oldest databases
+        change["base64"] = True
+        data = base64.b64encode(data).decode()
+
+    change.update(name=name, parent=parent_id, notebook=bool(notebook),
+                  data=data)
+
+    return change
+
+
+def _parent_id(conn, parent):
+    """Returns the local id of a change's parent, False if it isn't here"""
+
+    if not isinstance(parent, dict):
+        return parent
+
+    row = conn.execute(queries.SELECT_SYNC_STATE, (parent["uid"],)).fetchone()
+
+    if row is None or row[3] is None:
+        return False
+
+    return row[3]
+
+
+def _apply_put(conn, change, state, parent_id):
+    data = change["data"]
+
+    if change.get("base64"):
+        data = base64.b64decode(data)
+
+    size = body_size(data)
+    name = change["name"]
+
+    if state is not None and state[3] is not None:
+        obj_id = state[3]
+        conn.execute(queries.UPDATE_SYNCED_OBJ,
+                     (name, parent_id, change["notebook"], size,
+                      change["modified"], obj_id))
+        stored, codec = store_body(obj_id, data, conn=conn)
+        conn.execute(queries.UPDATE_BODY, (stored, codec, obj_id))
+
+        if codec is not None:  # The search trigger only indexes plain text
+            conn.execute(queries.UPDATE_SEARCH, (data, obj_id))
+
+    else:
+        # The write lock is held, so the id past the current max is free
+        obj_id = conn.execute(queries.SELECT_MAX_ID).fetchone()[0] + 1
+        conn.execute(queries.UPSERT_SYNC_ID, (change["uid"], obj_id))
+        conn.execute(queries.INSERT_OBJ,
+                     (obj_id, name, change["modified"], parent_id, size,
+                      change["notebook"]))
+        stored, codec = store_body(obj_id, data, new=True, conn=conn)
+        conn.execute(queries.INSERT_BODY, (obj_id, stored, codec))
+
+        if codec is not None:
+            conn.execute(queries.INSERT_SEARCH, (obj_id, name, data))
+
+
+def _apply_delete(conn, change, state):
+
+    if state is None:  # Never seen here, remember it was deleted
+        conn.execute(queries.INSERT_TOMBSTONE,
+                     (change["uid"], change["version"], change["modified"],
+                      change["origin"]))
+        conn.execute(queries.INSERT_OPLOG, (change["uid"], "delete"))
+
+    elif state[3] is not None:
+        # Everything below goes too, like note_manager.delete(), notes
+        # added to it here included, whose deletions the triggers log
+        conn.execute(queries.DELETE_TREE, (state[3],))
+
+
+def apply(conn, changes):
+    """Applies the changes that win over this database's own versions,
+    inside the caller's transaction.
+
+    Notes whose parent hasn't arrived yet wait until the rest are applied,
+    any left after that (their parent was deleted here) are skipped. The
+    deletion reaches the other side too, which deletes them with it.
+
+    Args:
+        changes: Iterable of dicts from read_change().
+
+    Returns:
+        (changes applied, changes that lost to this database's versions,
+        changes skipped for want of their parent)."""
+
+    applied = lost = 0
+
+    def apply_one(change):
+        """Returns "applied", "lost" or "waiting" """
+
+        state = _state(conn, change["uid"])
+
+        if not _wins((change["version"], change["modified"],
+                      change["origin"]), state):
+            return "lost"
+
+        if change.get("deleted"):
+            _apply_delete(conn, change, state)
+
+        else:
+            parent_id = _parent_id(conn, change["parent"])
+
+            if parent_id is False:
+                return "waiting"
+
+            _apply_put(conn, change, state, parent_id)
+
+        # The triggers bumped the local version, take on the remote one
+        conn.execute(queries.SET_SYNC_STATE,
+                     (change["version"], change["modified"], change["origin"],
+                      change["uid"]))
+
+        return "applied"
+
+    def count(changes):
+        """Applies changes, returning those still waiting"""
+
+        nonlocal applied, lost
+        left = []
+
+        for change in changes:
+            result = apply_one(change)
+
+            if result == "applied":
+                applied += 1
+            elif result == "lost":
+                lost += 1
+            else:
+                left.append(change)
+
+        return left
+
+    waiting = count(changes)
+
+    while waiting:
+        left = count(waiting)
+
+        if len(left) == len(waiting):
+            break
+
+        waiting = left
+
+    return applied, lost, len(waiting)
+
+
+def _size(change):
+    return len(json.dumps(change, ensure_ascii=False).encode())
+
+
+def sync_database(conn, remote):
+    """Syncs two databases both ways in one transaction on each.
+
+    Each side lists its versions of the notes changed since the last sync
+    between the two, and only the winning changes are read and applied.
+
+    Returns:
+        (changes sent, changes received, bytes moved)"""
+
+    if replica_id(conn) == replica_id(remote):
+        # A copy of this database made by hand, it needs its own id
+        remote.execute(queries.RENAME_REPLICA)
+        remote.commit()
+
+    me, them = replica_id(conn), replica_id(remote)
+
+    with conn, remote:
+        conn.execute("BEGIN IMMEDIATE")
+        remote.execute("BEGIN IMMEDIATE")
+
+        ours = changes(conn, _peer(conn, them)[0])
+        theirs = changes(remote, _peer(remote, me)[0])
+        moved = (len(ours) + len(theirs)) * DIGEST_BYTES
+
+        outgoing = [read_change(conn, uid, state)
+                    for uid, state in ours.items()
+                    if _wins(state, theirs.get(uid) or _state(remote, uid))]
+        incoming = [read_change(remote, uid, state)
+                    for uid, state in theirs.items()
+                    if _wins(state, ours.get(uid) or _state(conn, uid))]
+        moved += sum(map(_size, outgoing)) + sum(map(_size, incoming))
+
+        sent = apply(remote, outgoing)[0]
+        received = apply(conn, incoming)[0]
+
+        # What was just applied is in each oplog too, and not sent back
+        _set_peer(conn, them, sent=_max_seq(conn))
+        _set_peer(remote, me, sent=_max_seq(remote))
+
+    return sent, received, moved
+
+
+def _batches(directory, me):
+    """Yields (replica, seq, path) for the batch files other replicas
+    wrote to a sync directory, oldest first"""
+
+    for file_name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(file_name)
+
+        if ext != ".jsonl" or "-" not in stem:
+            continue
+
+        replica, seq = stem.rsplit("-", 1)
+
+        if replica != me and seq.isdigit():
+            yield replica, int(seq), os.path.join(directory, file_name)
+
+
+def sync_directory(conn, directory):
+    """Syncs with a shared directory in one transaction, writing this
+    database's changes since its last sync as a batch file and applying
+    the batches other replicas wrote since.
+
+    Returns:
+        (changes sent, changes received, bytes moved)"""
+
+    os.makedirs(directory, exist_ok=True)
+    id_path = os.path.join(directory, "id")
+
+    if not os.path.exists(id_path):
+        with open(id_path, "w") as id_file:
+            id_file.write(os.urandom(8).hex())
+
+    with open(id_path) as id_file:
+        directory_id = id_file.read().strip()
+
+    me = replica_id(conn)
+    sent = received = moved = 0
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+
+        since = _peer(conn, directory_id)[0]
+        ours = changes(conn, since)
+
+        if ours:
+            path = os.path.join(directory, f"{me}-{_max_seq(conn):012d}.jsonl")
+
+            # Written aside and renamed, so readers never see half a batch
+            with open(path + ".tmp", "w", encoding="utf-8") as out:
+
+                for uid, state in ours.items():
+                    line = json.dumps(read_change(conn, uid, state),
+                                      ensure_ascii=False) + "\n"
+                    out.write(line)
+                    moved += len(line.encode())
+
+            os.replace(path + ".tmp", path)
+            sent = len(ours)
+
+        for replica, seq, path in _batches(directory, me):
+
+            if seq <= _peer(conn, replica)[1]:
+                continue
+
+            with open(path, encoding="utf-8") as lines:
+                received += apply(
+                    conn, (json.loads(line) for line in lines))[0]
+
+            moved += os.path.getsize(path)
+            _set_peer(conn, replica, received=seq)
+
+        _set_peer(conn, directory_id, sent=_max_seq(conn))
+
+    return sent, received, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("remote",
+                        help="another database (.db) or a shared directory")
+    parser.add_argument("--db",
+                        help="the database, defaults to $NOTE_DB or notes.db")
+    args = parser.parse_args()
+
+    connection_manager.configure(path=args.db)
+
+    import note_manager
+
+    note_manager.init_db()
+    conn = connection_manager.get_connection()
+
+    try:
+        if args.remote.endswith(".db"):
+            remote = connection_manager.open_connection(args.remote)
+            migrations.migrate(remote)
+            sent, received, moved = sync_database(conn, remote)
+
+        else:
+            sent, received, moved = sync_directory(conn, args.remote)
+
+        print(f"sent {sent:,} changes, received {received:,}, "
+              f"{moved / 1024:,.1f} KB moved", file=sys.stderr)
+
+    finally:
+        connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
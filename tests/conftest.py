@@ -0,0 +1,26 @@
+"""Shared fixtures. The app's modules are flat files in the repository
+root, imported by name like the app does."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import note_manager  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def store(request, tmp_path):
+    """note_manager on a new store of each backend, closed afterwards"""
+
+    location = tmp_path / ("notes.db" if request.param == "sqlite"
+                           else "notes")
+    note_manager.configure(request.param, str(location))
+    note_manager.init_db()
+
+    yield note_manager
+
+    note_manager.close_all()
@@ -0,0 +1,22 @@
+"""Database locations"""
+
+import note_manager
+
+
+def test_memory_databases_are_separate():
+    note_manager.configure("sqlite", ":memory:")
+    note_manager.init_db()
+
+    try:
+        note_id = note_manager.new_obj("sqlite :memory:", "body", 1)
+        note_manager.configure("memory")
+        note_manager.init_db()
+
+        assert note_manager.get_row(note_id) is None
+
+        note_manager.configure("sqlite", ":memory:")
+
+        assert note_manager.get_row(note_id)[1] == "sqlite :memory:"
+
+    finally:
+        note_manager.close_all()
@@ -0,0 +1,32 @@
+"""The one file per note backend"""
+
+import note_manager
+
+
+def test_damaged_files_are_reported_not_raised(tmp_path):
+    directory = tmp_path / "notes"
+    note_manager.configure("files", str(directory))
+    note_manager.init_db()
+    note_id = note_manager.new_obj("kept", "body", 1)
+    note_manager.close()
+
+    (directory / "stray.note").write_text("not a note")
+    (directory / "40.note").write_text("{not json\nbody")
+
+    try:
+        note_manager.init_db()
+
+        assert note_manager.get_row(note_id)[1] == "kept"
+        # Past the damaged file's id, which stays as it is
+        assert note_manager.new_obj("new", "body", 1) == 41
+
+        *_, (step, report) = note_manager.maintain()
+        assert step == "done"
+        assert sorted(report["integrity"]) == [
+            f"{directory / '40.note'}: Expecting property name enclosed in "
+            f"double quotes: line 1 column 2 (char 1)",
+            f"{directory / 'stray.note'}: not named after a note id"]
+        assert (directory / "40.note").exists()
+
+    finally:
+        note_manager.close_all()
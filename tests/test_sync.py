@@ -0,0 +1,54 @@
+"""Syncing two databases"""
+
+import pytest
+
+import connection_manager
+import migrations
+import sync
+
+
+def open_replica(path):
+    conn = connection_manager.open_connection(str(path))
+    migrations.migrate(conn)
+    return conn
+
+
+def names(conn):
+    return sorted(name for name, in conn.execute(
+        "SELECT name FROM note_objs"))
+
+
+def add(conn, name, parent_id, notebook=False):
+    with conn:
+        return conn.execute(
+            "INSERT INTO note_objs(name, last_modified, parent_id, size, "
+            "is_notebook) VALUES (?, 1, ?, 0, ?)",
+            (name, parent_id, int(notebook))).lastrowid
+
+
+def local_id(conn, name):
+    return conn.execute("SELECT id FROM note_objs WHERE name = ?",
+                        (name,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("deleting_side_syncs", [True, False])
+def test_note_added_to_a_notebook_deleted_elsewhere(tmp_path,
+                                                    deleting_side_syncs):
+    a, b = open_replica(tmp_path / "a.db"), open_replica(tmp_path / "b.db")
+    add(a, "Work", 0, notebook=True)
+    sync.sync_database(a, b)
+
+    with a:
+        a.execute("DELETE FROM note_objs WHERE id = ?",
+                  (local_id(a, "Work"),))
+    add(b, "Todo", local_id(b, "Work"))
+
+    first, second = (a, b) if deleting_side_syncs else (b, a)
+    sync.sync_database(first, second)
+    sync.sync_database(first, second)
+
+    # Deleting the notebook takes the note added to it along on both sides
+    assert names(a) == names(b) == ["My Notes"]
+
+    for conn in (a, b):
+        conn.close()
@@ -0,0 +1,30 @@
+"""Exports and imports"""
+
+import os
+
+import transfer
+
+from test_trees import make_tree
+
+
+def test_export_markdown_nests_notebooks(store, tmp_path):
+    make_tree(store)
+    directory = tmp_path / "md"
+
+    assert transfer.export_markdown(str(directory)) == 6
+
+    written = sorted(os.path.relpath(os.path.join(parent, name), directory)
+                     for parent, _, files in os.walk(directory)
+                     for name in files)
+    assert written == [os.path.join("A", "A1", "A11.md"),
+                       os.path.join("A", "A1", "A12.md"),
+                       os.path.join("A", "A2", "A21.md")]
+    assert (directory / "A" / "A1" / "A11.md").read_text() == "eleven"
+
+
+def test_dump_is_depth_first(store):
+    make_tree(store)
+
+    assert [(row[1], row[7]) for row in store.dump()] == [
+        ("My Notes", 0), ("A", 0), ("A1", 1), ("A11", 2), ("A12", 2),
+        ("A2", 1), ("A21", 2)]
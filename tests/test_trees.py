@@ -0,0 +1,23 @@
+"""get_subtree() and dump() order, which the exports rely on"""
+
+
+def make_tree(notes):
+    """Adds A/{A1/{A11, A12}, A2/{A21}} at the top level, returning A"""
+
+    a = notes.new_obj("A", None, 0, notebook=True)
+    a1 = notes.new_obj("A1", None, a, notebook=True)
+    a2 = notes.new_obj("A2", None, a, notebook=True)
+    notes.new_obj("A11", "eleven", a1)
+    notes.new_obj("A12", "twelve", a1)
+    notes.new_obj("A21", "twenty one", a2)
+    # Written last, the files backend's index lists it after A2
+    notes.update_obj(a1, name="A1")
+
+    return a
+
+
+def test_subtree_is_depth_first(store):
+    a = make_tree(store)
+
+    assert [(row[1], row[-1]) for row in store.get_subtree(a)] == [
+        ("A", 0), ("A1", 1), ("A11", 2), ("A12", 2), ("A2", 1), ("A21", 2)]
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Bulk export and import of notes, streamed so memory use stays flat.
+
+Usage:
+
+    python3 Note/transfer.py export TARGET [--db PATH]
+    python3 Note/transfer.py import SOURCE [--db PATH]
+
+A TARGET or SOURCE ending in .jsonl (or - for stdout/stdin) is JSON Lines,
+one note object per line, a full backup. Anything else is a Markdown
+directory: a folder per notebook and a NAME.md file per note, with names
+percent-encoded where the filesystem needs it, "NAME (2).md" for a
+repeated name, and modification times kept as file times. The Markdown
+tree holds what the app shows, the top level notebooks and everything
+below them.
+
+Imported notes are added next to the existing ones, with new ids.
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from urllib.parse import quote, unquote
+
+import connection_manager
+
+# Characters left as they are in file names, the rest are percent-encoded
+SAFE_CHARS = " !#$&'()+,;=@[]^`{}"
+NOTE_SUFFIX = ".md"
+
+
+class Progress:
+    """Prints a running count of notes to stderr"""
+
+    def __init__(self, verb):
+        self.verb = verb
+        self.start = time.perf_counter()
+
+    def __call__(self, count):
+        elapsed = time.perf_counter() - self.start
+        print(f"\r{self.verb} {count:,} notes "
+              f"({count / max(elapsed, 1e-9):,.0f}/sec)",
+              end="", file=sys.stderr)
+
+    def done(self, count):
+        self(count)
+        print(file=sys.stderr)
+
+
+def _is_jsonl(path):
+    """Returns True if path names JSON Lines, False for a Markdown dir"""
+
+    return path == "-" or path.endswith(".jsonl")
+
+
+def _text(data):
+    """Returns a body as text, bodies from the oldest databases are bytes"""
+
+    if isinstance(data, bytes):
+        return data.decode(errors="replace")
+
+    return data
+
+
+def _file_name(name):
+    """Encodes a note name into a file name, decoded by _note_name()"""
+
+    name = quote(name, safe=SAFE_CHARS)
+
+    if name.startswith("."):  # Hidden, or . and ..
+        name = "%2E" + name[1:]
+
+    return name or "%00"
+
+
+def _note_name(file_name):
+    """Decodes a file name made by _file_name()"""
+
+    return "" if file_name == "%00" else unquote(file_name)
+
+
+def _unique(path, suffix=""):
+    """Returns path + suffix, numbered if that is already taken"""
+
+    candidate = path + suffix
+    number = 2
+
+    while os.path.lexists(candidate):
+        candidate = f"{path} ({number}){suffix}"
+        number += 1
+
+    return candidate
+
+
+def _set_time(path, modified):
+    """Sets a notebook directory's modification time, once it's written.
+    Stack entries of notes and skipped rows have no time to set."""
+
+    if modified is not None:
+        os.utime(path, (modified, modified))
+
+
+def export_jsonl(out, progress=None):
+    """Writes every note object to out, one JSON object per line.
+
+    Returns:
+        The number of objects written."""
+
+    import note_manager
+
+    count = 0
+
+    for (obj_id, name, modified, data, parent_id, _, notebook,
+         _) in note_manager.dump():
+
+        out.write(json.dumps({"id": obj_id,
+                              "name": name,
+                              "last_modified": modified,
+                              "parent_id": parent_id,
+                              "is_notebook": bool(notebook),
+                              "data": _text(data)}) + "\n")
+        count += 1
+
+        if progress is not None and not count % 1000:
+            progress(count)
+
+    return count
+
+
+def read_jsonl(lines):
+    """Yields note_manager.restore() rows from JSON Lines"""
+
+    for line in lines:
+
+        if line.strip():
+            obj = json.loads(line)
+            yield (obj["id"], obj["name"], obj["last_modified"], obj["data"],
+                   obj["parent_id"], obj["is_notebook"])
+
+
+def export_markdown(directory, progress=None):
+    """Writes the top level notebooks and everything below them as a
+    directory tree, one file per note.
+
+    Returns:
+        The number of notes and notebooks written."""
+
+    import note_manager
+
+    os.makedirs(directory, exist_ok=True)
+
+    # Directories of the rows above the current one, with their times
+    # (set last, adding files changes them)
+    stack = [(directory, None)]
+    count = 0
+
+    for (_, name, modified, data, parent_id, _, notebook,
+         depth) in note_manager.dump():
+
+        while len(stack) > depth + 1:
+            _set_time(*stack.pop())
+
+        if depth == 0 and parent_id is None:
+            # The root isn't shown in the app, skip it and its subtree
+            stack.append((None, None))
+            continue
+
+        parent_dir = stack[-1][0]
+
+        if parent_dir is None:
+            stack.append((None, None))
+            continue
+
+        if notebook:
+            path = _unique(os.path.join(parent_dir, _file_name(name)))
+            os.mkdir(path)
+            stack.append((path, modified))
+
+        else:
+            path = _unique(os.path.join(parent_dir, _file_name(name)),
+                           NOTE_SUFFIX)
+
+            with open(path, "w", encoding="utf-8", newline="") as note_file:
+                note_file.write(_text(data) or "")
+
+            os.utime(path, (modified, modified))
+            # Notes don't have children, this is only popped again
+            stack.append((parent_dir, None))
+
+        count += 1
+
+        if progress is not None and not count % 1000:
+            progress(count)
+
+    while len(stack) > 1:
+        _set_time(*stack.pop())
+
+    return count
+
+
+def read_markdown(directory):
+    """Yields note_manager.restore() rows from a Markdown directory,
+    numbering the rows in the order they are found"""
+
+    ids = {directory: 0}  # Directory -> its row id, 0 is the top level
+    next_id = 1
+
+    for dir_path, dir_names, file_names in os.walk(directory):
+
+        dir_names.sort()
+        parent_id = ids.pop(dir_path)
+
+        for dir_name in dir_names:
+            path = os.path.join(dir_path, dir_name)
+            ids[path] = next_id
+            yield (next_id, _note_name(dir_name), int(os.path.getmtime(path)),
+                   "Notebook", parent_id, True)
+            next_id += 1
+
+        for file_name in sorted(file_names):
+
+            if not file_name.endswith(NOTE_SUFFIX):
+                continue
+
+            path = os.path.join(dir_path, file_name)
+
+            with open(path, encoding="utf-8", newline="") as note_file:
+                data = note_file.read()
+
+            yield (next_id, _note_name(file_name[:-len(NOTE_SUFFIX)]),
+                   int(os.path.getmtime(path)), data, parent_id, False)
+            next_id += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path",
+                        help="a .jsonl file, - for stdin/stdout, or a "
+                             "Markdown directory")
+    parser.add_argument("--db",
+                        help="the database, defaults to $NOTE_DB or notes.db")
+    args = parser.parse_args()
+
+    connection_manager.configure(path=args.db)
+
+    import note_manager
+
+    note_manager.init_db()
+
+    progress = Progress("exported" if args.command == "export"
+                        else "imported")
+
+    try:
+        if args.command == "export" and args.path == "-":
+            count = export_jsonl(sys.stdout, progress)
+
+        elif args.command == "export" and _is_jsonl(args.path):
+            with open(args.path, "w", encoding="utf-8") as out:
+                count = export_jsonl(out, progress)
+
+        elif args.command == "export":
+            count = export_markdown(args.path, progress)
+
+        elif args.path == "-":
+            count = note_manager.restore(read_jsonl(sys.stdin), progress)
+
+        elif _is_jsonl(args.path):
+            with open(args.path, encoding="utf-8") as lines:
+                count = note_manager.restore(read_jsonl(lines), progress)
+
+        else:
+            count = note_manager.restore(read_markdown(args.path), progress)
+
+        progress.done(count)
+
+    finally:
+        connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()